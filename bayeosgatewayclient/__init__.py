@@ -1,3 +1,6 @@
 """bayeosgatewayclient"""
 from . bayeosgatewayclient import *
-from . bayeosframe import *
\ No newline at end of file
+from . bayeosframe import *
+from . queuefile import *
+from . asyncclient import *
+from . metrics import *
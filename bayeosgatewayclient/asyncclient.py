@@ -0,0 +1,303 @@
+"""asyncio counterparts of BayEOSWriter and BayEOSSender.
+
+Both classes use the same queue directory format as their synchronous
+counterparts. Disk I/O runs in an executor, HTTP requests go through a
+non-blocking transport, so one event loop can drive many devices.
+"""
+
+import ssl
+import base64
+import asyncio
+import logging
+from abc import abstractmethod
+from functools import partial
+from urllib.parse import urlsplit
+
+from . bayeosgatewayclient import BayEOSWriter, BayEOSSender, DEFAULTS
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTransport(object):
+    """Interface of the HTTP transport used by AsyncBayEOSSender."""
+
+    @abstractmethod
+    async def post(self, url, body, headers, timeout):
+        """Posts a request body. Must be overwritten by implementation.
+        @param url: gateway url
+        @param body: request body as bytes
+        @param headers: dictionary of request headers
+        @param timeout: timeout in seconds
+        @return HTTP status code
+        @raise OSError or asyncio.TimeoutError on connection errors
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Closes all open connections."""
+        return
+
+
+class StreamTransport(AsyncTransport):
+    """Minimal HTTP/1.1 client on asyncio streams with keep-alive connections."""
+
+    def __init__(self, ssl_context=None, max_idle=4):
+        """Creates a StreamTransport.
+        @param ssl_context: ssl.SSLContext for https urls, default context if None
+        @param max_idle: maximum number of idle connections kept per host
+        """
+        self.ssl_context = ssl_context
+        self.max_idle = max_idle
+        self.__idle = {}
+
+    async def post(self, url, body, headers, timeout):
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        port = parts.port or (443 if https else 80)
+        key = (parts.scheme, parts.hostname, port)
+        target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        head = ['POST %s HTTP/1.1' % target, 'Host: %s' % parts.netloc.rsplit('@', 1)[-1],
+                'Content-Length: %d' % len(body), 'Connection: keep-alive']
+        head += ['%s: %s' % item for item in headers.items()]
+        request = ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+        for attempt in (0, 1):
+            reader, writer, reused = await self.__connect(key, timeout)
+            try:
+                writer.write(request)
+                await asyncio.wait_for(writer.drain(), timeout)
+                status, keep_alive = await asyncio.wait_for(self.__read_response(reader), timeout)
+            except (OSError, EOFError, ValueError):
+                writer.close()
+                if reused and attempt == 0:  # stale keep-alive connection, try a new one
+                    continue
+                raise
+            except asyncio.TimeoutError:
+                writer.close()
+                raise
+            idle = self.__idle.setdefault(key, [])
+            if keep_alive and len(idle) < self.max_idle:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+            return status
+
+    async def __connect(self, key, timeout):
+        """Returns an idle connection or opens a new one.
+        @return reader, writer and a flag whether the connection was reused
+        """
+        idle = self.__idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        context = None
+        if scheme == 'https':
+            context = self.ssl_context or ssl.create_default_context()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context), timeout)
+        return reader, writer, False
+
+    @staticmethod
+    async def __read_response(reader):
+        """Reads status line, headers and body of a response.
+        @return status code and a flag whether the connection can be kept open
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise EOFError('Connection closed by gateway')
+        version, status = status_line.split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if not size:
+                    break
+        elif 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        else:
+            await reader.read()
+            keep_alive = False
+        return int(status), keep_alive
+
+    async def close(self):
+        for idle in self.__idle.values():
+            for reader, writer in idle:
+                writer.close()
+        self.__idle = {}
+
+
+class AsyncBayEOSWriter(object):
+    """asyncio counterpart of BayEOSWriter.
+    Every call runs the corresponding BayEOSWriter method in an executor. Calls of
+    one writer are serialized, so records keep their order.
+    """
+
+    def __init__(self, path=DEFAULTS['path'], executor=None, **options):
+        """Creates an AsyncBayEOSWriter.
+        @param path: path of queue directory
+        @param executor: concurrent.futures executor for disk I/O, default executor of the loop if None
+        @param options: further keyword arguments of BayEOSWriter
+        """
+        self.writer = BayEOSWriter(path, **options)
+        self.executor = executor
+        self.__lock = None
+
+    async def __call(self, method, *args, **kwargs):
+        if self.__lock is None:
+            self.__lock = asyncio.Lock()
+        async with self.__lock:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, partial(method, *args, **kwargs))
+
+    async def save(self, *args, **kwargs):
+        """See BayEOSWriter.save()"""
+        return await self.__call(self.writer.save, *args, **kwargs)
+
+    async def save_many(self, *args, **kwargs):
+        """See BayEOSWriter.save_many()"""
+        return await self.__call(self.writer.save_many, *args, **kwargs)
+
+    async def save_msg(self, *args, **kwargs):
+        """See BayEOSWriter.save_msg()"""
+        return await self.__call(self.writer.save_msg, *args, **kwargs)
+
+    async def save_frame(self, *args, **kwargs):
+        """See BayEOSWriter.save_frame()"""
+        return await self.__call(self.writer.save_frame, *args, **kwargs)
+
+    async def flush(self):
+        """See BayEOSWriter.flush()"""
+        return await self.__call(self.writer.flush)
+
+    async def close(self):
+        """See BayEOSWriter.close()"""
+        return await self.__call(self.writer.close)
+
+
+class AsyncBayEOSSender(object):
+    """asyncio counterpart of BayEOSSender.
+    Queue files are read in an executor and posted through an AsyncTransport.
+    """
+
+    def __init__(self, path=DEFAULTS['path'],
+                 name=DEFAULTS['name'],
+                 url=DEFAULTS['url'],
+                 password=DEFAULTS['bayeosgateway_pw'],
+                 user=DEFAULTS['bayeosgateway_user'],
+                 absolute_time=DEFAULTS['absolute_time'],
+                 remove=DEFAULTS['remove'],
+                 backup_path=DEFAULTS['backup_path'],
+                 transport=None,
+                 executor=None,
+                 timeout=DEFAULTS['timeout'],
+                 max_post_frames=DEFAULTS['max_post_frames'],
+                 max_post_bytes=DEFAULTS['max_post_bytes'],
+                 compression=DEFAULTS['compression'],
+                 compression_level=DEFAULTS['compression_level'],
+                 compression_threshold=DEFAULTS['compression_threshold']):
+        """Creates an AsyncBayEOSSender, see BayEOSSender for the common parameters.
+        @param transport: AsyncTransport, a StreamTransport if None
+        @param executor: concurrent.futures executor for disk I/O, default executor of the loop if None
+        @param timeout: timeout of a request in seconds
+        """
+        self.sender = BayEOSSender(path, name, url, password, user, absolute_time, remove, backup_path,
+                                   max_post_frames=max_post_frames, max_post_bytes=max_post_bytes,
+                                   compression=compression, compression_level=compression_level,
+                                   compression_threshold=compression_threshold)
+        self.transport = transport or StreamTransport()
+        self.executor = executor
+        self.timeout = timeout
+        credentials = ('%s:%s' % (user, password)).encode('utf-8')
+        self.headers = dict(self.sender.headers)
+        self.headers['Authorization'] = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+    async def __run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(method, *args))
+
+    async def send(self):
+        """Keeps sending until all files are sent or an error occurs.
+        @return number of posted frames as an integer
+        """
+        count_frames = 0
+        for path in (self.sender.path, self.sender.backup_path):
+            if not path:
+                continue
+            try:
+                count_frames += await self.__send_files(path)
+            except Exception as err:
+                logger.warning('Send error on __send_files(%s): %s', path, err)
+        return count_frames
+
+    async def __send_files(self, path):
+        """Sends all files within one directory.
+        @param path: path in file system
+        @return number of frames in directory
+        """
+        files = await self.__run(self.sender._ready_files, path)
+        count_frames = 0
+        i = 0
+        while i < len(files):
+            batch = []
+            try:
+                batch, next_i = await self.__run(self.sender._next_batch, files, i)
+                if not batch:  # remaining files were empty
+                    i = next_i
+                    break
+                count = await self.__post_batch(batch)
+                if count:
+                    for file_name in batch:
+                        await self.__run(self.sender._commit_file, file_name)
+            except Exception as err:
+                logger.warning('Sender __send_file error on %s: %s', files[i], err)
+                count = 0
+            if count:
+                i = next_i
+                count_frames += count
+            else:
+                if batch:
+                    i = files.index(batch[0])
+                break
+        if self.sender.backup_path and path != self.sender.backup_path and i < len(files):
+            await self.__run(self.sender._move_to_backup, files[i:])
+        return count_frames
+
+    async def __post_batch(self, batch):
+        """Tries to send the frames of a batch of files to the gateway.
+        @param batch: list of queue files
+        @return number of successfully posted frames
+        """
+        body, headers, counts = await self.__run(self.sender._encode_body, batch)
+        headers.update(self.headers)
+        try:
+            status = await self.transport.post(self.sender.url, body, headers, self.timeout)
+        except (OSError, EOFError, ValueError, asyncio.TimeoutError) as err:
+            logger.warning('sender __post error:%s', err)
+            return 0
+        if status == 200:
+            self.sender._record_latency(counts)
+            return counts['frames']
+        logger.warning('sender __post error code:%s', status)
+        return 0
+
+    async def run(self, sleep_sec=DEFAULTS['sender_sleep_time']):
+        """Tries to send frames within a certain interval until cancelled.
+        @param sleep_sec: specifies the sleep time
+        """
+        try:
+            while True:
+                res = await self.send()
+                if res > 0:
+                    logger.info('Successfully sent %s frames.', res)
+                await asyncio.sleep(sleep_sec)
+        finally:
+            await self.transport.close()
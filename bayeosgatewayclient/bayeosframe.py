@@ -1,11 +1,17 @@
 """Implementation of BayEOS Frame Protocol Specification."""
 
-from struct import pack, unpack
+from struct import pack, unpack, Struct
+from binascii import b2a_base64
 from time import time
 from datetime import datetime
 from abc import abstractmethod
 import logging
 
+try:
+    import numpy
+except ImportError:  # numpy is an optional extra
+    numpy = None
+
 logger = logging.getLogger(__name__)
 
 REFERENCE_TIME_DIF = (datetime(2000, 1, 1) -
@@ -35,7 +41,7 @@ class BayEOSFrame(object):
         return
 
     @abstractmethod
-    def parse(self,res={}):
+    def parse(self,res=None):
         """Parses a binary coded BayEOS Frame into a Python dictionary."""
         return {}        
 
@@ -59,13 +65,17 @@ class BayEOSFrame(object):
             logger.error('Error in to_object method: %s',err)
 
     @staticmethod
-    def parse_frame(frame,res={},reset_res=True):
+    def parse_frame(frame,res=None,reset_res=True):
         """Parses a binary coded BayEOS Frame into a Python dictionary.
+        A new dictionary is filled by decode_frame(), with reset_res set to false the
+        given dictionary is updated by the parse methods of the frame classes.
         @param frame: binary coded String
+        @param res: dictionary with origin and timestamp of an enclosing frame
+        @param reset_res: if set to true res is ignored
         @return Python dictionary
         """ 
-        if(reset_res):
-            res={'origin':'','timestamp':time()}
+        if reset_res or res is None:
+            return decode_frame(frame)
 
         try:
             bayeos_frame = BayEOSFrame.to_object(frame)
@@ -167,6 +177,117 @@ class DataFrame(BayEOSFrame):
         res['type']=0x1
         return res
 
+    @staticmethod
+    def create_many(rows, value_type=0x41, offset=0):
+        """Creates many BayEOS Data Frames of the same layout.
+        With NumPy installed, 1-D and 2-D arrays are encoded vectorized for the
+        Offset Types 0x0, 0x20 and 0x40. Otherwise every row is created with create().
+        @param rows: 2-D array (one row per frame) or list of values as accepted by create()
+        @param value_type: defines Offset and Data Type
+        @param offset: defines Channel Offset
+        @return list of binary coded Data Frames
+        """
+        if numpy is not None and isinstance(rows, numpy.ndarray) and (0xf0 & value_type) != 0x60:
+            frames = DataFrame.create_array(rows, value_type, offset)
+            return [frame.tobytes() for frame in frames]
+        res = []
+        template = None
+        for values in rows:
+            if isinstance(values, (list, tuple)) and values and \
+               not isinstance(values[0], (list, tuple)):  # plain values - use a template
+                if template is None or template.length != len(values):
+                    template = FrameTemplate.get(len(values), value_type, offset)
+                res.append(template.pack(values))
+                continue
+            data_frame = BayEOSFrame.factory(0x1)
+            data_frame.create(values, value_type, offset)
+            res.append(data_frame.frame)
+        return res
+
+    @staticmethod
+    def create_array(rows, value_type=0x41, offset=0, prefix=b''):
+        """Encodes a NumPy array into BayEOS Data Frames (requires NumPy).
+        @param rows: 1-D array (one frame) or 2-D array (one row per frame)
+        @param value_type: defines Offset and Data Type, Offset Type 0x60 is not supported
+        @param offset: defines Channel Offset
+        @param prefix: binary coded header put in front of every frame e.g. of an Origin Frame
+        @return 2-D uint8 array, one frame per row
+        """
+        rows = numpy.atleast_2d(rows)
+        dtype = DataFrame.__array_dtype(value_type, rows.shape[1], len(prefix))
+        frames = numpy.empty(rows.shape[0], dtype=dtype)
+        header = prefix + pack('<BB', 0x1, value_type)
+        if (0xf0 & value_type) == 0x0:
+            header += pack('<B', offset)
+        frames['header'] = numpy.frombuffer(header, dtype=numpy.uint8)
+        if (0xf0 & value_type) == 0x40:
+            frames['channels']['index'] = numpy.arange(1, rows.shape[1] + 1) + offset
+            frames['channels']['value'] = rows
+        else:
+            frames['values'] = rows
+        return frames.view(numpy.uint8).reshape(rows.shape[0], dtype.itemsize)
+
+    @staticmethod
+    def parse_many(frames, length=None):
+        """Parses many binary coded BayEOS Data Frames of the same layout.
+        With NumPy installed, the frames are decoded vectorized for the Offset Types
+        0x0, 0x20 and 0x40. Otherwise every frame is parsed with parse_frame().
+        @param frames: list of binary coded Data Frames or one contiguous buffer of equally sized frames
+        @param length: frame length, only required for a contiguous buffer
+        @return 2-D array (NumPy) or list of value lists, one row per frame
+        """
+        if isinstance(frames, (list, tuple)):
+            if not frames:
+                return []
+            first = frames[0]
+        else:
+            first = frames
+        value_type = unpack('<B', first[1:2])[0]
+        if numpy is None or (0xf0 & value_type) == 0x60:
+            if not isinstance(frames, (list, tuple)):
+                logger.error('A contiguous buffer can only be parsed with NumPy.')
+                return []
+            return [list(BayEOSFrame.parse_frame(frame)['values'].values()) for frame in frames]
+        if isinstance(frames, (list, tuple)):
+            length = len(first)
+            buffer = b''.join(frames)
+            if len(buffer) != length * len(frames):
+                raise ValueError('Data Frames differ in length.')
+        elif length:
+            buffer = frames
+        else:
+            raise ValueError('Frame length of a contiguous buffer is required.')
+        val_length = DATA_TYPES[0x0f & value_type]['length']
+        if (0xf0 & value_type) == 0x40:
+            val_length += 1
+        header_length = 3 if (0xf0 & value_type) == 0x0 else 2
+        channels = (length - header_length) // val_length
+        dtype = DataFrame.__array_dtype(value_type, channels)
+        if dtype.itemsize != length:
+            raise ValueError('Frame length does not match Value Type.')
+        parsed = numpy.frombuffer(buffer, dtype=dtype)
+        if (parsed['header'] != parsed['header'][0]).any():
+            raise ValueError('Data Frames differ in layout.')
+        if (0xf0 & value_type) == 0x40:
+            return parsed['channels']['value']
+        return parsed['values']
+
+    @staticmethod
+    def __array_dtype(value_type, channels, prefix_length=0):
+        """Builds a NumPy structured dtype matching the binary layout of a Data Frame.
+        @param value_type: defines Offset and Data Type
+        @param channels: number of channels
+        @param prefix_length: length of a header put in front of the Data Frame
+        """
+        offset_type = 0xf0 & value_type
+        val_format = DATA_TYPES[0x0f & value_type]['format']
+        header_length = prefix_length + (3 if offset_type == 0x0 else 2)
+        if offset_type == 0x40:
+            return numpy.dtype([('header', numpy.uint8, (header_length,)),
+                                ('channels', [('index', numpy.uint8), ('value', val_format)], (channels,))])
+        return numpy.dtype([('header', numpy.uint8, (header_length,)),
+                            ('values', val_format, (channels,))])
+
 class CommandFrame(BayEOSFrame):
     """Command and Command Response Frame Factory class."""
     def create(self, cmd_type, cmd):
@@ -176,10 +297,12 @@ class CommandFrame(BayEOSFrame):
         """
         self.frame += pack('<B', cmd_type) + cmd
 
-    def parse(self,res={}):
+    def parse(self,res=None):
         """Parses a binary coded Command Frame into a Python dictionary.
         @return command type and instruction
         """
+        if res is None:
+            res = {}
         res['cmd_type']=unpack('<B', self.frame[1:2])[0]
         res['cmd']=self.frame[2:]
         res['type']=unpack('<B', self.frame[0:1])[0]
@@ -394,6 +517,185 @@ class ChecksumFrame(BayEOSFrame):
         res['validChecksum']=(checksum==0xffff)
         return BayEOSFrame.parse_frame(self.frame[1:-2],res,False)
 
+class FrameTemplate(object):
+    """Precompiled layout of a BayEOS Data Frame.
+    Value Type, Channel Offset, channel indices and labels are compiled once into
+    a struct.Struct, so every frame of the same layout is created with a single pack.
+    """
+
+    __cache = {}
+
+    @staticmethod
+    def get(channels, value_type=None, offset=0):
+        """Returns a cached FrameTemplate for the given layout.
+        @param channels: see FrameTemplate()
+        @param value_type: defines Offset and Data Type
+        @param offset: defines Channel Offset
+        @return FrameTemplate object
+        """
+        if not isinstance(channels, int):
+            channels = tuple(channels)
+        key = (channels, value_type, offset)
+        try:
+            return FrameTemplate.__cache[key]
+        except KeyError:
+            template = FrameTemplate(channels, value_type, offset)
+            FrameTemplate.__cache[key] = template
+            return template
+
+    def __init__(self, channels, value_type=None, offset=0):
+        """Compiles a Data Frame layout.
+        @param channels: number of channels (1..n), list of channel numbers or list of labels
+        @param value_type: defines Offset and Data Type, derived from channels if None
+        @param offset: defines Channel Offset
+        """
+        if isinstance(channels, int):
+            channels = range(1, channels + 1)
+        self.channels = list(channels)
+        self.length = len(self.channels)
+        if value_type is None:
+            value_type = 0x41
+            for key in self.channels:
+                if isinstance(key, str):
+                    value_type = 0x61
+                    break
+        self.value_type = int(value_type)
+        self.offset = offset
+        offset_type = 0xf0 & self.value_type
+        val_format = DATA_TYPES[0x0f & self.value_type]['format'][1:]
+
+        fmt = '<BB'
+        args = [0x1, self.value_type]
+        if offset_type == 0x0:
+            fmt += 'B'
+            args.append(offset)
+        self.__start = len(args)
+        self.__step = 1
+        for key in self.channels:
+            if offset_type == 0x40:
+                fmt += 'B'
+                args.append(int(key + offset))
+            elif offset_type == 0x60:
+                label = str(key).encode('utf-8')
+                fmt += 'B%ds' % len(label)
+                args += [len(label), label]
+            fmt += val_format
+            args.append(0)
+        if offset_type == 0x40:
+            self.__start += 1
+            self.__step = 2
+        elif offset_type == 0x60:
+            self.__start += 2
+            self.__step = 3
+        self.__args = args
+        self.__struct = Struct(fmt)
+        self.size = self.__struct.size
+
+    def pack(self, values):
+        """Creates a binary coded Data Frame.
+        @param values: list of values in channel order or dictionary with channel keys
+        @return binary coded Data Frame
+        """
+        if isinstance(values, dict):
+            values = [values[key] for key in self.channels]
+        args = self.__args[:]
+        args[self.__start::self.__step] = values
+        return self.__struct.pack(*args)
+
+    def unpack(self, frame):
+        """Parses a binary coded Data Frame of this layout.
+        @param frame: binary coded Data Frame
+        @return list of values in channel order
+        """
+        return list(self.__struct.unpack(frame)[self.__start::self.__step])
+
+class WrapperEncoder(object):
+    """Wraps (timestamp, frame) records in Timestamp or Delayed Frames and form-encodes them.
+    Headers are packed with precompiled Structs, frames are base64 encoded into a reused list
+    and url escaped in one pass per flush, so no frame objects are created per record.
+    """
+
+    def __init__(self, absolute_time=True, separator=b'', clock=time):
+        """Creates a WrapperEncoder.
+        @param absolute_time: if set to true Timestamp Frames (ms) are created, else Delayed Frames
+        with the age of the record at encoding time
+        @param separator: bytes put before every encoded frame, e.g. the form field name
+        @param clock: function returning the current time in seconds, used for Delayed Frames
+        """
+        self.absolute_time = absolute_time
+        self.separator = separator
+        self.clock = clock
+        self.__pending = []
+        self.__separator_size = len(separator)
+        self.size = 0  # upper bound of the length of flush()
+
+    def wrap(self, frame, timestamp):
+        """Creates a binary coded Timestamp or Delayed Frame.
+        @param frame: valid BayEOS frame
+        @param timestamp: time of the record in seconds
+        @return binary coded wrapper frame
+        """
+        if self.absolute_time:
+            return TIMESTAMP_HEADER.pack(0xc, round(timestamp * 1000)) + frame
+        delay = round((self.clock() - timestamp) * 1000)
+        return DELAYED_HEADER.pack(0x7, min(max(delay, 0), 0xffffffff)) + frame
+
+    def add(self, frame, timestamp):
+        """Wraps and base64 encodes a record, see wrap()."""
+        encoded = b2a_base64(self.wrap(frame, timestamp), newline=False)
+        self.__pending.append(encoded)
+        # url escaping at most triples the length
+        self.size += self.__separator_size + 3 * len(encoded)
+
+    def extend(self, records, max_frames, max_size, timestamps):
+        """Wraps and base64 encodes records until max_frames frames were added or size reaches max_size.
+        No record is taken from records once a limit is reached.
+        @param records: iterator of (timestamp, frame) tuples, records with empty frames are skipped
+        @param max_frames: maximum number of frames to add
+        @param max_size: limit of size
+        @param timestamps: list or deque the timestamps of the added frames are appended to
+        @return number of added frames, records is exhausted unless a limit was reached
+        """
+        frames = 0
+        size = self.size
+        if frames >= max_frames or size >= max_size:
+            return frames
+        append = self.__pending.append
+        note = timestamps.append
+        separator_size = self.__separator_size
+        pack = TIMESTAMP_HEADER.pack
+        absolute_time = self.absolute_time
+        for timestamp, frame in records:
+            if not frame:
+                continue
+            if absolute_time:
+                encoded = b2a_base64(pack(0xc, round(timestamp * 1000)) + frame, newline=False)
+            else:
+                encoded = b2a_base64(self.wrap(frame, timestamp), newline=False)
+            append(encoded)
+            note(timestamp)
+            frames += 1
+            size += separator_size + 3 * len(encoded)
+            if frames >= max_frames or size >= max_size:
+                break
+        self.size = size
+        return frames
+
+    def flush(self):
+        """Url escapes the pending frames.
+        @return separator and escaped base64 string of every pending frame as bytes
+        """
+        if not self.__pending:
+            return b''
+        # newline is not part of the base64 alphabet and replaced by the separator afterwards
+        data = b'\n'.join(self.__pending).replace(b'+', b'%2B').replace(b'/', b'%2F').replace(b'=', b'%3D')
+        del self.__pending[:]
+        self.size = 0
+        return self.separator + data.replace(b'\n', self.separator)
+
+TIMESTAMP_HEADER = Struct('<Bq')  # Frame Type 0xc, milliseconds since 1970-01-01
+DELAYED_HEADER = Struct('<BL')  # Frame Type 0x7, delay in milliseconds
+
 DATA_TYPES = {0x1 : {'format' : '<f', 'length' : 4},  # float32 4 bytes
               0x2 : {'format' : '<i', 'length' : 4},  # int32 4 bytes
               0x3 : {'format' : '<h', 'length' : 2},  # int16 2 bytes
@@ -433,6 +735,191 @@ FRAME_TYPES = {0x1: {'name' : 'Data Frame',
                0x10: {'name' : 'Delayed Second Frame',
                      'class' : DelayedSecondFrame}}
 
+UINT8 = Struct('<B')
+INT16 = Struct('<h')
+UINT16 = Struct('<H')
+UINT32 = Struct('<L')
+UINT64 = Struct('<Q')
+FLOAT32 = Struct('<f')
+unpack_uint8 = UINT8.unpack_from
+unpack_int16 = INT16.unpack_from
+unpack_uint32 = UINT32.unpack_from
+unpack_uint64 = UINT64.unpack_from
+
+def decode_frame(frame, origin='', timestamp=None):
+    """Decodes a binary coded BayEOS Frame into a new Python dictionary.
+    The result equals BayEOSFrame.parse_frame() of the frame classes, but the frame is walked
+    in one loop: wrapper frames (Origin, Routed, Delayed, Timestamp, Checksum) only advance
+    the offset of the nested frame, no frame objects or copies are created. Data Frames and
+    Timestamp Frames, the records of every queue file, are decoded in the loop itself.
+    @param frame: binary coded BayEOS Frame (bytes-like)
+    @param origin: origin of an enclosing frame
+    @param timestamp: timestamp of an enclosing frame, system time if None
+    @return Python dictionary or None if a Frame Type is unknown
+    """
+    res = {'origin': origin, 'timestamp': time() if timestamp is None else timestamp}
+    buffer = frame  # ends with the current nested frame, reading beyond raises struct.error
+    start = 0
+    while True:
+        frame_type = buffer[start] if start < len(buffer) else unpack_uint8(buffer, start)[0]
+        if frame_type == 0x1:
+            _decode_data(buffer, frame, start, res)
+            return res
+        if frame_type == 0xc:
+            res['timestamp'] = unpack_uint64(buffer, start + 1)[0]
+            start += 9
+            continue
+        try:
+            decode = FRAME_DECODERS[frame_type]
+        except KeyError:
+            logger.error('Frame Type %s not found.', frame_type)
+            return None
+        start = decode(buffer, frame, start, res)
+        if start is None:
+            return res
+        if frame_type == 0xf:  # the nested frame is followed by the checksum
+            buffer = memoryview(buffer)[:len(buffer) - 2]
+
+def _decode_data(buffer, frame, start, res):
+    """Decodes a Data Frame. The Struct of the channels is compiled once per Value Type and
+    frame length, channel numbers of Offset Types other than 0x40 are cached with it.
+    @param buffer: frame or memoryview of it ending with the Data Frame
+    @param frame: complete binary coded frame
+    @param start: position of the Data Frame
+    @param res: dictionary of the decoded frame
+    """
+    value_type = unpack_uint8(buffer, start + 1)[0]
+    offset_type = 0xf0 & value_type
+    if offset_type == 0x60:
+        res['values'] = _decode_labels(buffer, frame, start, value_type)
+    else:
+        offset = unpack_uint8(buffer, start + 2)[0] if offset_type == 0x0 else 0
+        size = len(buffer) - start
+        try:
+            values_struct, keys, rest = DATA_LAYOUTS[value_type, size, offset]
+        except KeyError:
+            values_struct, keys, rest = _data_layout(value_type, size, offset)
+        values = values_struct.unpack_from(buffer, start + (3 if offset_type == 0x0 else 2))
+        if keys is None:  # channel indices and values alternate
+            res['values'] = dict(zip(values[0::2], values[1::2]))
+        else:
+            res['values'] = dict(zip(keys, values))
+        if rest:
+            logger.error('Unpack error')
+    res['type'] = 0x1
+
+def _data_layout(value_type, size, offset):
+    """Compiles and caches the layout of a Data Frame without labels.
+    @return Struct of the complete channels, tuple of channel numbers (None for Offset Type 0x40)
+    and whether the frame ends with an incomplete channel
+    """
+    offset_type = 0xf0 & value_type
+    data_type = DATA_TYPES[0x0f & value_type]
+    val_format = data_type['format'][1:]
+    if offset_type == 0x40:
+        count, rest = divmod(size - 2, data_type['length'] + 1)
+        layout = (Struct('<' + ('B' + val_format) * count), None, rest)
+    else:
+        count, rest = divmod(size - (3 if offset_type == 0x0 else 2), data_type['length'])
+        layout = (Struct('<' + val_format * count), tuple(range(offset + 1, offset + count + 1)), rest)
+    if len(DATA_LAYOUTS) >= 1024:
+        DATA_LAYOUTS.clear()
+    DATA_LAYOUTS[(value_type, size, offset)] = layout
+    return layout
+
+def _decode_labels(buffer, frame, start, value_type):
+    """Decodes the channels of a Data Frame with Offset Type 0x60.
+    @return dictionary of label and value
+    """
+    val_length, unpack_value = LABELED_VALUES[0x0f & value_type]
+    end = len(buffer)
+    payload = {}
+    pos = start + 2
+    while pos < end:
+        label_end = pos + 1 + buffer[pos]
+        if label_end + val_length <= end:
+            # the label key includes the first byte of the value like DataFrame.parse()
+            payload[frame[pos + 1:label_end + 1]] = unpack_value(buffer, label_end)[0]
+        else:
+            logger.error('Unpack error')
+        pos = label_end + val_length
+    return payload
+
+def _decode_command(buffer, frame, start, res):
+    res['cmd_type'] = unpack_uint8(buffer, start + 1)[0]
+    res['cmd'] = frame[start + 2:len(buffer)]
+    res['type'] = buffer[start]
+
+def _decode_message(buffer, frame, start, res):
+    res['message'] = frame[start + 1:len(buffer)]
+    res['type'] = buffer[start]
+
+def _decode_routed(buffer, frame, start, res):
+    res['origin'] += "/XBee%d:%d" % (unpack_int16(buffer, start + 3)[0], unpack_int16(buffer, start + 1)[0])
+    return start + 5
+
+def _decode_delayed(buffer, frame, start, res):
+    res['timestamp'] -= unpack_uint32(buffer, start + 1)[0] / 1000
+    return start + 5
+
+def _decode_routed_rssi(buffer, frame, start, res):
+    res['origin'] += "/XBee%d:%d" % (unpack_int16(buffer, start + 3)[0], unpack_int16(buffer, start + 1)[0])
+    res['rssi'] = unpack_uint8(buffer, start + 5)[0]
+    return start + 6
+
+def _decode_timestamp_sec(buffer, frame, start, res):
+    res['timestamp'] = unpack_uint32(buffer, start + 1)[0]
+    return start + 5
+
+def _decode_binary(buffer, frame, start, res):
+    res['binary'] = frame[start + 5:len(buffer)]
+    res['pos'] = FLOAT32.unpack_from(buffer, start + 1)[0]
+    res['type'] = buffer[start]
+
+def _decode_origin(buffer, frame, start, res):
+    length = unpack_uint8(buffer, start + 1)[0]
+    res['origin'] = str(buffer[start + 2:start + length + 2], 'utf-8')
+    return start + length + 2
+
+def _decode_routed_origin(buffer, frame, start, res):
+    length = unpack_uint8(buffer, start + 1)[0]
+    res['origin'] += '/' + str(buffer[start + 2:start + length + 2], 'utf-8')
+    return start + length + 2
+
+def _decode_checksum(buffer, frame, start, res):
+    view = memoryview(buffer)[start:]
+    size = len(view)
+    checksum = sum(view[:max(size - 2, 0)]) + UINT16.unpack(view[max(size - 2, 0):])[0]
+    res['validChecksum'] = (checksum == 0xffff)
+    return start + 1
+
+def _decode_delayed_sec(buffer, frame, start, res):
+    res['timestamp'] -= unpack_uint32(buffer, start + 1)[0]
+    return start + 5
+
+VALUE_STRUCTS = dict((value['format'], Struct(value['format'])) for value in DATA_TYPES.values())
+# Data Type: value length and unpack function of a labeled channel
+LABELED_VALUES = dict((key, (value['length'], VALUE_STRUCTS[value['format']].unpack_from))
+                      for key, value in DATA_TYPES.items())
+DATA_LAYOUTS = {}  # (Value Type, frame length, Channel Offset): see _data_layout()
+
+# decoders of the frame types not handled in decode_frame() itself,
+# they return the position of the nested frame or None
+FRAME_DECODERS = {0x2: _decode_command,
+                  0x3: _decode_command,
+                  0x4: _decode_message,
+                  0x5: _decode_message,
+                  0x6: _decode_routed,
+                  0x7: _decode_delayed,
+                  0x8: _decode_routed_rssi,
+                  0x9: _decode_timestamp_sec,
+                  0xa: _decode_binary,
+                  0xb: _decode_origin,
+                  0xd: _decode_routed_origin,
+                  0xe: _decode_command,
+                  0xf: _decode_checksum,
+                  0x10: _decode_delayed_sec}
+
 # swaps keys and values in FRAME_TYPES Dictionary
 # FRAME_NAMES = {value['name']:key for key, value in FRAME_TYPES.items()}
 # for key, value in FRAME_NAMES.items():
@@ -1,15 +1,23 @@
 """bayeosgatewayclient"""
-import os, base64, re
+import os, io, base64, re, zlib, random
 from os import rename
 from tempfile import gettempdir
-from struct import pack, unpack
+from struct import pack, unpack, Struct
 from socket import gethostname
-from time import sleep, time
-from glob import glob
-from . bayeosframe import BayEOSFrame
+from time import sleep, time, thread_time, localtime, perf_counter
+from . bayeosframe import BayEOSFrame, DataFrame, WrapperEncoder, numpy
+from . metrics import Histogram, Metric
+from . queuefile import QueueFile, QueueIndex, SegmentIndex, encode_record, encode_record_v2, \
+    encode_header_v2, file_info, recover_queue, compact_files, recover_compaction, read_checkpoint, \
+    write_checkpoint, remove_checkpoint, file_key, CHECKPOINT_ENDING
 from abc import abstractmethod
 from multiprocessing import Process
-from threading import Thread
+from threading import Thread, Lock, RLock, Condition, Event
+from collections import deque
+from queue import Queue, Full, Empty
+from urllib.parse import urlencode
+from heapq import heappush, heappop
+from concurrent.futures import ThreadPoolExecutor
 
 import sys
 if sys.version_info> (2 , 8):
@@ -24,9 +32,13 @@ import argparse
 import logging
 import requests
 import tempfile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'BayEOS-Python-Gateway-Client/0.4.3'
+
 DEFAULTS = {'path' : gettempdir(),
             'writer_sleep_time' : 5,
             'sender_sleep_time' : 5,
@@ -41,7 +53,49 @@ DEFAULTS = {'path' : gettempdir(),
             'absolute_time' : True,
             'remove' : True,
             'sleep_between_children' : 0,
-            'backup_path' : None}
+            'backup_path' : None,
+            'flush_records' : 1,
+            'flush_bytes' : 0,
+            'flush_time' : 0,
+            'fsync' : False,
+            'file_format' : 1,
+            'queue_size' : 0,
+            'overflow' : 'block',
+            'rotate_timer' : True,
+            'pool_size' : 2,
+            'timeout' : 10,
+            'retries' : 2,
+            'max_post_frames' : 5000,
+            'max_post_bytes' : 1024*1024,
+            'workers' : 1,
+            'max_in_flight' : 0,
+            'compression' : None,
+            'compression_level' : 6,
+            'compression_threshold' : 1024,
+            'stream_posts' : True,
+            'failure_threshold' : 3,
+            'backoff_base' : 5,
+            'backoff_max' : 900,
+            'watch' : True,
+            'compact_size' : 4*1024*1024,
+            'compact_interval' : 60,
+            'checkpoints' : True,
+            'mode' : 'failover',
+            'quorum' : 0,
+            'max_bytes_per_sec' : 0,
+            'max_frames_per_sec' : 0,
+            'send_windows' : None,
+            'backlog_age' : 3600,
+            'metrics' : True}
+
+# options of BayEOSGatewayClient passed on as keyword arguments
+WRITER_OPTIONS = ('flush_records', 'flush_bytes', 'flush_time', 'fsync', 'file_format', 'queue_size',
+                  'overflow', 'rotate_timer', 'metrics')
+SENDER_OPTIONS = ('backup_path', 'pool_size', 'timeout', 'retries', 'max_post_frames', 'max_post_bytes',
+                  'workers', 'max_in_flight', 'compression', 'compression_level', 'compression_threshold',
+                  'stream_posts', 'failure_threshold', 'backoff_base', 'backoff_max', 'watch', 'compact_size',
+                  'compact_interval', 'checkpoints', 'mode', 'quorum', 'max_bytes_per_sec', 'max_frames_per_sec',
+                  'send_windows', 'backlog_age')
 
 def bayeos_argparser(description = ''):
     """Parses command line arguments useful for this package.
@@ -86,16 +140,109 @@ def bayeos_confparser(config_file):
         logger.error('%s. Config File not found or corrupt.',e)        
     return config
 
+class TimerScheduler(object):
+    """Calls functions at given times from one background thread, shared by all writers.
+    The thread is started with the first call of schedule() in a process."""
+
+    def __init__(self):
+        self.__heap = []
+        self.__sequence = 0
+        self.__condition = Condition()
+        self.__start_lock = Lock()
+        self.__pid = None
+
+    def schedule(self, deadline, function):
+        """Calls function at the given time. Functions are called without any lock held.
+        @param deadline: Unix epoch time
+        @param function: function without arguments, exceptions are logged
+        """
+        with self.__start_lock:
+            if self.__pid != os.getpid():  # first call or forked, the thread of the parent is gone
+                self.__heap = []
+                self.__condition = Condition()
+                self.__pid = os.getpid()
+                thread = Thread(target=self.__run, args=(self.__condition,))
+                thread.daemon = True
+                thread.start()
+        with self.__condition:
+            self.__sequence += 1
+            heappush(self.__heap, (deadline, self.__sequence, function))
+            if self.__heap[0][1] == self.__sequence:  # new earliest deadline
+                self.__condition.notify()
+
+    def __run(self, condition):
+        """Background loop calling due functions.
+        @param condition: Condition guarding the heap
+        """
+        while True:
+            with condition:
+                while not self.__heap or self.__heap[0][0] > time():
+                    condition.wait(self.__heap[0][0] - time() if self.__heap else None)
+                deadline, sequence, function = heappop(self.__heap)
+            try:
+                function()
+            except Exception as err:
+                logger.warning('Timer function failed: %s', err)
+
+
+timer_scheduler = TimerScheduler()
+
+
 class BayEOSWriter(object):
-    """Writes BayEOSFrames to file."""
+    """Writes BayEOSFrames to file.
+
+    The write policy decides when saved records are handed over to the
+    operating system (file flush) and, with fsync, when they are forced to disk.
+    Records not yet flushed are lost if the process dies, records flushed but
+    not fsynced are lost if the operating system crashes or the power fails:
+    - flush_records=1 (default): nothing beyond the record currently written
+    - flush_records=N: up to N-1 records
+    - flush_bytes=N: up to N bytes of records
+    - flush_time=T: records of the last T seconds
+    - all options 0: the complete current file (up to max_chunk bytes or max_time seconds)
+    If more than one option is given, the buffer is flushed as soon as any limit is hit.
+    Without fsync the operating system may additionally hold flushed records in
+    its page cache for some seconds before they reach the disk.
+
+    All methods are thread safe. With queue_size > 0 the save methods only encode
+    records and put them into a bounded queue, a background writer thread batches
+    them to disk and rotates files. Records still queued are lost if the process
+    dies. When the queue is full, overflow decides what happens:
+    - 'block': the saving thread waits for free space
+    - 'drop-oldest': the oldest queued records are discarded
+    - 'spill': the saving thread writes the queued records and its own to disk itself
+
+    With rotate_timer a timer thread shared by all writers closes the current file and renames it
+    to .rd at latest max_time seconds after its first record was saved, even if
+    no further frames are saved. See max_latency() for the resulting delivery bound.
+    """
     
     def __init__(self, path=DEFAULTS['path'], max_chunk=DEFAULTS['max_chunk'],
-                 max_time=DEFAULTS['max_time'],log_level=None):
+                 max_time=DEFAULTS['max_time'],log_level=None,
+                 flush_records=DEFAULTS['flush_records'],
+                 flush_bytes=DEFAULTS['flush_bytes'],
+                 flush_time=DEFAULTS['flush_time'],
+                 fsync=DEFAULTS['fsync'],
+                 file_format=DEFAULTS['file_format'],
+                 queue_size=DEFAULTS['queue_size'],
+                 overflow=DEFAULTS['overflow'],
+                 rotate_timer=DEFAULTS['rotate_timer'],
+                 metrics=DEFAULTS['metrics']):
         """Constructor for a BayEOSWriter instance.
         @param path: path of queue directory
         @param max_chunk: maximum file size in Bytes, when reached a new file is started
         @param max_time: maximum time when a new file is started
         @param log_level: log level according to logging package
+        @param flush_records: flush file buffer every N records, 0 disables
+        @param flush_bytes: flush file buffer every N bytes, 0 disables
+        @param flush_time: flush file buffer at latest N seconds after a record was saved, 0 disables
+        @param fsync: if true, every buffer flush and file rotation is followed by os.fsync
+        @param file_format: queue file format, 1 (plain records) or 2 (segments with header,
+        CRC per record and index footer, see queuefile module)
+        @param queue_size: if > 0, records are written by a background thread through a queue of this size
+        @param overflow: behaviour on full queue: 'block', 'drop-oldest' or 'spill'
+        @param rotate_timer: if true, files are rotated max_time seconds after their first record without further saves
+        @param metrics: if true, the duration of every save call is added to the save_latency histogram
         """
         logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', level=logging.INFO)
         if not log_level is None: 
@@ -103,35 +250,151 @@ class BayEOSWriter(object):
         self.path = os.path.abspath(path)
         self.max_chunk = max_chunk
         self.max_time = max_time
+        self.flush_records = flush_records
+        self.flush_bytes = flush_bytes
+        self.flush_time = flush_time
+        self.fsync = fsync
+        self.rotate_timer = rotate_timer
+        self.file_format = file_format
+        if file_format == 2:
+            self.__encode_record = encode_record_v2
+        else:
+            self.__encode_record = encode_record
+        self.lock = RLock()
+        self.__timer_deadline = None
+        self.__pending_records = 0
+        self.__pending_bytes = 0
+        self.__pending_since = 0
+        self.__closed = False
+        self.overflow = overflow
+        self.counters = {'written': 0, 'dropped': 0, 'spilled': 0, 'batches': 0,
+                         'write_time': 0.0, 'max_write_time': 0.0, 'last_write_time': 0.0,
+                         'frames': 0, 'bytes': 0, 'rotations': 0}
+        self.save_latency = Histogram() if metrics else None
+        self.__counter_lock = RLock()
+        self.__queue = None
+        self.__queued = Event()
+        self.__writer_thread = None
         if not os.path.isdir(self.path):
             try:
                 os.makedirs(self.path, 0o700)
             except OSError as err:
                 logger.critical('OSError: %s Could not create dir.',err)
                 exit()
-        files = glob(os.path.join(self.path,'*.act'))
-        for each_file in files:
-            try:
-                rename(each_file, each_file.replace('.act', '.rd'))
-            except OSError as err:
-                logger.warning('OSError: %s',err)
+        self.queue_index = recover_queue(self.path)
+        self.queue_index.fed = True
         self.__start_new_file()
+        if queue_size:
+            self.__queue = Queue(queue_size)
+            self.__writer_thread = Thread(target=self.__run_writer)
+            self.__writer_thread.daemon = True
+            self.__writer_thread.start()
 
     def __save_frame(self, frame, timestamp=0):
         """Saves frames to file.
         @param frame: must be a valid BayEOS Frame as a binary coded String
         @param timestamp: Unix epoch time stamp, if zero system time is used
         """
+        start = perf_counter()
         if not timestamp:
             timestamp = time()
-        frame_length = len(frame)
-        if self.file.tell() + frame_length + 10 > self.max_chunk or time() - self.current_timestamp > self.max_time:
-            self.flush()
-            
-        self.file.write(pack('<d', timestamp) + pack('<h', frame_length) + frame)
-        self.file.flush()
+        record = self.__encode_record(timestamp, frame)
+        if self.__queue is not None:
+            self.__enqueue([(timestamp, record)])
+            self.__observe(start)
+            return
+        with self.lock:
+            if self.current_size + len(record) > self.max_chunk or \
+               (self.current_records and time() - self.current_timestamp > self.max_time):
+                self.__rotate()
+
+            if not self.current_records:  # max_time counts from the first record
+                self.current_timestamp = time()
+            if self.__segment is not None:
+                self.__segment.add(self.current_size, timestamp)
+            self.file.write(record)
+            self.current_size += len(record)
+            self.current_records += 1
+            self.counters['frames'] += 1
+            self.counters['bytes'] += len(record)
+            self.__pending(1, len(record))
+        self.__observe(start)
         logger.debug('Frame saved.')
 
+    def __observe(self, start):
+        """Adds the duration of a save call to save_latency.
+        @param start: perf_counter() at the beginning of the call
+        """
+        if self.save_latency is not None:
+            self.save_latency.observe(perf_counter() - start)
+
+    def __pending(self, records, size):
+        """Accounts written records and flushes the file buffer according to the write policy.
+        @param records: number of records written to the file buffer
+        @param size: number of bytes written to the file buffer
+        """
+        if not self.__pending_records:
+            self.__pending_since = time()
+            if self.flush_time:
+                self.__schedule(self.__pending_since + self.flush_time)
+        if self.rotate_timer and self.current_records == records:  # first records of the file
+            self.__schedule(self.current_timestamp + self.max_time)
+        self.__pending_records += records
+        self.__pending_bytes += size
+        if (self.flush_records and self.__pending_records >= self.flush_records) or \
+           (self.flush_bytes and self.__pending_bytes >= self.flush_bytes):
+            self.__flush_buffer()
+
+    def __flush_buffer(self):
+        """Hands the file buffer over to the operating system (and to disk if fsync is set)."""
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.__pending_records = 0
+        self.__pending_bytes = 0
+
+    def __schedule(self, deadline):
+        """Makes the timer call __on_timer() at the deadline, unless it is called earlier anyway.
+        Caller must hold the lock.
+        @param deadline: Unix epoch time
+        """
+        if self.__timer_deadline is None or deadline < self.__timer_deadline:
+            self.__timer_deadline = deadline
+            timer_scheduler.schedule(deadline, self.__on_timer)
+
+    def __on_timer(self):
+        """Flushes the file buffer at latest flush_time seconds after a save and rotates
+        files at latest max_time seconds after their first record. Called by the timer."""
+        with self.lock:
+            if self.__closed or self.__timer_deadline is None or self.__timer_deadline > time():
+                return  # a call scheduled earlier than the current deadline
+            self.__timer_deadline = None
+            try:
+                if self.rotate_timer and self.current_records and \
+                   time() >= self.current_timestamp + self.max_time:
+                    self.__rotate()
+                elif self.flush_time and self.__pending_records and \
+                        time() >= self.__pending_since + self.flush_time:
+                    self.__flush_buffer()
+            except (OSError, ValueError) as err:
+                logger.warning('Timer flush failed: %s', err)
+            if self.flush_time and self.__pending_records:
+                self.__schedule(self.__pending_since + self.flush_time)
+            if self.rotate_timer and self.current_records:
+                self.__schedule(self.current_timestamp + self.max_time)
+
+    def max_latency(self, sender_sleep_time=DEFAULTS['sender_sleep_time'], post_timeout=10):
+        """Upper bound of the time from saving a sample until a sender running in
+        sender_sleep_time intervals has posted it, provided the gateway is reachable
+        and no backlog of older files is waiting. Queued records of the background
+        writer thread add the time they wait in the queue.
+        @param sender_sleep_time: sleep time of the sender
+        @param post_timeout: timeout of one post
+        @return bound in seconds or None if rotate_timer is off (no bound)
+        """
+        if not self.rotate_timer:
+            return None
+        return self.max_time + sender_sleep_time + post_timeout
 
     def __start_new_file(self):
         """Opens a new file with ending .act and determines current file name."""
@@ -139,7 +402,21 @@ class BayEOSWriter(object):
         [sec, usec] = str.split(str(self.current_timestamp), '.')        
         [fd, self.current_name] = tempfile.mkstemp('.act',sec + '-' + usec + '-',self.path)
         os.close(fd)
-        self.file = open(self.current_name, 'wb')
+        if self.flush_records == 1 or self.flush_bytes or self.flush_time:
+            buffering = max(io.DEFAULT_BUFFER_SIZE, int(self.flush_bytes))
+        else:  # rotation only - keep the whole chunk in memory
+            buffering = max(io.DEFAULT_BUFFER_SIZE, int(self.max_chunk))
+        self.file = open(self.current_name, 'wb', buffering)
+        self.current_size = 0
+        self.current_records = 0
+        self.__segment = None
+        if self.file_format == 2:
+            self.__segment = SegmentIndex()
+            header = encode_header_v2(self.current_timestamp)
+            self.file.write(header)
+            self.current_size = len(header)
+        self.__pending_records = 0
+        self.__pending_bytes = 0
 
     def save(self, values, value_type=None, offset=0, timestamp=0, origin=None, routed=False):
         """Generic frame saving method.
@@ -163,6 +440,274 @@ class BayEOSWriter(object):
             origin_frame.create(origin=origin, nested_frame=data_frame.frame)
             self.__save_frame(origin_frame.frame, timestamp)
 
+    def save_many(self, rows, timestamps=None, value_type=None, offset=0, origin=None, routed=False):
+        """Saves many rows of values at once, e.g. when draining a logger buffer.
+        All frames are encoded into one contiguous buffer which is written with a single
+        call per file. Rotation is checked once per batch, the batch is split across
+        files where max_chunk would be exceeded.
+        With NumPy installed, 2-D arrays are encoded vectorized (see DataFrame.create_array).
+        @param rows: list of values as accepted by save() or 2-D array with one row per frame
+        @param timestamps: list of Unix epoch time stamps, one per row, if None or zero system time is used
+        @param value_type: defines Offset and Data Type
+        @param offset: defines Channel Offset
+        @param origin: if defined, it is used as a name
+        @param routed: only relevant with origin - if true, routed origin is created
+        @raise ValueError if the number of timestamps differs from the number of rows
+        """
+        prefix = b''
+        if origin:
+            origin_frame = BayEOSFrame.factory(0xd if routed else 0xb)
+            origin_frame.create(origin=origin, nested_frame=b'')
+            prefix = origin_frame.frame
+        if numpy is not None and isinstance(rows, numpy.ndarray) and self.file_format == 1 and \
+           self.__queue is None and \
+           (0xf0 & (0x41 if value_type is None else value_type)) != 0x60:
+            frames = DataFrame.create_array(rows, 0x41 if value_type is None else value_type, offset, prefix)
+            self.__save_frame_array(frames, timestamps)
+            return
+        frames = DataFrame.create_many(rows, value_type, offset)
+        if prefix:
+            frames = [prefix + frame for frame in frames]
+        self.__save_frames(frames, timestamps)
+
+    def __save_frames(self, frames, timestamps=None):
+        """Saves a batch of frames to file.
+        @param frames: list of valid BayEOS Frames as binary coded Strings
+        @param timestamps: list of Unix epoch time stamps, if None or zero system time is used
+        """
+        start = perf_counter()
+        now = time()
+        if timestamps is None:
+            timestamps = [now] * len(frames)
+        elif len(timestamps) != len(frames):
+            raise ValueError('%s timestamps given for %s rows' % (len(timestamps), len(frames)))
+        encode_record = self.__encode_record
+        records = []
+        for frame, timestamp in zip(frames, timestamps):
+            timestamp = timestamp or now
+            records.append((timestamp, encode_record(timestamp, frame)))
+        if self.__queue is not None:
+            self.__enqueue(records)
+            self.__observe(start)
+            return
+        with self.lock:
+            self.__write_records(records)
+        self.__observe(start)
+        logger.debug('%s frames saved.', len(records))
+
+    def __write_records(self, records):
+        """Writes encoded records to file, rotating files where needed. Caller must hold the lock.
+        @param records: list of (timestamp, encoded record) tuples
+        """
+        if self.current_records and time() - self.current_timestamp > self.max_time:
+            self.__rotate()
+        buffer = bytearray()
+        count = 0
+        for timestamp, record in records:
+            if self.current_size + len(buffer) + len(record) > self.max_chunk and \
+               (count or self.current_records):
+                self.__write_buffer(buffer, count)
+                self.__rotate()
+                buffer = bytearray()
+                count = 0
+            if self.__segment is not None:
+                self.__segment.add(self.current_size + len(buffer), timestamp)
+            buffer += record
+            count += 1
+        if count:
+            self.__write_buffer(buffer, count)
+
+    def __enqueue(self, records):
+        """Puts encoded records into the queue of the background writer thread.
+        @param records: list of (timestamp, encoded record) tuples
+        """
+        if self.overflow == 'block':
+            self.__queue.put(records)
+            self.__queued.set()
+            return
+        try:
+            self.__queue.put_nowait(records)
+            self.__queued.set()
+            return
+        except Full:
+            pass
+        if self.overflow == 'spill':
+            queued = self.__write_queued(records)  # queued records are older, they are written first
+            with self.__counter_lock:
+                self.counters['written'] += queued
+                self.counters['spilled'] += len(records)
+            return
+        while True:  # drop-oldest
+            try:
+                dropped = self.__queue.get_nowait()
+                self.__queue.task_done()
+                if dropped is not None:
+                    with self.__counter_lock:
+                        self.counters['dropped'] += len(dropped)
+                    logger.debug('Writer queue full, dropped %s records.', len(dropped))
+                else:  # keep the stop signal
+                    self.__queue.put_nowait(dropped)
+            except Empty:
+                pass
+            try:
+                self.__queue.put_nowait(records)
+                self.__queued.set()
+                return
+            except Full:
+                continue
+
+    def __take_queued(self):
+        """Takes all records from the queue. Caller must hold the lock, so records are
+        only taken from the queue in the order they are written.
+        @return tuple of list of (timestamp, encoded record) tuples, number of queue items
+        and whether the stop signal was taken
+        """
+        records = []
+        items = 0
+        stop = False
+        while True:
+            try:
+                batch = self.__queue.get_nowait()
+            except Empty:
+                return records, items, stop
+            items += 1
+            if batch is None:
+                stop = True
+            else:
+                records += batch
+
+    def __queue_done(self, items):
+        """Marks queue items taken with __take_queued() as done.
+        @param items: number of queue items
+        """
+        for i in range(items):
+            self.__queue.task_done()
+
+    def __write_queued(self, records=()):
+        """Writes all queued records and further records in the saving thread.
+        @param records: list of (timestamp, encoded record) tuples newer than the queued ones
+        @return number of queued records written
+        """
+        with self.lock:
+            queued, items, stop = self.__take_queued()
+            try:
+                self.__write_records(queued + list(records))
+            finally:
+                self.__queue_done(items)
+        if stop:  # the stop signal is for the writer thread
+            self.__queue.put(None)
+            self.__queued.set()
+        return len(queued)
+
+    def __run_writer(self):
+        """Background loop writing queued records to disk in batches."""
+        while True:
+            self.__queued.wait()
+            self.__queued.clear()
+            start = time()
+            with self.lock:
+                records, items, stop = self.__take_queued()
+                try:
+                    if records:
+                        self.__write_records(records)
+                except Exception as err:  # the thread must survive, flush() waits for it
+                    logger.error('Writer thread could not write %s records: %s', len(records), err)
+                finally:
+                    self.__queue_done(items)
+            if records:
+                write_time = time() - start
+                with self.__counter_lock:
+                    self.counters['written'] += len(records)
+                    self.counters['batches'] += 1
+                    self.counters['write_time'] += write_time
+                    self.counters['last_write_time'] = write_time
+                    self.counters['max_write_time'] = max(self.counters['max_write_time'], write_time)
+            if stop:
+                return
+
+    def stats(self):
+        """Returns counters of the background writer thread.
+        @return dictionary with queue depth, written, dropped and spilled records, number of
+        batches and write latency (total, last and maximum seconds per batch)
+        """
+        with self.__counter_lock:
+            res = dict(self.counters)
+        res['queue_depth'] = self.__queue.qsize() if self.__queue is not None else 0
+        return res
+
+    def metrics(self):
+        """Returns the metrics of the writer, see MetricsRegistry.
+        @return list of Metric tuples
+        """
+        stats = self.stats()
+        res = [Metric('writer_frames_total', 'counter', 'Frames written to queue files.', {}, stats['frames']),
+               Metric('writer_bytes_total', 'counter', 'Bytes of records written to queue files.', {}, stats['bytes']),
+               Metric('writer_rotations_total', 'counter', 'Queue files finished before close.', {},
+                      stats['rotations']),
+               Metric('writer_dropped_total', 'counter', 'Records dropped on full writer queue.', {},
+                      stats['dropped']),
+               Metric('writer_spilled_total', 'counter', 'Records written by the saving thread on full writer queue.',
+                      {}, stats['spilled']),
+               Metric('writer_queue_depth', 'gauge', 'Batches waiting for the background writer thread.', {},
+                      stats['queue_depth']),
+               Metric('writer_current_file_bytes', 'gauge', 'Size of the queue file currently written.', {},
+                      self.current_size)]
+        if self.save_latency is not None:
+            res.append(Metric('writer_save_seconds', 'histogram', 'Duration of save calls.', {},
+                              self.save_latency.snapshot()))
+        return res
+
+    def __save_frame_array(self, frames, timestamps=None):
+        """Saves a batch of equally sized frames given as NumPy array to file.
+        @param frames: 2-D uint8 array, one frame per row
+        @param timestamps: list of Unix epoch time stamps, if None or zero system time is used
+        """
+        save_start = perf_counter()
+        now = time()
+        count, frame_length = frames.shape
+        if timestamps is not None and len(timestamps) != count:
+            raise ValueError('%s timestamps given for %s rows' % (len(timestamps), count))
+        records = numpy.empty(count, dtype=[('timestamp', '<f8'), ('length', '<i2'),
+                                            ('frame', numpy.uint8, (frame_length,))])
+        if timestamps is None:
+            records['timestamp'] = now
+        else:
+            timestamps = numpy.asarray(timestamps, dtype=float)
+            records['timestamp'] = numpy.where(timestamps == 0, now, timestamps)
+        records['length'] = frame_length
+        records['frame'] = frames
+        size = records.itemsize
+        with self.lock:
+            if self.current_records and now - self.current_timestamp > self.max_time:
+                self.__rotate()
+            start = 0
+            while start < count:
+                space = (self.max_chunk - self.current_size) // size
+                if space <= 0 and self.current_records:
+                    self.__rotate()
+                    continue
+                end = min(count, start + max(space, 1))
+                self.__write_buffer(records[start:end].view(numpy.uint8), end - start)
+                start = end
+                if start < count:
+                    self.__rotate()
+        self.__observe(save_start)
+        logger.debug('%s frames saved.', count)
+
+    def __write_buffer(self, buffer, records):
+        """Writes a buffer of encoded records to the current file.
+        @param buffer: encoded records
+        @param records: number of records in buffer
+        """
+        if not self.current_records:  # max_time counts from the first record
+            self.current_timestamp = time()
+        self.file.write(buffer)
+        self.current_size += len(buffer)
+        self.current_records += records
+        self.counters['frames'] += records
+        self.counters['bytes'] += len(buffer)
+        self.__pending(records, len(buffer))
+
     def save_msg(self, message, error=False, timestamp=0, origin=None, routed=False):
         """Saves Messages or Error Messages to Gateway.
         @param message: String to send
@@ -197,17 +742,306 @@ class BayEOSWriter(object):
 
     def flush(self):
         """Close the current used file and renames it from .act to .rd.
-        Starts a new file.
+        Starts a new file. With a background writer thread, queued records are written first.
         """
-        logger.info('Flushed writer.')
+        if self.__queue is not None:
+            if self.__writer_thread.is_alive():
+                self.__queue.join()
+            else:
+                self.__write_queued()
+        self.__rotate()
+
+    def __rotate(self):
+        """Closes the current file, renames it to .rd and starts a new file."""
+        with self.lock:
+            logger.info('Flushed writer.')
+            self.__close_file()
+            self.__start_new_file()
+            self.counters['rotations'] += 1
+
+    def close(self):
+        """Writes all queued records, stops the background threads, closes the
+        current file and renames it to .rd. The writer must not be used afterwards.
+        """
+        if self.__writer_thread is not None and self.__writer_thread.is_alive():
+            self.__queue.put(None)
+            self.__queued.set()
+            self.__writer_thread.join()
+        with self.lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__close_file()
+
+    def __close_file(self):
+        """Closes the current file and renames it from .act to .rd, a file without records is removed."""
+        if not self.current_records:
+            self.file.close()
+            try:
+                os.remove(self.current_name)
+            except OSError as err:
+                logger.warning('%s. Could not remove empty file: %s', err, self.current_name)
+            return
+        if self.__segment is not None:
+            self.file.write(self.__segment.footer(self.current_size))
+        if self.fsync:
+            self.file.flush()
+            os.fsync(self.file.fileno())
         self.file.close()
         try:
             p = (self.current_name+'$$__end_key__$$').replace('.act$$__end_key__$$','.rd')                 
             rename(self.current_name, p)
+            self.queue_index.add(p)
             logger.debug('File %s ready for post',p)
         except OSError as err:
             logger.warning('%s. Could not find file: %s',err,self.current_name )
-        self.__start_new_file()
+
+COMPRESSION_WBITS = {None: None, 'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+FRAME_FIELD = b'&bayeosframes%5B%5D='
+BODY_CHUNK_SIZE = 64*1024
+SHAPE_CHUNK_SIZE = 8*1024 # largest piece of a request body passed at once with max_bytes_per_sec
+LATENCY_SAMPLES = 10000
+
+class CircuitBreaker(object):
+    """Circuit breaker with exponential backoff for gateway outages.
+    closed: posts are sent as usual.
+    open: posts are suspended until the backoff delay has passed.
+    half-open: a cheap probe request checks whether the gateway is back.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=DEFAULTS['failure_threshold'],
+                 backoff_base=DEFAULTS['backoff_base'],
+                 backoff_max=DEFAULTS['backoff_max'],
+                 clock=time,
+                 history=100):
+        """Creates a CircuitBreaker.
+        @param failure_threshold: number of consecutive failed posts opening the circuit
+        @param backoff_base: delay after the first outage in seconds, doubled with every failed probe
+        @param backoff_max: maximum delay in seconds
+        @param clock: function returning the current time in seconds
+        @param history: number of state transitions kept in transitions
+        """
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0 # consecutive failed posts
+        self.level = 0 # backoff periods since the last successful post
+        self.retry_time = 0
+        self.transitions = deque(maxlen=history)
+        self.listeners = []
+        self.lock = RLock()
+
+    def allow(self):
+        """Returns the state, switches from open to half-open when the delay has passed."""
+        with self.lock:
+            if self.state == CircuitBreaker.OPEN and self.clock() >= self.retry_time:
+                self.__set_state(CircuitBreaker.HALF_OPEN)
+            return self.state
+
+    def wait(self):
+        """Seconds until the next probe, 0 if the circuit is not open."""
+        with self.lock:
+            if self.state != CircuitBreaker.OPEN:
+                return 0
+            return max(self.retry_time - self.clock(), 0)
+
+    def success(self):
+        """Records a successful post, resets the backoff delay."""
+        with self.lock:
+            self.failures = 0
+            self.level = 0
+            if self.state != CircuitBreaker.CLOSED:
+                self.__set_state(CircuitBreaker.CLOSED)
+
+    def probe_success(self):
+        """Records a successful probe. Posts are sent again, but the backoff delay is kept
+        and the next failed post opens the circuit again until a post succeeds."""
+        with self.lock:
+            self.failures = self.failure_threshold - 1
+            if self.state != CircuitBreaker.CLOSED:
+                self.__set_state(CircuitBreaker.CLOSED)
+
+    def failure(self):
+        """Records a failed post or probe and opens the circuit if necessary."""
+        with self.lock:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or \
+                    (self.state == CircuitBreaker.CLOSED and self.failures >= self.failure_threshold):
+                delay = min(self.backoff_max, self.backoff_base * 2 ** self.level)
+                delay = delay / 2.0 + random.uniform(0, delay / 2.0) # jitter
+                self.level += 1
+                self.failures = 0
+                self.retry_time = self.clock() + delay
+                self.__set_state(CircuitBreaker.OPEN, delay)
+
+    def __set_state(self, state, delay=None):
+        old_state = self.state
+        self.state = state
+        self.transitions.append((self.clock(), old_state, state))
+        if state == CircuitBreaker.OPEN:
+            logger.warning('Gateway circuit %s -> %s, next probe in %.1f s', old_state, state, delay)
+        else:
+            logger.info('Gateway circuit %s -> %s', old_state, state)
+        for listener in self.listeners:
+            try:
+                listener(old_state, state)
+            except Exception as err:
+                logger.warning('Circuit breaker listener error: %s', err)
+
+class TokenBucket(object):
+    """Token bucket rate limiter. A consumer may overdraw the bucket and then waits
+    until the debt is paid off, so amounts larger than the capacity pass as well
+    and the long-term rate never exceeds rate.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time, sleep=sleep):
+        """Creates a full TokenBucket.
+        @param rate: tokens added per second
+        @param capacity: maximum number of tokens (burst), rate if None
+        @param clock: function returning the current time in seconds
+        @param sleep: function sleeping a number of seconds
+        """
+        self.rate = float(rate)
+        self.capacity = capacity or self.rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.waited = 0.0 # total time waited in seconds
+        self.lock = RLock()
+
+    def consume(self, amount):
+        """Takes tokens and waits while the bucket is overdrawn.
+        @param amount: number of tokens
+        @return seconds waited
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += delay
+        if delay:
+            self.sleep(delay)
+        return delay
+
+class ShapedBody(object):
+    """File-like request body read at the rate of a TokenBucket in pieces of at most
+    SHAPE_CHUNK_SIZE bytes. It has a length, so it is posted with Content-Length."""
+
+    def __init__(self, data, bucket):
+        """Creates a ShapedBody.
+        @param data: request body as bytes
+        @param bucket: TokenBucket of bytes
+        """
+        self.data = data
+        self.bucket = bucket
+        self.position = 0
+
+    def __len__(self):
+        return len(self.data) - self.position
+
+    def read(self, size=-1):
+        """Reads the next piece of the body, waits while the bucket is overdrawn.
+        @param size: maximum number of bytes
+        @return bytes, empty at the end
+        """
+        if size is None or size < 0 or size > SHAPE_CHUNK_SIZE:
+            size = SHAPE_CHUNK_SIZE
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        if chunk:
+            self.bucket.consume(len(chunk))
+        return chunk
+
+class SendWindows(object):
+    """Daily time windows in local time, e.g. [('22:00', '06:00')] for the night."""
+
+    def __init__(self, windows, clock=time):
+        """Creates SendWindows.
+        @param windows: list of (start, end) tuples of 'HH:MM' strings, end before start spans midnight
+        @param clock: function returning the current time in seconds
+        """
+        self.windows = [(SendWindows.__minutes(start), SendWindows.__minutes(end)) for start, end in windows]
+        self.clock = clock
+
+    @staticmethod
+    def __minutes(time_of_day):
+        hours, minutes = time_of_day.split(':')
+        return int(hours) * 60 + int(minutes)
+
+    def is_open(self):
+        """@return True if the current time is within one of the windows"""
+        now = localtime(self.clock())
+        minute = now.tm_hour * 60 + now.tm_min
+        for start, end in self.windows:
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                return True
+        return False
+
+def percentiles(values, points=(50, 90, 99, 100)):
+    """Nearest-rank percentiles.
+    @param values: list of numbers
+    @param points: list of percentiles
+    @return dictionary of percentile and value, empty if there are no values
+    """
+    values = sorted(values)
+    if not values:
+        return {}
+    return dict((p, values[min(int(len(values) * p / 100.0), len(values) - 1)]) for p in points)
+
+class Endpoint(object):
+    """Gateway url of a BayEOSSender with its circuit breaker and statistics."""
+
+    def __init__(self, url, breaker):
+        """Creates an Endpoint.
+        @param url: gateway url e.g. http://<gateway>/gateway/frame/saveFlat
+        @param breaker: CircuitBreaker of the url
+        """
+        self.url = url
+        self.breaker = breaker
+        self.posts = 0
+        self.errors = 0
+        self.frames = 0
+        self.latencies = deque(maxlen=1000) # seconds per post
+        self.post_latency = Histogram()
+        self.status_codes = {}  # number of responses per HTTP status code, 0 for connection errors
+        self.lock = RLock()
+
+    def record(self, status_code, latency, frames):
+        """Records a post.
+        @param status_code: HTTP status code, 0 on connection errors
+        @param latency: duration of the post in seconds
+        @param frames: number of frames posted
+        """
+        self.post_latency.observe(latency)
+        with self.lock:
+            self.posts += 1
+            self.latencies.append(latency)
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            if status_code == 200:
+                self.frames += frames
+            else:
+                self.errors += 1
+        if status_code == 200:
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+            if status_code:
+                logger.warning('sender __post error code:%s (%s)', status_code, self.url)
+
+    def stats(self):
+        """@return dictionary with url, circuit state, posts, failed posts, frames and latency percentiles"""
+        with self.lock:
+            return {'url': self.url, 'state': self.breaker.state, 'posts': self.posts, 'errors': self.errors,
+                    'frames': self.frames, 'latency': percentiles(self.latencies)}
 
 class BayEOSSender(object):
     """Sends content of BayEOS writer files to Gateway."""
@@ -219,23 +1053,80 @@ class BayEOSSender(object):
                  absolute_time=DEFAULTS['absolute_time'],
                  remove=DEFAULTS['remove'],
                  backup_path=DEFAULTS['backup_path'],
-                 log_level=None):
+                 log_level=None,
+                 queue_index=None,
+                 pool_size=DEFAULTS['pool_size'],
+                 timeout=DEFAULTS['timeout'],
+                 retries=DEFAULTS['retries'],
+                 max_post_frames=DEFAULTS['max_post_frames'],
+                 max_post_bytes=DEFAULTS['max_post_bytes'],
+                 workers=DEFAULTS['workers'],
+                 max_in_flight=DEFAULTS['max_in_flight'],
+                 compression=DEFAULTS['compression'],
+                 compression_level=DEFAULTS['compression_level'],
+                 compression_threshold=DEFAULTS['compression_threshold'],
+                 stream_posts=DEFAULTS['stream_posts'],
+                 failure_threshold=DEFAULTS['failure_threshold'],
+                 backoff_base=DEFAULTS['backoff_base'],
+                 backoff_max=DEFAULTS['backoff_max'],
+                 watch=DEFAULTS['watch'],
+                 compact_size=DEFAULTS['compact_size'],
+                 compact_interval=DEFAULTS['compact_interval'],
+                 checkpoints=DEFAULTS['checkpoints'],
+                 mode=DEFAULTS['mode'],
+                 quorum=DEFAULTS['quorum'],
+                 max_bytes_per_sec=DEFAULTS['max_bytes_per_sec'],
+                 max_frames_per_sec=DEFAULTS['max_frames_per_sec'],
+                 send_windows=DEFAULTS['send_windows'],
+                 backlog_age=DEFAULTS['backlog_age']):
         """Constructor for BayEOSSender instance.
         @param path: path where BayEOSWriter puts files
         @param name: sender name
-        @param url: gateway url e.g. http://<gateway>/gateway/frame/saveFlat
+        @param url: gateway url e.g. http://<gateway>/gateway/frame/saveFlat or list of urls, primary first
         @param password: password on gateway
         @param user: user on gateway
         @param absolute_time: if set to false, relative time is used (delay)
         @param remove: if set to false files are kept as .bak file in the BayEOSWriter directory
         @param backup_path: path 
         @param log_level: log level according to logging package
+        @param queue_index: QueueIndex of path e.g. writer.queue_index of a writer in the same process
+        @param pool_size: maximum number of keep-alive connections to the gateway
+        @param timeout: timeout of a post in seconds or (connect, read) tuple
+        @param retries: number of retries on connection errors before a post fails
+        @param max_post_frames: maximum number of frames combined from consecutive files in one post
+        @param max_post_bytes: maximum size of the encoded frames in one post
+        @param workers: number of threads posting in parallel, 1 posts one request after the other
+        @param max_in_flight: maximum number of posts dispatched but not yet committed, 2*workers if 0
+        @param compression: Content-Encoding of request bodies, 'gzip', 'deflate' or None
+        @param compression_level: zlib compression level from 1 (fast) to 9 (small)
+        @param compression_threshold: minimum size of a request body to compress in bytes
+        @param stream_posts: if set to true files exceeding max_post_bytes are posted with chunked transfer encoding
+        instead of building the request body in memory (only without checkpoints and not in fanout mode)
+        @param failure_threshold: number of consecutive failed posts before the sender backs off
+        @param backoff_base: first backoff delay in seconds, doubled while the gateway is down
+        @param backoff_max: maximum backoff delay in seconds
+        @param watch: if set to true new files are picked up by inotify (or a check of the directory modification
+        time), otherwise the directories are read completely on every send()
+        @param compact_size: size of the segments small files in backup_path are merged into, 0 disables compaction
+        @param compact_interval: interval of the background compaction started by run() in seconds
+        @param checkpoints: if set to true files exceeding max_post_frames or max_post_bytes are posted in parts and the offset of the
+        last acknowledged record is stored in a checkpoint file (*.rd.ckpt), so a retry resumes there
+        @param mode: with several urls, 'failover' posts to the first available url, 'fanout' posts to all urls
+        @param quorum: number of urls that have to accept a post in fanout mode, majority if 0
+        @param max_bytes_per_sec: limit of the average upload rate in bytes per second, 0 for no limit
+        @param max_frames_per_sec: limit of the average upload rate in frames per second, 0 for no limit
+        @param send_windows: list of daily (start, end) windows e.g. [('22:00', '06:00')], outside these windows
+        only files younger than backlog_age are sent and backup_path is not sent, None sends everything always
+        @param backlog_age: age in seconds from which files are backlog sent only within send_windows
         """
         if not password:
             exit('No gateway password was found.')
+        if compression not in COMPRESSION_WBITS:
+            raise ValueError('Unknown compression: %s' % compression)
         self.path = os.path.abspath(path)
         self.name = name
-        self.url = url
+        urls = [url] if isinstance(url, str) else list(url)
+        self.url = urls[0]
         self.password = password
         self.user = user
         self.absolute_time = absolute_time
@@ -250,131 +1141,848 @@ class BayEOSSender(object):
                 logger.warning('OSError: %s',err)
             backup_path=os.path.abspath(backup_path)
         self.backup_path = backup_path
-
+        self.compact_size = compact_size
+        self.compact_interval = compact_interval
+        self.checkpoints = checkpoints
+        self.__send_lock = RLock()
+        self.__compactor = None
+        if backup_path and compact_size and os.path.isdir(backup_path):
+            recover_compaction(backup_path)
+        self.headers = {'user-agent': USER_AGENT}
+        self.queue_indexes = {}
+        if queue_index is not None:
+            self.queue_indexes[self.path] = queue_index
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.max_post_frames = max_post_frames
+        self.max_post_bytes = max_post_bytes
+        self.workers = workers
+        self.max_in_flight = max_in_flight or 2*workers
+        self.__executor = None
+        self.__lock = RLock()
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_threshold = compression_threshold
+        self.stream_posts = stream_posts
+        if mode not in ('failover', 'fanout'):
+            raise ValueError('Unknown mode: %s' % mode)
+        self.mode = mode
+        if quorum > len(urls):
+            raise ValueError('Quorum %s exceeds the number of urls (%s)' % (quorum, len(urls)))
+        self.endpoints = [Endpoint(endpoint_url, CircuitBreaker(failure_threshold, backoff_base, backoff_max))
+                          for endpoint_url in urls]
+        self.quorum = quorum or len(urls) // 2 + 1
+        self.__active = self.endpoints[:1]
+        self.__fanout_executor = None
+        self.byte_bucket = TokenBucket(max_bytes_per_sec) if max_bytes_per_sec else None
+        self.frame_bucket = TokenBucket(max_frames_per_sec) if max_frames_per_sec else None
+        self.send_windows = SendWindows(send_windows) if send_windows else None
+        self.backlog_age = backlog_age
+        self.watch = watch
+        self.latencies = deque(maxlen=LATENCY_SAMPLES) # seconds from sample to post of the latest frames
+        self.counters = {'posts': 0, 'post_errors': 0, 'probes': 0, 'connections': 0, 'session_resets': 0,
+                         'bytes': 0, 'bytes_sent': 0, 'compress_time': 0.0, 'frames': 0}
+        self.__session = None  # created on first use, e.g. after the sender process was started
 
     def send(self):
         """Keeps sending until all files are sent or an error occurs.
+        While the gateway is down (see breaker) nothing is sent until a probe request succeeds.
         @return number of posted frames as an integer
         """
         count_frames = 0
-        try:
-            count_frames += self.__send_files(self.path)
-        except:
-            logger.warning('Send error on __send_files(%s)',self.path)
-        if self.backup_path:
+        if not self.__gateway_up():
+            return 0
+        with self.__send_lock:
             try:
-                count_frames += self.__send_files(self.backup_path)
+                count_frames += self.__send_files(self.path)
             except:
-                logger.warning('Send error on __send_files(%s)',self.backup_path)
+                logger.warning('Send error on __send_files(%s)',self.path)
+            if self.backup_path:
+                try:
+                    count_frames += self.__send_files(self.backup_path)
+                except:
+                    logger.warning('Send error on __send_files(%s)',self.backup_path)
         return count_frames
 
+    def compact_backup(self):
+        """Merges runs of consecutive small files in backup_path into segments of at
+        least compact_size bytes, so the backlog is sent in a few large posts.
+        Files of half the segment size or larger are left as they are.
+        @return number of merged files
+        """
+        if not self.backup_path or not self.compact_size:
+            return 0
+        with self.__send_lock:
+            files = self._ready_files(self.backup_path)
+        merged = 0
+        group = []
+        size = 0
+        for file_name in files:
+            try:
+                file_size = os.path.getsize(file_name)
+                if os.path.exists(file_name + CHECKPOINT_ENDING):  # partially sent
+                    file_size = self.compact_size
+            except OSError:
+                file_size = self.compact_size  # gone, end of the run
+            if file_size >= self.compact_size // 2:
+                group = []
+                size = 0
+                continue
+            group.append(file_name)
+            size += file_size
+            if size >= self.compact_size:
+                merged += self.__compact(group)
+                group = []
+                size = 0
+        return merged
+
+    def __compact(self, files):
+        """Merges files into one segment unless some of them were sent in the meantime.
+        @return number of merged files
+        """
+        with self.__send_lock:
+            if not all(os.path.exists(file_name) for file_name in files):
+                return 0
+            segment_name = compact_files(files)
+            for file_name in files:
+                self._forget(file_name)
+            index = self.queue_indexes.get(self.backup_path)
+            if index is not None:
+                index.add(segment_name)
+        return len(files)
+
+    def __run_compactor(self):
+        """Compacts backup_path every compact_interval seconds."""
+        while True:
+            sleep(self.compact_interval)
+            try:
+                self.compact_backup()
+            except Exception as err:
+                logger.warning('Compaction of %s failed: %s', self.backup_path, err)
+
+    def __start_compactor(self):
+        """Starts the background compaction of backup_path once."""
+        if self.backup_path and self.compact_size and self.compact_interval and \
+                (self.__compactor is None or not self.__compactor.is_alive()):
+            self.__compactor = Thread(target=self.__run_compactor)
+            self.__compactor.daemon = True
+            self.__compactor.start()
+
+    @property
+    def breaker(self):
+        """CircuitBreaker of the primary or, after a failover, the current url."""
+        return self.__active[0].breaker if self.__active else self.endpoints[0].breaker
+
+    def __gateway_up(self):
+        """Selects the urls to post to by their circuit breakers. Urls are probed when their
+        backoff delay has passed, so failover returns to the primary url once it is back.
+        @return True if posts should be sent
+        """
+        active = []
+        for endpoint in self.endpoints:
+            state = endpoint.breaker.allow()
+            if state == CircuitBreaker.HALF_OPEN:
+                status_code = self._probe(endpoint.url)
+                if status_code and status_code < 500:
+                    endpoint.breaker.probe_success()
+                    state = CircuitBreaker.CLOSED
+                else:
+                    endpoint.breaker.failure()
+            if state == CircuitBreaker.CLOSED:
+                active.append(endpoint)
+                if self.mode == 'failover':
+                    break
+        if self.mode == 'failover' and active and self.__active and active[0] is not self.__active[0]:
+            logger.warning('Sender switches to %s', active[0].url)
+        if active:
+            self.__active = active
+        if self.mode == 'fanout':
+            return len(active) >= self.quorum
+        return bool(active)
+
+    def endpoint_stats(self):
+        """Returns statistics of every gateway url.
+        @return list of dictionaries with url, circuit state, posts, failed posts, frames and latency percentiles
+        """
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def _probe(self, url=None):
+        """Sends a HEAD request to a gateway url over a new connection, without retries.
+        @param url: gateway url, the primary url if None
+        @return HTTP status code or 0 on connection errors
+        """
+        self.__count('probes')
+        session = self.session
+        try:
+            return requests.head(url or self.url, timeout=self.timeout, auth=(self.user, self.password),
+                                 headers=self.headers).status_code
+        except requests.exceptions.RequestException as e:
+            logger.info('sender probe error:%s', e)
+            self.__reset_session(session)
+            return 0
+
+    def queue_info(self):
+        """Summarizes the files waiting in path and backup_path.
+        Frame count and time range are read from the index footer of version 2 files,
+        version 1 files have to be read completely.
+        @return dictionary with number of files, frames, first and last timestamp and incomplete files
+        """
+        res = {'files': 0, 'frames': 0, 'first': None, 'last': None, 'incomplete': 0}
+        for path in (self.path, self.backup_path):
+            if not path:
+                continue
+            index = QueueIndex(path)
+            index.scan()
+            for file_name in index.files():
+                info = file_info(file_name)
+                if info is None:
+                    continue
+                res['files'] += 1
+                res['frames'] += info['frames']
+                if not info['complete']:
+                    res['incomplete'] += 1
+                if info['frames']:
+                    if res['first'] is None or info['first'] < res['first']:
+                        res['first'] = info['first']
+                    if res['last'] is None or info['last'] > res['last']:
+                        res['last'] = info['last']
+        return res
+
     def __send_files(self, path):
         """Sends all files within one directory.
         @param path: path in file system
         @return number of frames in directory
         """
-        try:
-            files = glob(os.path.join(path,'*.rd'))
-        except OSError as err:
-            logger.warning('OSError: %s',err)
-            return 0
-        
+        files = self._ready_files(path)
+        backup = self.backup_path and path != self.backup_path # move unsent files to backup_path
+        if self.send_windows is not None and not self.send_windows.is_open():
+            if path == self.backup_path:
+                return 0
+            fresh = self.send_windows.clock() - self.backlog_age
+            files = [file_name for file_name in files if file_key(file_name) >= fresh]
+            backup = False # backup_path is not sent before the window opens, keep fresh files in path
         if len(files) == 0:
             return 0
 
+        if self.workers > 1:
+            return self.__send_files_parallel(path, files, backup)
+
         count_frames = 0
         i = 0
         while i < len(files):
-            if(os.stat(files[i]).st_size==0):
-                logger.warning('Empty file. Removing')
-                os.remove(files[i])
-                i += 1
-                continue
-
+            batch = []
             try:
-                count = self.__post_file(files[i])
+                batch, next_i = self._next_batch(files, i)
+                if not batch:  # remaining files were empty
+                    i = next_i
+                    break
+                count = self.__post_batch(batch)
+                if count:
+                    for file_name in batch:
+                        self._commit_file(file_name)
             except Exception as e:
                 logger.warning('Sender __send_file error on %s: %s',files[i],e)
                 count=0
-            
+
             if count:
-                i += 1
+                i = next_i
                 count_frames += count
             else:
+                if batch:
+                    i = files.index(batch[0])
                 break
 
         # on post error we did not run to the end
         # move files to backup_path
-        if self.backup_path and path != self.backup_path:
-            while i < len(files):        
-                logger.debug('moving %s to backup_path',files[i])
+        if backup:
+            self._move_to_backup(files[i:])
+
+        return count_frames
+
+    def __send_files_parallel(self, path, files, backup):
+        """Sends all files within one directory with several posts in flight.
+        Files are read and committed in order by the calling thread. The first failed
+        post stops further dispatches, posts not yet started are cancelled. Posts
+        already running are waited for and their files committed if they succeeded,
+        so no file is moved or sent again while a worker still reads it.
+        @param path: path in file system
+        @param files: list of queue files, oldest first
+        @param backup: if set to true unsent files are moved to backup_path
+        @return number of frames in directory
+        """
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.workers)
+        count_frames = 0
+        in_flight = deque()
+        i = 0 # next file to read
+        unsent = None # first file not committed after a failure
+        committed = set() # files committed behind the failure
+        while True:
+            while unsent is None and i < len(files) and len(in_flight) < self.max_in_flight:
                 try:
-                    move(files[i], files[i].replace(self.path,self.backup_path))
-                except OSError as err:
-                    logger.warning('OSError: %s',err)
-                i += 1
+                    batch, next_i = self._next_batch(files, i)
+                except Exception as e:
+                    logger.warning('Sender __send_file error on %s: %s',files[i],e)
+                    unsent = i
+                    break
+                i = next_i
+                if not batch:  # remaining files were empty
+                    break
+                in_flight.append((batch, self.__executor.submit(self.__post_batch, batch)))
+            if not in_flight:
+                break
+
+            batch, future = in_flight.popleft()
+            if unsent is not None and future.cancelled():
+                continue
+            try:
+                count = future.result()
+                if count:
+                    for file_name in batch:
+                        self._commit_file(file_name)
+                        if unsent is not None:
+                            committed.add(file_name)
+            except Exception as e:
+                logger.warning('Sender __send_file error on %s: %s',batch[0],e)
+                count=0
+            if count:
+                count_frames += count
+            elif unsent is None:
+                unsent = files.index(batch[0])
+                for batch, future in in_flight:
+                    future.cancel()
+                # posts already running are waited for in the next loops
+
+        if unsent is None:
+            unsent = i
+        # on post error we did not run to the end
+        # move files to backup_path
+        if backup:
+            self._move_to_backup([file_name for file_name in files[unsent:] if file_name not in committed])
 
         return count_frames
-    
-    def __post_file(self, file_name):
-        """Reads one file and tries to send its content to the gateway.
+
+    def _next_batch(self, files, i):
+        """Selects consecutive files until the frame or byte budget of one post is reached.
+        The budget is checked against the file sizes and frame counts estimated with
+        QueueFile.estimate_frames(), files are only read when the body is encoded.
+        Empty files are removed, files without frames are discarded. The first file
+        with frames is always taken, even if it exceeds the budget on its own.
+        @param files: list of queue files, oldest first
+        @param i: index of the first file to read
+        @return list of files in the batch and index of the next file
+        """
+        batch = []
+        frames = 0
+        size = 0
+        while i < len(files):
+            file_name = files[i]
+            try:
+                file_size = os.stat(file_name).st_size
+            except FileNotFoundError:
+                logger.warning('File %s has gone', file_name)
+                self._forget(file_name)
+                i += 1
+                continue
+            if file_size==0:
+                logger.warning('Empty file. Removing')
+                os.remove(file_name)
+                self._forget(file_name)
+                i += 1
+                continue
+            if os.path.exists(file_name + CHECKPOINT_ENDING):  # partially sent, posted on its own
+                if not batch:
+                    batch.append(file_name)
+                    i += 1
+                break
+            with QueueFile(file_name) as current_file:
+                file_frames = current_file.estimate_frames()
+                footer = current_file.footer()
+            if footer is not None and footer['frames']==0:  # finished version 2 file without records
+                logger.warning('Empty file. Removing')
+                os.remove(file_name)
+                remove_checkpoint(file_name)
+                self._forget(file_name)
+                i += 1
+                continue
+            if file_frames==0:
+                self._discard_file(file_name)
+                i += 1
+                continue
+            file_size *= 2  # approximate size of the form-encoded frames
+            if batch and (frames + file_frames > self.max_post_frames
+                          or size + file_size > self.max_post_bytes):
+                break
+            batch.append(file_name)
+            frames += file_frames
+            size += file_size
+            i += 1
+        return batch, i
+
+    def __post_batch(self, batch):
+        """Tries to send the frames of a batch of files to the gateway.
         uses the requests library!!
-        On success the file is deleted or renamed to *.bak ending.
-        @return number of successfully posted frames in one file
-        """
-        current_file = open(file_name, 'rb')  # opens oldest file
-        data={'sender': self.name}
-        frames=[]
-        timestamp = current_file.read(8)
-        while timestamp:  # until end of file
-            timestamp = unpack('<d', timestamp)[0]
-            frame_length = unpack('<h', current_file.read(2))[0]
-            frame = current_file.read(frame_length)
-            if frame:
-                if self.absolute_time:  # Timestamp Frame
-                    # millisecond resolution from 1970-01-01
-                    wrapper_frame = BayEOSFrame.factory(0xc)
-
-                else:  # Delayed Frame
-                    wrapper_frame = BayEOSFrame.factory(0x7)
-                wrapper_frame.create(frame, timestamp)
-                frames.append(base64.b64encode(wrapper_frame.frame))
-            timestamp = current_file.read(8)
-            if len(timestamp)<8:
-               timestamp=''
-        current_file.close()
-        backup_file_name = file_name.replace('.rd', '.bak')
-        if self.backup_path:
-            backup_file_name.replace(self.path, self.backup_path)
-        if len(frames)==0:
-            move(file_name, backup_file_name)
-            logger.warning('No frames in file. Move to %s',backup_file_name)
-            return 0
-        
-        data['bayeosframes[]']=frames
-        headers={'user-agent': 'BayEOS-Python-Gateway-Client/0.4.3'}
+        A single file is posted in parts (see checkpoints), other batches larger than
+        max_post_bytes are streamed with chunked transfer encoding.
+        @param batch: list of queue files
+        @return number of successfully posted frames
+        """
+        if self.checkpoints and len(batch) == 1:
+            return self.__post_parts(batch[0])
+        counts = {'frames': 0}
+        if self.stream_posts and self.mode != 'fanout' and \
+                sum(os.path.getsize(f) for f in batch) * 2 > self.max_post_bytes:
+            headers = {'Content-Type': FORM_CONTENT_TYPE}
+            if self.compression:
+                headers['Content-Encoding'] = self.compression
+            posted = self.__deliver(lambda: self.__stream_body(batch, counts), headers, counts)
+        else:
+            body, headers, counts = self._encode_body(batch)
+            posted = self.__deliver(body, headers, counts)
+        if posted: # all fine!
+            self._record_latency(counts)
+            return counts['frames']
+        return 0
+
+    def __deliver(self, data, headers, counts):
+        """Posts a request body to the current url (failover) or all available urls (fanout).
+        @param data: request body or function returning a new body iterator, see _post()
+        @param headers: dictionary of additional headers
+        @param counts: counts of _iter_body()
+        @return True if the gateway, in fanout mode a quorum of gateways, accepted the post
+        """
+        endpoints = self.__active
+        if self.frame_bucket is not None and not callable(data):
+            self.frame_bucket.consume(counts['frames'])
+        if self.mode == 'fanout' and len(endpoints) > 1:
+            if self.__fanout_executor is None:
+                self.__fanout_executor = ThreadPoolExecutor(max_workers=len(self.endpoints) * self.workers)
+            futures = [self.__fanout_executor.submit(self.__post_to, endpoint, data, headers, counts)
+                       for endpoint in endpoints]
+            accepted = sum(1 for future in futures if future.result())
+            if accepted < self.quorum:
+                logger.warning('sender __post accepted by %s of %s gateways, quorum is %s',
+                               accepted, len(endpoints), self.quorum)
+            return accepted >= self.quorum
+        return self.__post_to(endpoints[0], data, headers, counts)
+
+    def __post_to(self, endpoint, data, headers, counts):
+        """Posts to one url and records the result.
+        @return True if the post was accepted
+        """
+        if callable(data):
+            if self.byte_bucket is not None or self.frame_bucket is not None:
+                stream = data
+                data = lambda: self.__shape(stream(), counts)
+        elif self.byte_bucket is not None:
+            body = data
+            data = lambda: ShapedBody(body, self.byte_bucket)
+        start = time()
+        status_code = self._post(data, url=endpoint.url, headers=headers)
+        endpoint.record(status_code, time() - start, counts['frames'])
+        return status_code == 200
+
+    def __shape(self, chunks, counts):
+        """Passes the chunks of a streamed body at the rate of the token buckets,
+        in pieces of at most SHAPE_CHUNK_SIZE bytes."""
+        frames = 0
+        for chunk in chunks:
+            if self.byte_bucket is not None and len(chunk) > SHAPE_CHUNK_SIZE:
+                for start in range(0, len(chunk) - SHAPE_CHUNK_SIZE, SHAPE_CHUNK_SIZE):
+                    self.byte_bucket.consume(SHAPE_CHUNK_SIZE)
+                    yield chunk[start:start + SHAPE_CHUNK_SIZE]
+                chunk = chunk[start + SHAPE_CHUNK_SIZE:]
+            if self.byte_bucket is not None:
+                self.byte_bucket.consume(len(chunk))
+            if self.frame_bucket is not None:
+                self.frame_bucket.consume(counts['frames'] - frames)
+                frames = counts['frames']
+            yield chunk
+
+    def __post_parts(self, file_name):
+        """Posts a large file in parts of at most max_post_frames frames and max_post_bytes bytes.
+        After every acknowledged part the offset of the next record is stored in a checkpoint file,
+        so after a failure or restart sending resumes there.
+        @param file_name: queue file
+        @return number of successfully posted frames, 0 unless the whole file was sent
+        """
+        offset = read_checkpoint(file_name)
+        frames = 0
+        while True:
+            body, headers, counts = self._encode_body([file_name], offset, True)
+            if not self.__deliver(body, headers, counts):
+                return 0
+            self._record_latency(counts)
+            frames += counts['frames']
+            if counts['complete']:
+                return frames
+            offset = counts['end']
+            write_checkpoint(file_name, offset)
+            logger.debug('Sent %s of %s bytes of %s', offset, os.path.getsize(file_name), file_name)
+
+    @property
+    def session(self):
+        """requests.Session with keep-alive connections to the gateway."""
+        with self.__lock:
+            if self.__session is None:
+                self.__session = self.__new_session()
+            return self.__session
+
+    def __new_session(self):
+        """Creates a requests.Session with a connection pool for pool_size or workers connections."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=max(self.pool_size, self.workers),
+                              max_retries=Retry(total=self.retries, connect=self.retries, read=0,
+                                                status=0, redirect=0, backoff_factor=0.5))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.auth = (self.user, self.password)
+        session.headers.update(self.headers)
+        return session
+
+    def _post(self, data, url=None, **kwargs):
+        """Posts a request to the gateway over the keep-alive session.
+        Connections the gateway closed while idle are replaced by the connection pool,
+        failed connects are retried retries times there. After a connection error the
+        session is renewed for the next post.
+        @param data: request body, dictionary to form-encode or function returning a new body
+        @param url: gateway url, the primary url if None
+        @param kwargs: further arguments of requests.Session.post
+        @return HTTP status code or 0 on connection errors
+        """
+        session = self.session
         try:
-            r=requests.post(self.url,data=data,auth=(self.user, self.password),headers=headers, timeout=10)
-#            r.raise_for_status()
-        except requests.exceptions.RequestException as e:  
+            r = session.post(url or self.url, data=data() if callable(data) else data,
+                             timeout=self.timeout, **kwargs)
+            self.__count('posts')
+            return r.status_code
+        except requests.exceptions.ConnectionError as e:
+            self.__count('post_errors')
+            logger.warning('sender __post error:%s',e)
+            self.__reset_session(session)
+        except requests.exceptions.RequestException as e:
+            self.__count('post_errors')
             logger.warning('sender __post error:%s',e)
-            return 0
-        
-        if r.status_code==200: # all fine!
-            if self.remove:
-                os.remove(file_name)
-            else:
-                move(file_name, backup_file_name)
-            return len(frames)
-        
-        logger.warning('sender __post error code:%s' ,r.status_code)
-        
         return 0
+
+    def __count(self, key, value=1):
+        with self.__lock:
+            self.counters[key] += value
+
+    def _iter_body(self, files, counts, offset=None, limit=False):
+        """Generates the form-encoded request body of the frames in files in one pass.
+        Records are wrapped in Timestamp or Delayed Frames and encoded by a WrapperEncoder,
+        which is flushed in chunks of at most about BODY_CHUNK_SIZE bytes.
+        @param files: list of queue files
+        @param counts: dictionary, frames and bytes are added to 'frames' and 'bytes',
+        the timestamps of the last LATENCY_SAMPLES frames are kept in 'timestamps',
+        'end' is set to the end of the last record read and 'complete' whether all records were read
+        @param offset: position of the first record in the first file, its checkpoint if None
+        @param limit: if set to true reading stops at max_post_frames frames or max_post_bytes bytes
+        @return iterator of bytes
+        """
+        timestamps = counts.setdefault('timestamps', deque(maxlen=LATENCY_SAMPLES))
+        head = urlencode({'sender': self.name}).encode('ascii')
+        counts['bytes'] = counts.get('bytes', 0) + len(head)
+        yield head
+        # Timestamp Frame with millisecond resolution from 1970-01-01 or Delayed Frame
+        encoder = WrapperEncoder(self.absolute_time, FRAME_FIELD)
+        max_frames = self.max_post_frames if limit else float('inf')
+        max_bytes = self.max_post_bytes if limit else float('inf')
+        counts['complete'] = True
+        for file_name in files:
+            with QueueFile(file_name) as current_file:  # opens oldest file
+                if file_name == files[0]:
+                    current_file.seek(read_checkpoint(file_name) if offset is None else offset)
+                frames = 0
+                max_file_frames = max_frames - counts['frames']
+                records = iter(current_file)
+                while True:
+                    # encoder.size is an upper bound, the exact size is known after a flush
+                    max_size = min(3 * BODY_CHUNK_SIZE, max_bytes - counts['bytes'])
+                    frames += encoder.extend(records, max_file_frames - frames, max_size, timestamps)
+                    end = current_file.end
+                    if frames < max_file_frames and encoder.size < max_size:
+                        break  # all records read
+                    if encoder.size >= max_size and encoder.size:
+                        chunk = encoder.flush()
+                        counts['bytes'] += len(chunk)
+                        yield chunk
+                    if frames >= max_file_frames or counts['bytes'] >= max_bytes:
+                        if next(records, None) is not None:
+                            counts['complete'] = False  # record is left for the next part
+                        break
+                if current_file.truncated:
+                    logger.warning('Truncated or corrupt record in %s after %s frames', file_name, frames)
+                counts['frames'] += frames
+                counts['end'] = end
+            if not counts['complete']:
+                break
+        chunk = encoder.flush()
+        if chunk:
+            counts['bytes'] += len(chunk)
+            yield chunk
+
+    def _encode_body(self, files, offset=None, limit=False):
+        """Form-encodes the frames in files and compresses the request body if it exceeds compression_threshold.
+        @param files: list of queue files
+        @param offset: position of the first record in the first file, see _iter_body()
+        @param limit: if set to true only the frames fitting into one post are encoded
+        @return request body as bytes, dictionary of additional headers and counts of _iter_body()
+        """
+        counts = {'frames': 0}
+        body = b''.join(self._iter_body(files, counts, offset, limit))
+        headers = {'Content-Type': FORM_CONTENT_TYPE}
+        size = len(body)
+        if self.compression and size >= self.compression_threshold:
+            cpu_time = thread_time()
+            compressor = self.__compressor()
+            body = compressor.compress(body) + compressor.flush()
+            cpu_time = thread_time() - cpu_time
+            headers['Content-Encoding'] = self.compression
+            self.__count('compress_time', cpu_time)
+            logger.debug('Compressed post from %d to %d bytes in %.4f s', size, len(body), cpu_time)
+        self.__count('bytes', size)
+        self.__count('bytes_sent', len(body))
+        return body, headers, counts
+
+    def __stream_body(self, files, counts):
+        """Generates the (compressed) request body of a streamed post, see _iter_body()."""
+        counts['frames'] = counts['bytes'] = 0
+        counts.pop('timestamps', None)
+        compressor = self.__compressor() if self.compression else None
+        sent = 0
+        cpu_time = 0.0
+        try:
+            for chunk in self._iter_body(files, counts):
+                if compressor is not None:
+                    start = thread_time()
+                    chunk = compressor.compress(chunk)
+                    cpu_time += thread_time() - start
+                if chunk:
+                    sent += len(chunk)
+                    yield chunk
+            if compressor is not None:
+                chunk = compressor.flush()
+                sent += len(chunk)
+                yield chunk
+        finally:
+            self.__count('bytes', counts['bytes'])
+            self.__count('bytes_sent', sent)
+            self.__count('compress_time', cpu_time)
+
+    def __compressor(self):
+        return zlib.compressobj(self.compression_level, zlib.DEFLATED, COMPRESSION_WBITS[self.compression])
+
+    def __reset_session(self, session):
+        """Closes a failed session unless another worker already renewed it."""
+        with self.__lock:
+            if self.__session is session:
+                self.__close_session()
+                self.counters['session_resets'] += 1
+
+    def close(self):
+        """Closes the keep-alive connections to the gateway, stops the upload workers and directory watches."""
+        for index in self.queue_indexes.values():
+            if not index.fed:
+                index.close()
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+        if self.__fanout_executor is not None:
+            self.__fanout_executor.shutdown()
+            self.__fanout_executor = None
+        self.__close_session()
+
+    def __close_session(self):
+        with self.__lock:
+            if self.__session is not None:
+                self.counters['connections'] += self.__pool_connections()
+                self.__session.close()
+                self.__session = None
+
+    def __pool_connections(self):
+        """Number of connections opened by the current session."""
+        connections = 0
+        if self.__session is not None:
+            for adapter in set(self.__session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+        return connections
+
+    def connection_stats(self):
+        """Returns counters of the gateway connections.
+        @return dictionary with posts, failed posts, opened connections, reused connections, session resets,
+        form-encoded and sent bytes, CPU time spent on compression and frames accepted by the gateway
+        """
+        with self.__lock:
+            res = dict(self.counters)
+            res['connections'] += self.__pool_connections()
+        res['reused'] = max(res['posts'] - res['connections'], 0)
+        return res
+
+    def backlog(self):
+        """Counts the files waiting in path and backup_path without reading them.
+        @return dictionary of directory ('path', 'backup_path') and (number of files, bytes) tuples
+        """
+        res = {}
+        for key, path in (('path', self.path), ('backup_path', self.backup_path)):
+            if not path:
+                continue
+            files = size = 0
+            try:
+                for entry in os.scandir(path):
+                    if entry.name.endswith('.rd'):
+                        try:
+                            size += entry.stat().st_size
+                        except OSError:  # sent meanwhile
+                            continue
+                        files += 1
+            except OSError as err:
+                logger.warning('OSError: %s', err)
+            res[key] = (files, size)
+        return res
+
+    def metrics(self):
+        """Returns the metrics of the sender, see MetricsRegistry.
+        @return list of Metric tuples
+        """
+        stats = self.connection_stats()
+        res = [Metric('sender_posts_total', 'counter', 'Posts answered by a gateway.', {}, stats['posts']),
+               Metric('sender_post_errors_total', 'counter', 'Posts failed with a connection error.', {},
+                      stats['post_errors']),
+               Metric('sender_frames_total', 'counter', 'Frames accepted by the gateway.', {}, stats['frames']),
+               Metric('sender_bytes_total', 'counter', 'Form-encoded bytes of posts.', {}, stats['bytes']),
+               Metric('sender_sent_bytes_total', 'counter', 'Bytes of request bodies after compression.', {},
+                      stats['bytes_sent']),
+               Metric('sender_connections_total', 'counter', 'Opened gateway connections.', {},
+                      stats['connections'])]
+        for endpoint in self.endpoints:
+            labels = {'url': endpoint.url}
+            with endpoint.lock:
+                status_codes = sorted(endpoint.status_codes.items())
+            for status_code, count in status_codes:
+                res.append(Metric('sender_responses_total', 'counter',
+                                  'Posts per HTTP status code, 0 for connection errors.',
+                                  dict(labels, code=str(status_code)), count))
+            res.append(Metric('sender_post_seconds', 'histogram', 'Duration of posts.', labels,
+                              endpoint.post_latency.snapshot()))
+            res.append(Metric('sender_circuit_open', 'gauge', 'Posts suspended for the url (1) or not (0).',
+                              labels, int(endpoint.breaker.state == CircuitBreaker.OPEN)))
+        for directory, (files, size) in sorted(self.backlog().items()):
+            labels = {'directory': directory}
+            res.append(Metric('sender_backlog_files', 'gauge', 'Queue files waiting to be sent.', labels, files))
+            res.append(Metric('sender_backlog_bytes', 'gauge', 'Size of queue files waiting to be sent.', labels,
+                              size))
+        return res
+
+    def _ready_files(self, path):
+        """Lists the files ready for sending within one directory, oldest first.
+        @param path: path in file system
+        @return list of file names
+        """
+        index = self.queue_indexes.get(path)
+        if index is None:
+            index = self.queue_indexes[path] = QueueIndex(path, self.watch)
+        try:
+            return index.refresh()
+        except OSError as err:
+            logger.warning('OSError: %s',err)
+            return []
+
+    def _backup_file_name(self, file_name):
+        """Name of a sent file if it is kept (remove is false).
+        @param file_name: queue file
+        """
+        backup_file_name = file_name.replace('.rd', '.bak')
+        if self.backup_path:
+            backup_file_name.replace(self.path, self.backup_path)
+        return backup_file_name
+
+    def _commit_file(self, file_name):
+        """Removes a successfully sent file or renames it to *.bak ending.
+        @param file_name: queue file
+        """
+        if self.remove:
+            os.remove(file_name)
+        else:
+            move(file_name, self._backup_file_name(file_name))
+        remove_checkpoint(file_name)
+        self._forget(file_name)
+
+    def _discard_file(self, file_name):
+        """Renames a file without frames to *.bak ending.
+        @param file_name: queue file
+        """
+        backup_file_name = self._backup_file_name(file_name)
+        move(file_name, backup_file_name)
+        remove_checkpoint(file_name)
+        self._forget(file_name)
+        logger.warning('No frames in file. Move to %s',backup_file_name)
+
+    def _move_to_backup(self, files):
+        """Moves unsent files to backup_path.
+        @param files: list of queue files in path
+        """
+        for file_name in files:
+            logger.debug('moving %s to backup_path',file_name)
+            try:
+                if os.path.exists(file_name + CHECKPOINT_ENDING):
+                    move(file_name + CHECKPOINT_ENDING,
+                         file_name.replace(self.path,self.backup_path) + CHECKPOINT_ENDING)
+                move(file_name, file_name.replace(self.path,self.backup_path))
+            except OSError as err:
+                logger.warning('OSError: %s',err)
+            self._forget(file_name)
+
+    def _record_latency(self, counts):
+        """Counts successfully posted frames and records their time from sample to post.
+        @param counts: counts of _iter_body()
+        """
+        now = time()
+        with self.__lock:
+            self.counters['frames'] += counts.get('frames', 0)
+            self.latencies.extend(now - timestamp for timestamp in counts.get('timestamps', ()))
+
+    def latency_percentiles(self, points=(50, 90, 99, 100)):
+        """Returns percentiles of the time from sample to post of the latest LATENCY_SAMPLES posted frames.
+        @param points: list of percentiles
+        @return dictionary of percentile and latency in seconds, empty if nothing was posted
+        """
+        with self.__lock:
+            latencies = list(self.latencies)
+        return percentiles(latencies, points)
+
+    def wait(self, timeout=DEFAULTS['sender_sleep_time']):
+        """Sleeps until the writer finished a file or timeout seconds have passed.
+        While the gateway is down, it sleeps until the next probe instead.
+        @param timeout: maximum time to wait in seconds
+        """
+        delay = min(endpoint.breaker.wait() for endpoint in self.endpoints)
+        index = self.queue_indexes.get(self.path)
+        if delay or index is None:
+            sleep(max(timeout, delay))
+        else:
+            index.wait(timeout)
+
+    def _forget(self, file_name):
+        """Removes a file from the index of its directory.
+        @param file_name: queue file that was sent, moved or deleted
+        """
+        index = self.queue_indexes.get(os.path.dirname(file_name))
+        if index is not None:
+            index.remove(file_name)
  
     def run(self, sleep_sec=DEFAULTS['sender_sleep_time']):
-        """Tries to send frames within a certain interval.
+        """Tries to send frames within a certain interval and as soon as the writer finished a file.
+        Small files in backup_path are compacted in the background.
         @param sleep_sec: specifies the sleep time
         """
+        self.__start_compactor()
         while True:
             try:
                 res = self.send()
@@ -384,7 +1992,7 @@ class BayEOSSender(object):
                 logger.warning('Exception:%s',err) 
             except:
                 logger.warning('Unknown exception in run()')
-            sleep(sleep_sec)
+            self.wait(sleep_sec)
     
     def run_thread(self,sleep_sec=DEFAULTS['sender_sleep_time']):
         """Starts a run thread. When this thread terminates it starts a new run thread
@@ -484,12 +2092,28 @@ class BayEOSGatewayClient(object):
             return self.options[key][self.name]
         return self.options[key]
 
+    def __get_options(self, keys):
+        """Collects options passed on to writer or sender.
+        @param keys: list of option keys
+        @return dictionary of option key and value
+        """
+        return dict((key, self.__get_option(key, DEFAULTS[key])) for key in keys)
+
     def __start_writer(self, path):
         """Instantiates a BayEOSWriter object and starts an endless loop for data acquisition."""
+        self.__create_writer(path)
+        self.__acquire_data()
+
+    def __create_writer(self, path):
+        """Instantiates a BayEOSWriter object."""
         self.init_writer()
         self.writer = BayEOSWriter(path, self.__get_option('max_chunk'),
-                                    self.__get_option('max_time'))
+                                    self.__get_option('max_time'),
+                                    **self.__get_options(WRITER_OPTIONS))
         print('Started writer for ' + self.name + ' with pid ' + str(os.getpid()))
+
+    def __acquire_data(self):
+        """Endless loop for data acquisition."""
         self.writer.save_msg('Started writer for ' + self.name)
         while True:
             data = self.read_data()
@@ -497,29 +2121,35 @@ class BayEOSGatewayClient(object):
                 self.save_data(data)
             sleep(self.__get_option('writer_sleep_time'))
 
-    def __start_sender(self, path):
-        """Instantiates a BayEOSSender object and starts an endless loop for frame sending."""
+    def __start_sender(self, path, queue_index=None):
+        """Instantiates a BayEOSSender object and starts an endless loop for frame sending.
+        @param queue_index: QueueIndex of a writer in the same process, see BayEOSSender
+        """
         self.sender = BayEOSSender(path,
                                    self.__get_option('sender'),
                                    self.__get_option('url'),
                                    self.__get_option('bayeosgateway_password'),
                                    self.__get_option('bayeosgateway_user'),
                                    self.__get_option('absolute_time'),
-                                   self.__get_option('remove'))
+                                   self.__get_option('remove'),
+                                   queue_index=queue_index,
+                                   **self.__get_options(SENDER_OPTIONS))
         print('Started sender for ' + self.name + ' with pid ' + str(os.getpid()))
         while True:
             self.sender.send()
-            sleep(self.__get_option('sender_sleep_time'))
+            self.sender.wait(self.__get_option('sender_sleep_time'))
 
     def __start_sender_writer_pair(self, path, thread=True):
         """Creates a sender-writer pair.
-        @param thread: if True sender runs in a thread
+        @param thread: if True sender runs in a thread and shares the queue index of the writer
         """
         if thread:
-            Thread(target=self.__start_sender, args=(path,)).start()
+            self.__create_writer(path)
+            Thread(target=self.__start_sender, args=(path, self.writer.queue_index)).start()
         else:
             Process(target=self.__start_sender, args=(path,)).start()
-        self.__start_writer(path)
+            self.__create_writer(path)
+        self.__acquire_data()
 
     def run(self, pair=True, thread=True):
         """Runs the BayEOSGatewayClient.
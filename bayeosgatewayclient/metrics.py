@@ -0,0 +1,226 @@
+"""Runtime metrics of BayEOSWriter and BayEOSSender.
+
+Writers and senders keep their counters and latency histograms anyway. A
+MetricsRegistry only reads them when it is queried, so registering a writer or
+sender adds no work to saving or sending. Metrics can be queried in-process
+with get() or exported in the Prometheus text format, e.g. to a file in the
+textfile collector directory of node_exporter.
+"""
+
+import os
+import logging
+import tempfile
+from bisect import bisect_left
+from collections import namedtuple
+from threading import Thread, Lock, Event
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds, from 50 microseconds (save of a single frame) to 10 seconds (slow post)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Metric = namedtuple('Metric', 'name type help labels value')
+Metric.__doc__ = """Sample of a metric. type is 'counter', 'gauge' or 'histogram', labels a dictionary,
+value a number or for histograms a dictionary with cumulative 'buckets', 'sum' and 'count'."""
+
+
+class Histogram(object):
+    """Thread safe histogram with fixed buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Creates a Histogram.
+        @param buckets: ascending upper bounds of the buckets, a bucket for larger values is added
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = Lock()
+
+    def observe(self, value):
+        """Adds a value.
+        @param value: e.g. latency in seconds
+        """
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """@return dictionary with list of (upper bound, cumulative count) tuples as 'buckets',
+        the last bound is float('inf'), 'sum' and 'count' of the values"""
+        with self.lock:
+            counts = list(self.counts)
+            res = {'sum': self.sum, 'count': self.count}
+        cumulative = 0
+        res['buckets'] = []
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            res['buckets'].append((bound, cumulative))
+        return res
+
+
+def merge_snapshots(snapshots):
+    """Adds up histogram snapshots with equal buckets.
+    @param snapshots: list of Histogram.snapshot() results
+    @return merged snapshot
+    """
+    res = {'sum': 0.0, 'count': 0, 'buckets': None}
+    for snapshot in snapshots:
+        res['sum'] += snapshot['sum']
+        res['count'] += snapshot['count']
+        if res['buckets'] is None:
+            res['buckets'] = list(snapshot['buckets'])
+        else:
+            res['buckets'] = [(bound, count + other) for (bound, count), (_, other)
+                              in zip(res['buckets'], snapshot['buckets'])]
+    if res['buckets'] is None:
+        res['buckets'] = []
+    return res
+
+
+class MetricsRegistry(object):
+    """Collects the metrics of registered writers, senders and further sources."""
+
+    def __init__(self, prefix='bayeos_'):
+        """Creates a MetricsRegistry.
+        @param prefix: put before every metric name in the export
+        """
+        self.prefix = prefix
+        self.__sources = []
+        self.__lock = Lock()
+        self.__stop = None
+
+    def register(self, source, **labels):
+        """Registers a source of metrics.
+        @param source: object with a metrics() method returning a list of Metric tuples,
+        e.g. a BayEOSWriter or BayEOSSender
+        @param labels: labels added to all metrics of the source, e.g. device='Fifo.0'
+        """
+        with self.__lock:
+            self.__sources.append((source, labels))
+
+    def unregister(self, source):
+        """Removes a source registered before."""
+        with self.__lock:
+            self.__sources = [(s, labels) for s, labels in self.__sources if s is not source]
+
+    def collect(self):
+        """Reads the metrics of all sources.
+        @return list of Metric tuples, source labels are added to the labels of every metric
+        """
+        with self.__lock:
+            sources = list(self.__sources)
+        res = []
+        for source, labels in sources:
+            try:
+                metrics = source.metrics()
+            except Exception as err:
+                logger.warning('Metrics of %s failed: %s', source, err)
+                continue
+            for metric in metrics:
+                if labels:
+                    metric = metric._replace(labels=dict(labels, **metric.labels))
+                res.append(metric)
+        return res
+
+    def get(self, name, **labels):
+        """Queries a metric in-process.
+        @param name: metric name without prefix e.g. 'sender_frames_total'
+        @param labels: only series with these label values are considered
+        @return sum of the matching series, for histograms a merged snapshot, None if there is none
+        """
+        matches = [metric for metric in self.collect() if metric.name == name and
+                   all(metric.labels.get(key) == value for key, value in labels.items())]
+        if not matches:
+            return None
+        if matches[0].type == 'histogram':
+            return merge_snapshots([metric.value for metric in matches])
+        return sum(metric.value for metric in matches)
+
+    def exposition(self):
+        """Formats all metrics in the Prometheus text format.
+        @return string
+        """
+        families = {}
+        for metric in self.collect():
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, metrics in families.items():
+            name = self.prefix + name
+            lines.append('# HELP %s %s' % (name, metrics[0].help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE %s %s' % (name, metrics[0].type))
+            for metric in metrics:
+                if metric.type != 'histogram':
+                    lines.append('%s%s %s' % (name, format_labels(metric.labels), format_value(metric.value)))
+                    continue
+                for bound, count in metric.value['buckets']:
+                    labels = dict(metric.labels, le=format_value(bound))
+                    lines.append('%s_bucket%s %s' % (name, format_labels(labels), count))
+                lines.append('%s_sum%s %s' % (name, format_labels(metric.labels),
+                                              format_value(metric.value['sum'])))
+                lines.append('%s_count%s %s' % (name, format_labels(metric.labels), metric.value['count']))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, file_name):
+        """Writes all metrics to a file for the textfile collector of node_exporter.
+        The file is replaced atomically, so the collector never reads a partial file.
+        @param file_name: e.g. /var/lib/node_exporter/textfile_collector/bayeos.prom
+        """
+        directory = os.path.dirname(os.path.abspath(file_name))
+        fd, tmp_name = tempfile.mkstemp('.tmp', '.metrics-', directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.exposition())
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, file_name)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+
+    def start_textfile(self, file_name, interval=15):
+        """Starts a background thread writing the textfile every interval seconds.
+        @param file_name: see write_textfile()
+        @param interval: seconds between two writes
+        """
+        self.stop_textfile()
+        self.__stop = stop = Event()
+
+        def run():
+            while True:
+                try:
+                    self.write_textfile(file_name)
+                except OSError as err:
+                    logger.warning('Could not write metrics to %s: %s', file_name, err)
+                if stop.wait(interval):
+                    return
+
+        thread = Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def stop_textfile(self):
+        """Stops the thread started by start_textfile()."""
+        if self.__stop is not None:
+            self.__stop.set()
+            self.__stop = None
+
+
+def format_labels(labels):
+    """Formats labels as {name="value",...} with escaped values, an empty string if there are none."""
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                          .replace('\n', '\\n'))
+                             for key, value in sorted(labels.items()))
+
+
+def format_value(value):
+    """Formats a sample value, infinity as +Inf."""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, bool):
+        value = int(value)
+    return repr(value)
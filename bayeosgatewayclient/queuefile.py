@@ -0,0 +1,779 @@
+"""Reading and writing of BayEOSWriter queue files (.act, .rd, .bak).
+
+Version 1 files are a plain sequence of records:
+    record:  timestamp (<d), frame length (<h), frame
+
+Version 2 files (segments) start with a header, carry a varint length and a CRC32
+per record and end with an index footer once the writer has finished the file:
+    header:  magic (8 bytes), version (B), flags (B), creation time (<d)
+    record:  timestamp (<d), frame length (varint), frame, CRC32 of the preceding bytes (<I)
+    footer:  frames (<Q), first timestamp (<d), last timestamp (<d), end of records (<Q),
+             number of index entries (<I), offset of every INDEX_STRIDE-th record (<Q each)
+    trailer: footer length (<I), CRC32 of the footer (<I), end magic (8 bytes)
+The header magic read as a version 1 timestamp is about 5e-260, so both versions
+are told apart by the first eight bytes.
+"""
+
+import os
+import sys
+import mmap
+import ctypes
+import ctypes.util
+import logging
+import select
+import argparse
+import tempfile
+from bisect import insort, bisect_left
+from threading import RLock, Condition
+from time import strftime, localtime, time, sleep
+from struct import Struct, error as StructError
+from zlib import crc32
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = Struct('<dh')  # version 1 record header: timestamp and frame length
+
+V2_MAGIC = b'\x89BQF\r\n\x1a\n'
+V2_END_MAGIC = b'BQFINDEX'
+V2_HEADER = Struct('<8sBBd')
+V2_TIMESTAMP = Struct('<d')
+V2_CRC = Struct('<I')
+V2_FOOTER = Struct('<QddQI')
+V2_TRAILER = Struct('<II8s')
+V2_OFFSET = Struct('<Q')
+INDEX_STRIDE = 256
+
+COMPACT_JOURNAL = 'compact.journal'
+CHECKPOINT_ENDING = '.ckpt'
+CHECKPOINT = Struct('<Q')  # offset of the first record not yet acknowledged by the gateway
+
+INOTIFY_EVENT = Struct('iIII')  # watch descriptor, mask, cookie, name length
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+
+def encode_varint(value):
+    """Encodes an unsigned integer as LEB128 varint.
+    @param value: non negative integer
+    @return binary coded varint
+    """
+    res = bytearray()
+    while value > 0x7f:
+        res.append((value & 0x7f) | 0x80)
+        value >>= 7
+    res.append(value)
+    return bytes(res)
+
+
+def decode_varint(buffer, pos=0):
+    """Decodes a LEB128 varint.
+    @param buffer: binary data
+    @param pos: position of the varint in buffer
+    @return tuple of value and position after the varint
+    @raise IndexError: if buffer ends within the varint
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_record(timestamp, frame):
+    """Encodes a version 1 record.
+    @param timestamp: Unix epoch time stamp
+    @param frame: binary coded BayEOS Frame (at most 32767 bytes)
+    @return binary coded record
+    """
+    return RECORD_HEADER.pack(timestamp, len(frame)) + frame
+
+
+def encode_record_v2(timestamp, frame):
+    """Encodes a version 2 record.
+    @param timestamp: Unix epoch time stamp
+    @param frame: binary coded BayEOS Frame
+    @return binary coded record
+    """
+    record = V2_TIMESTAMP.pack(timestamp) + encode_varint(len(frame)) + frame
+    return record + V2_CRC.pack(crc32(record))
+
+
+def encode_header_v2(created):
+    """Encodes the header of a version 2 file.
+    @param created: Unix epoch time stamp of file creation
+    @return binary coded header
+    """
+    return V2_HEADER.pack(V2_MAGIC, 2, 0, created)
+
+
+class SegmentIndex(object):
+    """Collects frame count, time range and record offsets of a version 2 file
+    while it is written and encodes the index footer."""
+
+    def __init__(self):
+        self.frames = 0
+        self.first = 0.0
+        self.last = 0.0
+        self.offsets = []
+
+    def add(self, offset, timestamp):
+        """Registers a record.
+        @param offset: position of the record in the file
+        @param timestamp: Unix epoch time stamp of the record
+        """
+        if not self.frames:
+            self.first = timestamp
+        if self.frames % INDEX_STRIDE == 0:
+            self.offsets.append(offset)
+        self.frames += 1
+        self.last = timestamp
+
+    def footer(self, end):
+        """Encodes footer and trailer.
+        @param end: position after the last record
+        @return binary coded footer and trailer
+        """
+        footer = V2_FOOTER.pack(self.frames, self.first, self.last, end, len(self.offsets)) + \
+            b''.join(V2_OFFSET.pack(offset) for offset in self.offsets)
+        return footer + V2_TRAILER.pack(len(footer), crc32(footer), V2_END_MAGIC)
+
+
+class QueueFile(object):
+    """Reads a queue file of either version without copying.
+    The file is memory mapped, iterating yields (timestamp, frame) tuples where
+    frame is a memoryview into the mapping. Frames are only valid until the file
+    is closed, use bytes(frame) to keep them. Reading stops at the first truncated
+    or corrupt record, which is reported by the attribute truncated.
+    """
+
+    def __init__(self, file_name):
+        """Opens and maps a queue file.
+        @param file_name: path of the file
+        """
+        self.name = file_name
+        self.version = 1
+        self.start = 0
+        self.truncated = False
+        self.end = 0  # position after the last valid record read so far
+        self.__map = None
+        self.view = memoryview(b'')
+        with open(file_name, 'rb') as queue_file:
+            self.size = os.fstat(queue_file.fileno()).st_size
+            if self.size:
+                self.__map = mmap.mmap(queue_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.__map)
+        if self.size >= V2_HEADER.size and self.view[:8] == V2_MAGIC:
+            self.version = V2_HEADER.unpack_from(self.view)[1]
+            if self.version != 2:
+                logger.warning('Unknown queue file version %s: %s', self.version, file_name)
+            self.start = V2_HEADER.size
+        self.end = self.start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Releases the mapping. If frames are still referenced, the mapping
+        is closed as soon as they are garbage collected."""
+        self.view.release()
+        if self.__map is not None:
+            try:
+                self.__map.close()
+            except BufferError:
+                logger.debug('Frames of %s still referenced', self.name)
+            self.__map = None
+
+    def seek(self, offset):
+        """Continues reading at offset, which must be the start of a record
+        (e.g. end of a record read before).
+        @param offset: position in the file
+        """
+        self.end = min(max(offset, self.start), self.size)
+
+    def footer(self):
+        """Reads the index footer of a version 2 file.
+        @return dictionary with frames, first, last, end and offsets or None if the file has no valid footer
+        """
+        if self.version != 2 or self.size < self.start + V2_TRAILER.size:
+            return None
+        length, checksum, magic = V2_TRAILER.unpack_from(self.view, self.size - V2_TRAILER.size)
+        footer_start = self.size - V2_TRAILER.size - length
+        if magic != V2_END_MAGIC or length < V2_FOOTER.size or footer_start < self.start:
+            return None
+        footer = self.view[footer_start:footer_start + length]
+        if crc32(footer) != checksum:
+            return None
+        frames, first, last, end, entries = V2_FOOTER.unpack_from(footer)
+        if end != footer_start or V2_FOOTER.size + entries * V2_OFFSET.size != length:
+            return None
+        offsets = [V2_OFFSET.unpack_from(footer, V2_FOOTER.size + i * V2_OFFSET.size)[0]
+                   for i in range(entries)]
+        return {'frames': frames, 'first': first, 'last': last, 'end': end, 'offsets': offsets}
+
+    def __iter__(self):
+        if self.version == 2:
+            return self.__iter_v2()
+        return self.__iter_v1()
+
+    def __iter_v1(self):
+        view = self.view
+        size = self.size
+        unpack_header = RECORD_HEADER.unpack_from
+        pos = self.end
+        while pos < size:
+            if pos + RECORD_HEADER.size > size:
+                self.truncated = True
+                return
+            timestamp, frame_length = unpack_header(view, pos)
+            pos += RECORD_HEADER.size
+            if frame_length < 0 or pos + frame_length > size:
+                self.truncated = True
+                return
+            self.end = pos + frame_length
+            yield timestamp, view[pos:self.end]
+            pos = self.end
+
+    def __iter_v2(self):
+        view = self.view
+        footer = self.footer()
+        data_end = footer['end'] if footer else self.size
+        unpack_timestamp = V2_TIMESTAMP.unpack_from
+        unpack_crc = V2_CRC.unpack_from
+        pos = self.end
+        while pos < data_end:
+            try:
+                frame_length, frame_start = decode_varint(view, pos + V2_TIMESTAMP.size)
+            except IndexError:
+                self.truncated = True
+                return
+            frame_end = frame_start + frame_length
+            if frame_end + V2_CRC.size > data_end or \
+               crc32(view[pos:frame_end]) != unpack_crc(view, frame_end)[0]:
+                self.truncated = True
+                return
+            self.end = frame_end + V2_CRC.size
+            yield unpack_timestamp(view, pos)[0], view[frame_start:frame_end]
+            pos = self.end
+
+    def info(self):
+        """Summarizes the file. O(1) for finished version 2 files, otherwise all records are read.
+        @return dictionary with version, frames, first and last timestamp and complete flag
+        """
+        footer = self.footer()
+        if footer:
+            return {'version': self.version, 'frames': footer['frames'], 'first': footer['first'],
+                    'last': footer['last'], 'complete': True}
+        self.end = self.start
+        frames = 0
+        first = last = None
+        for timestamp, frame in self:
+            if first is None:
+                first = timestamp
+            last = timestamp
+            frames += 1
+        complete = not self.truncated and (self.version == 1 or self.end == self.size)
+        return {'version': self.version, 'frames': frames, 'first': first,
+                'last': last, 'complete': complete}
+
+
+    def estimate_frames(self):
+        """Estimates the number of frames without reading the file: exact from the footer of
+        finished version 2 files, otherwise the size divided by the size of the first record.
+        @return number of frames, 0 if the file has no valid record
+        """
+        footer = self.footer()
+        if footer:
+            return footer['frames']
+        self.end = self.start
+        for timestamp, frame in self:
+            return max(1, (self.size - self.start) // (self.end - self.start))
+        return 0
+
+
+def file_info(file_name):
+    """Summarizes a queue file, see QueueFile.info().
+    @param file_name: path of the file
+    @return dictionary with version, frames, first and last timestamp and complete flag
+    """
+    try:
+        with QueueFile(file_name) as queue_file:
+            return queue_file.info()
+    except (OSError, ValueError, StructError) as err:
+        logger.warning('Could not read %s: %s', file_name, err)
+        return None
+
+
+def file_key(file_name):
+    """Sort key of a queue file from the creation time embedded in its name
+    (<seconds>-<fraction>-<random>.<ending> as created by BayEOSWriter).
+    @param file_name: path or name of the file
+    @return creation time as float, infinity for names of another pattern
+    """
+    parts = os.path.basename(file_name).split('-', 2)
+    try:
+        return float(parts[0] + '.' + parts[1])
+    except (IndexError, ValueError):
+        return float('inf')
+
+
+class InotifyWatcher(object):
+    """Reports files renamed into or out of a directory and deleted files using
+    Linux inotify (through ctypes, no further dependencies).
+    """
+
+    def __init__(self, path):
+        """Starts watching a directory.
+        @param path: directory
+        @raise OSError if inotify is not available
+        """
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is not available on %s' % sys.platform)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        mask = IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+        if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, os.strerror(errno), path)
+        self.path = path
+        self.fd = fd
+
+    def fileno(self):
+        """File descriptor becoming readable on changes, e.g. for select()."""
+        return self.fd
+
+    def changes(self):
+        """Reads the pending events.
+        @return list of (name, added) tuples or None if the events were lost and the directory has to be read again
+        """
+        changes = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changes
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, pos)
+                pos += INOTIFY_EVENT.size
+                name = data[pos:pos + length].rstrip(b'\0')
+                pos += length
+                if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    return None
+                changes.append((os.fsdecode(name), bool(mask & IN_MOVED_TO)))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class PollWatcher(object):
+    """Fallback of InotifyWatcher: asks for a new scan whenever the modification
+    time of the directory changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__mtime = None
+
+    def fileno(self):
+        return None
+
+    def changes(self):
+        """@return empty list if the directory is unchanged, None if it has to be read again"""
+        stat = os.stat(self.path)
+        # a change within the timestamp granularity of the file system does not alter st_mtime
+        if stat.st_mtime_ns == self.__mtime and time() - stat.st_mtime > 2:
+            return []
+        self.__mtime = stat.st_mtime_ns
+        return None
+
+    def close(self):
+        return
+
+
+class QueueIndex(object):
+    """Ordered index of the files ready for sending (.rd) in one queue directory.
+    Files are sorted by the creation time embedded in their names, so they are
+    sent oldest first. The directory is read once with os.scandir, afterwards the
+    index is kept up to date by the writer of the same process (see fed), by
+    inotify events or, if inotify is not available, by a new scan whenever the
+    directory changed.
+    """
+
+    def __init__(self, path, watch=True):
+        """Creates an empty index, call scan() or refresh() to fill it.
+        @param path: queue directory
+        @param watch: if set to false refresh() reads the whole directory every time
+        """
+        self.path = path
+        self.lock = RLock()
+        self.fed = False  # set by a BayEOSWriter adding every file it finishes
+        self.watch = watch
+        self.watcher = None
+        self.scan_time = 0.0  # duration of the last scan in seconds
+        self.scanned = 0  # directory entries or events read by the last refresh
+        self.__ready = []
+        self.__names = set()
+        self.__dirty = True
+        self.__added = False
+        self.__condition = Condition(self.lock)
+
+    def scan(self):
+        """Reads the directory once and rebuilds the index.
+        @return list of .act files found
+        """
+        start = time()
+        ready = []
+        active = []
+        scanned = 0
+        for entry in os.scandir(self.path):
+            scanned += 1
+            if entry.name.endswith('.rd'):
+                ready.append((file_key(entry.name), entry.path))
+            elif entry.name.endswith('.act'):
+                active.append(entry.path)
+        ready.sort()
+        with self.lock:
+            self.__ready = ready
+            self.__names = set(file_name for key, file_name in ready)
+            self.__dirty = False
+        self.scanned = scanned
+        self.scan_time = time() - start
+        logger.debug('Scanned %s: %s entries, %s ready in %.3f s', self.path, scanned, len(ready), self.scan_time)
+        return active
+
+    def refresh(self):
+        """Updates the index and returns the ready files. The directory is read
+        completely only on the first call (unless already scanned, e.g. by
+        recover_queue()) and when the watcher lost track of it.
+        @return sorted list of file names
+        """
+        if self.fed and not self.__dirty:
+            self.scanned = 0
+            return self.files()
+        if self.watch and self.watcher is None:
+            self.watcher = self.__start_watcher()
+            self.__dirty = True  # files may have changed before the watch started
+        changes = self.watcher.changes() if self.watcher is not None else None
+        if changes is None or self.__dirty:
+            self.scan()
+        else:
+            self.scanned = len(changes)
+            for name, added in changes:
+                if name.endswith('.rd'):
+                    if added:
+                        self.add(os.path.join(self.path, name))
+                    else:
+                        self.remove(os.path.join(self.path, name))
+        if self.watcher is None:
+            self.__dirty = True
+        return self.files()
+
+    def __start_watcher(self):
+        try:
+            return InotifyWatcher(self.path)
+        except (OSError, AttributeError) as err:
+            logger.info('No inotify for %s (%s), polling the directory', self.path, err)
+            return PollWatcher(self.path)
+
+    def add(self, file_name):
+        """Adds a ready file.
+        @param file_name: path of the file
+        """
+        with self.lock:
+            if file_name not in self.__names:
+                self.__names.add(file_name)
+                insort(self.__ready, (file_key(file_name), file_name))
+                self.__added = True
+                self.__condition.notify_all()
+
+    def remove(self, file_name):
+        """Removes a sent, moved or deleted file.
+        @param file_name: path of the file
+        """
+        with self.lock:
+            if file_name in self.__names:
+                self.__names.discard(file_name)
+                item = (file_key(file_name), file_name)
+                del self.__ready[bisect_left(self.__ready, item)]
+
+    def wait(self, timeout):
+        """Waits for new ready files. A fed index is woken by the writer, otherwise
+        the inotify file descriptor is watched. Without inotify it just sleeps.
+        @param timeout: maximum time to wait in seconds
+        """
+        if self.fed:
+            with self.lock:
+                if not self.__added:
+                    self.__condition.wait(timeout)
+                self.__added = False
+            return
+        fd = self.watcher.fileno() if self.watcher is not None else None
+        if fd is None:
+            sleep(timeout)
+        else:
+            select.select([fd], [], [], timeout)
+
+    def files(self):
+        """@return sorted list of ready file names"""
+        with self.lock:
+            return [file_name for key, file_name in self.__ready]
+
+    def close(self):
+        """Stops watching the directory."""
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        self.__dirty = True
+
+    def __len__(self):
+        return len(self.__ready)
+
+
+def recover_file(file_name):
+    """Recovers an orphaned .act file of a writer that did not finish it.
+    Records are validated, a partial trailing record is cut off, a version 2
+    file gets its index footer and the file is renamed to .rd. Files without
+    valid records are removed.
+    @param file_name: path of the .act file
+    @return name of the .rd file or None if the file was removed
+    """
+    with QueueFile(file_name) as queue_file:
+        footer = queue_file.footer()
+        index = SegmentIndex()
+        offset = queue_file.start
+        if footer:
+            index.frames = footer['frames']
+        else:
+            for timestamp, frame in queue_file:
+                index.add(offset, timestamp)
+                offset = queue_file.end
+        version = queue_file.version
+        end = queue_file.end
+        size = queue_file.size
+    if not index.frames:
+        logger.warning('No valid records in %s. Removing', file_name)
+        os.remove(file_name)
+        return None
+    if not footer:
+        if end < size:
+            logger.warning('Cut off %s bytes of a partial record in %s', size - end, file_name)
+            os.truncate(file_name, end)
+        if version == 2:
+            with open(file_name, 'ab') as queue_file:
+                queue_file.write(index.footer(end))
+    ready_name = file_name[:-len('.act')] + '.rd'
+    os.rename(file_name, ready_name)
+    return ready_name
+
+
+def recover_queue(path):
+    """Builds the index of a queue directory and recovers orphaned .act files.
+    @param path: queue directory
+    @return QueueIndex of the ready files
+    """
+    start = time()
+    index = QueueIndex(path)
+    active = index.scan()
+    recovered = 0
+    for file_name in active:
+        try:
+            ready_name = recover_file(file_name)
+        except (OSError, ValueError) as err:
+            logger.warning('Could not recover %s: %s', file_name, err)
+            continue
+        if ready_name:
+            index.add(ready_name)
+            recovered += 1
+    logger.info('Queue %s: %s files ready, %s of %s .act files recovered, scan %.3f s, startup %.3f s',
+                path, len(index), recovered, len(active), index.scan_time, time() - start)
+    return index
+
+
+def read_checkpoint(file_name):
+    """Reads the checkpoint of a partially sent file.
+    @param file_name: queue file
+    @return offset of the first record not yet sent, 0 if there is no checkpoint
+    """
+    try:
+        with open(file_name + CHECKPOINT_ENDING, 'rb') as checkpoint:
+            return CHECKPOINT.unpack(checkpoint.read())[0]
+    except (OSError, StructError):
+        return 0
+
+
+def write_checkpoint(file_name, offset):
+    """Stores the checkpoint of a partially sent file atomically.
+    @param file_name: queue file
+    @param offset: offset of the first record not yet sent
+    """
+    checkpoint_name = file_name + CHECKPOINT_ENDING
+    with open(checkpoint_name + '.tmp', 'wb') as checkpoint:
+        checkpoint.write(CHECKPOINT.pack(offset))
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+    os.replace(checkpoint_name + '.tmp', checkpoint_name)
+
+
+def remove_checkpoint(file_name):
+    """Removes the checkpoint of a file if there is one.
+    @param file_name: queue file
+    """
+    try:
+        os.remove(file_name + CHECKPOINT_ENDING)
+    except FileNotFoundError:
+        pass
+
+
+def sync_dir(path):
+    """Flushes renames and removals in a directory to disk (no-op where directories cannot be opened)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def compact_files(files):
+    """Merges consecutive queue files of one directory into one version 2 segment.
+    The segment is named after the creation time of the first file, so it takes its
+    place in the order. A journal makes the replacement atomic: the segment is
+    written to a .tmp file and synced, then the journal is written, the segment
+    renamed to .rd and the merged files removed. recover_compaction() completes
+    or rolls back an interrupted run.
+    @param files: list of queue files, oldest first
+    @return name of the segment
+    """
+    path = os.path.dirname(files[0])
+    parts = os.path.basename(files[0]).split('-', 2)
+    fd, tmp_name = tempfile.mkstemp('.tmp', parts[0] + '-' + parts[1] + '-', path)
+    segment_name = tmp_name[:-len('.tmp')] + '.rd'
+    index = SegmentIndex()
+    try:
+        with os.fdopen(fd, 'wb') as segment:
+            segment.write(encode_header_v2(time()))
+            offset = V2_HEADER.size
+            for file_name in files:
+                with QueueFile(file_name) as queue_file:
+                    for timestamp, frame in queue_file:
+                        record = encode_record_v2(timestamp, frame)
+                        index.add(offset, timestamp)
+                        segment.write(record)
+                        offset += len(record)
+                    if queue_file.truncated:
+                        logger.warning('Truncated or corrupt record in %s, compacted %s bytes',
+                                       file_name, queue_file.end)
+            segment.write(index.footer(offset))
+            segment.flush()
+            os.fsync(segment.fileno())
+        journal_name = os.path.join(path, COMPACT_JOURNAL)
+        with open(journal_name + '.tmp', 'w') as journal:
+            journal.write('\n'.join([segment_name] + list(files)) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    os.rename(journal_name + '.tmp', journal_name)
+    os.rename(tmp_name, segment_name)
+    sync_dir(path)
+    for file_name in files:
+        os.remove(file_name)
+    sync_dir(path)
+    os.remove(journal_name)
+    logger.info('Compacted %s files with %s frames into %s', len(files), index.frames, segment_name)
+    return segment_name
+
+
+def recover_compaction(path):
+    """Completes or rolls back a compaction interrupted by a crash. If the
+    segment was renamed to .rd, the remaining merged files are removed, otherwise
+    the partial segment is removed and the files are kept.
+    @param path: queue directory
+    @return True if something was recovered
+    """
+    journal_name = os.path.join(path, COMPACT_JOURNAL)
+    recovered = False
+    if os.path.exists(journal_name):
+        with open(journal_name) as journal:
+            names = journal.read().split()
+        if names and os.path.exists(names[0]):
+            for file_name in names[1:]:
+                if os.path.exists(file_name):
+                    os.remove(file_name)
+            logger.warning('Completed interrupted compaction into %s', names[0])
+        else:
+            logger.warning('Rolled back interrupted compaction')
+        recovered = True
+    for entry in os.scandir(path):
+        if entry.name.endswith('.tmp'):  # unfinished segments and journals
+            os.remove(entry.path)
+            recovered = True
+    if recovered:
+        sync_dir(path)
+    if os.path.exists(journal_name):
+        os.remove(journal_name)
+    return recovered
+
+
+def main(argv=None):
+    """Command line tool to inspect queue files."""
+    from . bayeosframe import decode_frame
+    parser = argparse.ArgumentParser(description='Inspects BayEOSWriter queue files (.act, .rd, .bak).')
+    parser.add_argument('files', nargs='+', help='queue files')
+    parser.add_argument('-d', '--dump', action='store_true', help='print every record')
+    args = parser.parse_args(argv)
+    res = 0
+    for file_name in args.files:
+        try:
+            queue_file = QueueFile(file_name)
+        except (OSError, ValueError) as err:
+            print('%s: %s' % (file_name, err))
+            res = 1
+            continue
+        with queue_file:
+            if args.dump:
+                for timestamp, frame in queue_file:
+                    print('%s %5d %s' % (strftime('%Y-%m-%d %H:%M:%S', localtime(timestamp)),
+                                         len(frame), decode_frame(bytes(frame), timestamp=timestamp)))
+                queue_file.end = queue_file.start
+            info = queue_file.info()
+            if info['frames']:
+                time_range = '%s - %s' % (strftime('%Y-%m-%d %H:%M:%S', localtime(info['first'])),
+                                          strftime('%Y-%m-%d %H:%M:%S', localtime(info['last'])))
+            else:
+                time_range = '-'
+            print('%s: version %s, %s bytes, %s frames, %s%s' %
+                  (file_name, info['version'], queue_file.size, info['frames'], time_range,
+                   '' if info['complete'] else ', truncated after %s bytes' % queue_file.end))
+            if not info['complete']:
+                res = 1
+    return res
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""Compares parsing with the frame classes and decode_frame on a corpus of frames."""
+
+from timeit import timeit
+from bayeosgatewayclient import BayEOSFrame, decode_frame
+
+NUMBER = 20000
+
+def wrap(frame_type, *args):
+    wrapper_frame = BayEOSFrame.factory(frame_type)
+    wrapper_frame.create(*args)
+    return wrapper_frame.frame
+
+data_frame = BayEOSFrame.factory(0x1)
+data_frame.create([float(i) for i in range(10)], 0x41)
+labeled_frame = BayEOSFrame.factory(0x1)
+labeled_frame.create(dict(('channel%d' % i, float(i)) for i in range(10)), 0x61)
+message_frame = BayEOSFrame.factory(0x4)
+message_frame.create('Writer was started.')
+
+corpus = [('Data Frame', data_frame.frame),
+          ('Labeled Data Frame', labeled_frame.frame),
+          ('Timestamp(Data)', wrap(0xc, data_frame.frame, 1.7e9)),
+          ('Timestamp(Origin(Data))', wrap(0xc, wrap(0xb, 'Device', data_frame.frame), 1.7e9)),
+          ('Delayed(Routed(Checksum(Data)))',
+           wrap(0x7, wrap(0x6, 12, 34, wrap(0xf, data_frame.frame)), 1500)),
+          ('Origin(Message)', wrap(0xb, 'Device', message_frame.frame))]
+
+for name, frame in corpus:
+    def parse():
+        return BayEOSFrame.parse_frame(frame, {'origin': '', 'timestamp': 1.7e9}, False)
+
+    def decode():
+        return decode_frame(frame, timestamp=1.7e9)
+
+    assert repr(parse()) == repr(decode())
+    t_parse = timeit(parse, number=NUMBER)
+    t_decode = timeit(decode, number=NUMBER)
+    print('%-32s frame classes %7.0f frames/s, decode_frame %7.0f frames/s (x%.1f)' %
+          (name, NUMBER / t_parse, NUMBER / t_decode, t_parse / t_decode))
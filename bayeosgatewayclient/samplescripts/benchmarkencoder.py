@@ -0,0 +1,52 @@
+"""Compares wrapping queue records in frame objects with the WrapperEncoder."""
+
+import base64
+import shutil
+import tempfile
+from os import path
+from time import perf_counter
+from urllib.parse import urlencode
+from bayeosgatewayclient import BayEOSWriter, BayEOSSender, BayEOSFrame, QueueFile
+
+PATH = path.join(tempfile.gettempdir(), 'bayeos-benchmark-encoder')
+ROWS = 200000
+
+def frame_objects(files):
+    """Request body as built before: one TimestampFrame object and base64 string per record."""
+    body = bytearray(urlencode({'sender': 'benchmark'}).encode('ascii'))
+    for file_name in files:
+        with QueueFile(file_name) as queue_file:
+            for timestamp, frame in queue_file:
+                wrapper_frame = BayEOSFrame.factory(0xc)
+                wrapper_frame.create(frame, timestamp)
+                body += b'&bayeosframes%5B%5D='
+                body += base64.b64encode(wrapper_frame.frame).replace(b'+', b'%2B') \
+                    .replace(b'/', b'%2F').replace(b'=', b'%3D')
+    return bytes(body)
+
+def wrapper_encoder(files):
+    """Request body built by BayEOSSender with a WrapperEncoder."""
+    return sender._encode_body(files)[0]
+
+def read_only(files):
+    """Reading the queue file without encoding, for reference."""
+    count = 0
+    for file_name in files:
+        with QueueFile(file_name) as queue_file:
+            for timestamp, frame in queue_file:
+                count += 1
+    return count
+
+shutil.rmtree(PATH, True)
+writer = BayEOSWriter(PATH, max_chunk=1 << 30)
+writer.save_many([[i, 20.0 + i % 10, i * 0.5] for i in range(ROWS)])
+writer.close()
+sender = BayEOSSender(PATH, 'benchmark', 'http://localhost', log_level=30)
+files = sender._ready_files(sender.path)
+assert frame_objects(files) == wrapper_encoder(files)
+for encode in (read_only, frame_objects, wrapper_encoder):
+    start = perf_counter()
+    encode(files)
+    seconds = perf_counter() - start
+    print('%-15s %8.0f frames/s' % (encode.__name__, ROWS / seconds))
+shutil.rmtree(PATH, True)
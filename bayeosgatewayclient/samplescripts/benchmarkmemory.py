@@ -0,0 +1,47 @@
+"""Compares the peak memory of building a post in memory with streaming it."""
+
+import base64
+import shutil
+import tempfile
+import tracemalloc
+from os import path
+from urllib.parse import urlencode
+from bayeosgatewayclient import BayEOSWriter, BayEOSSender, BayEOSFrame, QueueFile
+
+PATH = path.join(tempfile.gettempdir(), 'bayeos-benchmark-memory')
+
+def frames_list(files):
+    """Request body as built before: list of base64 frames, urlencoded by requests."""
+    frames = []
+    for file_name in files:
+        with QueueFile(file_name) as queue_file:
+            for timestamp, frame in queue_file:
+                wrapper_frame = BayEOSFrame.factory(0xc)
+                wrapper_frame.create(frame, timestamp)
+                frames.append(base64.b64encode(wrapper_frame.frame))
+    return len(urlencode({'sender': 'benchmark', 'bayeosframes[]': frames}, doseq=True))
+
+def single_pass(files):
+    """Request body built in memory in one pass."""
+    return len(sender._encode_body(files)[0])
+
+def streamed(files):
+    """Request body handed to requests in chunks."""
+    return sum(len(chunk) for chunk in sender._iter_body(files, {'frames': 0}))
+
+for rows in (10000, 100000, 400000):
+    shutil.rmtree(PATH, True)
+    writer = BayEOSWriter(PATH, max_chunk=1 << 30)
+    writer.save_many([[i, 20.0 + i % 10, i * 0.5] for i in range(rows)])
+    writer.close()
+    sender = BayEOSSender(PATH, 'benchmark', 'http://localhost', log_level=30)
+    files = sender._ready_files(sender.path)
+    file_size = path.getsize(files[0])
+    for builder in (frames_list, single_pass, streamed):
+        tracemalloc.start()
+        size = builder(files)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('%7d frames, file %6.1f MB, body %6.1f MB, %-11s peak memory %7.1f MB (x%.1f)' %
+              (rows, file_size / 1e6, size / 1e6, builder.__name__, peak / 1e6, peak / file_size))
+shutil.rmtree(PATH, True)
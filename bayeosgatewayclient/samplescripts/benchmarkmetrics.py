@@ -0,0 +1,31 @@
+"""Measures the overhead of the save latency histogram and the cost of a metrics export."""
+
+import shutil
+import tempfile
+from os import path
+from timeit import timeit
+from bayeosgatewayclient import BayEOSWriter, BayEOSSender, MetricsRegistry, Histogram
+
+PATH = path.join(tempfile.gettempdir(), 'bayeos-benchmark-metrics')
+NUMBER = 50000
+
+histogram = Histogram()
+t_observe = timeit(lambda: histogram.observe(0.0003), number=NUMBER)
+print('Histogram.observe          %6.2f us' % (t_observe / NUMBER * 1e6))
+
+for metrics in (False, True):
+    shutil.rmtree(PATH, True)
+    writer = BayEOSWriter(PATH, max_chunk=1 << 30, flush_records=0, metrics=metrics)
+    t_save = timeit(lambda: writer.save([1, 2.5, 3.5]), number=NUMBER)
+    t_many = timeit(lambda: writer.save_many([[1, 2.5, 3.5]] * 100), number=NUMBER // 100)
+    writer.close()
+    print('metrics=%-5s save %6.2f us/call, save_many(100) %6.2f us/call' %
+          (metrics, t_save / NUMBER * 1e6, t_many / (NUMBER // 100) * 1e6))
+
+registry = MetricsRegistry()
+registry.register(writer, device='benchmark')
+registry.register(BayEOSSender(PATH, 'benchmark', 'http://localhost', log_level=30), device='benchmark')
+t_export = timeit(registry.exposition, number=100)
+print('MetricsRegistry.exposition %6.2f ms (%d lines)' %
+      (t_export / 100 * 1e3, registry.exposition().count('\n')))
+shutil.rmtree(PATH, True)
@@ -0,0 +1,26 @@
+"""Compares DataFrame.create with a precompiled FrameTemplate."""
+
+from timeit import timeit
+from bayeosgatewayclient import BayEOSFrame, FrameTemplate
+
+NUMBER = 20000
+
+for value_type, channels in [(0x41, 10), (0x41, 100), (0x01, 100), (0x61, 20)]:
+    if value_type == 0x61:
+        values = dict(('channel%d' % i, float(i)) for i in range(channels))
+    else:
+        values = [float(i) for i in range(channels)]
+
+    def create():
+        data_frame = BayEOSFrame.factory(0x1)
+        data_frame.create(values, value_type)
+        return data_frame.frame
+
+    template = FrameTemplate(list(values) if value_type == 0x61 else channels, value_type)
+    assert template.pack(values) == create()
+
+    t_create = timeit(create, number=NUMBER)
+    t_template = timeit(lambda: template.pack(values), number=NUMBER)
+    print('Value Type 0x%02x, %3d channels: DataFrame.create %6.0f frames/s, '
+          'FrameTemplate.pack %7.0f frames/s (x%.1f)' %
+          (value_type, channels, NUMBER / t_create, NUMBER / t_template, t_create / t_template))
@@ -0,0 +1,27 @@
+"""Drives many simulated devices with one asyncio event loop."""
+import asyncio
+import tempfile
+from os import path
+from random import random
+from bayeosgatewayclient import AsyncBayEOSWriter, AsyncBayEOSSender, StreamTransport
+
+DEVICES = 100
+URL = 'http://localhost/gateway/frame/saveFlat'
+
+async def device(nr, transport):
+    name = 'Python-Async-Device%d' % nr
+    device_path = path.join(tempfile.gettempdir(), name)
+    writer = AsyncBayEOSWriter(device_path, max_time=10)
+    sender = AsyncBayEOSSender(device_path, name, URL, transport=transport)
+    asyncio.ensure_future(sender.run(5))
+    await writer.save_msg('Writer was started.')
+    while True:
+        # e.g. poll a Modbus/TCP device here
+        await writer.save([nr, random()])
+        await asyncio.sleep(1)
+
+async def main():
+    transport = StreamTransport()  # shared keep-alive connections
+    await asyncio.gather(*[device(nr, transport) for nr in range(DEVICES)])
+
+asyncio.run(main())
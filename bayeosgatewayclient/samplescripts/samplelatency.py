@@ -0,0 +1,23 @@
+"""Sends alarms right after they are saved and reports the delivery latency."""
+
+from time import sleep
+from random import random
+from threading import Thread
+from bayeosgatewayclient import BayEOSWriter, BayEOSSender
+
+PATH = '/tmp/bayeos-alarm/'
+NAME = 'Python-Alarm-Device'
+URL = 'http://bayconf.bayceer.uni-bayreuth.de/gateway/frame/saveFlat'
+
+writer = BayEOSWriter(PATH)
+# sharing the queue index wakes the sender as soon as the writer finishes a file
+sender = BayEOSSender(PATH, NAME, URL, 'import', 'import', queue_index=writer.queue_index)
+thread = Thread(target=sender.run, args=(30,))
+thread.daemon = True
+thread.start()
+
+while True:
+    sleep(5 * random())
+    writer.save_msg('Alarm!', error=True)
+    writer.flush()  # sent immediately instead of after up to 30 seconds
+    print('Latency from sample to post [s]: %s' % sender.latency_percentiles())
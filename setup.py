@@ -16,4 +16,6 @@ setup(
     license='GPL2',
     keywords='bayeos gateway client',
     classifiers=['Programming Language :: Python'],
-    install_requires=['requests'])
+    install_requires=['requests'],
+    extras_require={'numpy': ['numpy']},
+    entry_points={'console_scripts': ['bayeos-queue=bayeosgatewayclient.queuefile:main']})
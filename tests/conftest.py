@@ -0,0 +1,160 @@
+"""Fixtures shared by the tests: a local stand-in gateway and temporary queue directories."""
+
+import gzip
+import zlib
+import base64
+import random
+import threading
+from time import sleep
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from bayeosgatewayclient import BayEOSWriter
+
+
+class Gateway(object):
+    """Stand-in BayEOS Gateway on a local port.
+    Decodes chunked and gzip/deflate compressed form posts and records the posted frames.
+    """
+
+    def __init__(self, status=200, delay=0):
+        """Starts the server thread.
+        @param status: HTTP status code of every response, may be changed later
+        @param delay: seconds to wait before a post is answered
+        """
+        self.status = status
+        self.statuses = []  # status codes of the next posts, status afterwards
+        self.keep_alive = True  # if false, connections are closed after every response without notice
+        self.connections = 0
+        self.delay = delay
+        self.posts = []
+        self.lock = threading.Lock()
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                return
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with gateway.lock:
+                    gateway.connections += 1
+
+            def read_body(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = b''
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        if not size:
+                            self.rfile.readline()
+                            break
+                        body += self.rfile.read(size)
+                        self.rfile.readline()
+                else:
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                encoding = self.headers.get('Content-Encoding')
+                if encoding == 'gzip':
+                    body = gzip.decompress(body)
+                elif encoding == 'deflate':
+                    body = zlib.decompress(body)
+                return body
+
+            def do_POST(self):
+                body = self.read_body()
+                sleep(gateway.delay)
+                form = parse_qs(body.decode('ascii'))
+                with gateway.lock:
+                    status = gateway.statuses.pop(0) if gateway.statuses else gateway.status
+                    gateway.posts.append({'status': status, 'headers': dict(self.headers), 'size': len(body),
+                                          'frames': [base64.b64decode(frame)
+                                                     for frame in form.get('bayeosframes[]', [])]})
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                if not gateway.keep_alive:
+                    self.close_connection = True
+
+            def do_HEAD(self):
+                self.send_response(gateway.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/gateway/frame/saveFlat' % self.server.server_port
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def frames(self, accepted=True):
+        """@return frames of all posts, only of posts answered with 200 if accepted is true"""
+        with self.lock:
+            return [frame for post in self.posts if not accepted or post['status'] == 200
+                    for frame in post['frames']]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Clock(object):
+    """Fake clock whose sleep advances the time."""
+
+    def __init__(self, now=1e9):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def gateway():
+    gateway = Gateway()
+    yield gateway
+    gateway.close()
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / 'queue')
+
+
+def fill_queue(path, files=1, records=100, file_format=1):
+    """Writes queue files of Data Frames with the values [file % 100, record % 100].
+    @param path: queue directory
+    @param files: number of files
+    @param records: number of records per file
+    @param file_format: queue file format
+    """
+    writer = BayEOSWriter(path, max_chunk=10 ** 9, file_format=file_format, rotate_timer=False)
+    for i in range(files):
+        if i:
+            writer.flush()
+        writer.save_many([[i % 100, j % 100] for j in range(records)], value_type=0x44)
+    writer.close()
+
+
+@pytest.fixture
+def write_queue():
+    """fill_queue() as a fixture."""
+    return fill_queue
+
+
+@pytest.fixture
+def clock():
+    """Clock at 1e9 s, pass it as clock and clock.sleep."""
+    return Clock()
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    """Makes every backoff delay of a CircuitBreaker its maximum."""
+    monkeypatch.setattr(random, 'uniform', lambda low, high: high)
@@ -0,0 +1,120 @@
+"""AsyncBayEOSWriter, AsyncBayEOSSender and the StreamTransport."""
+
+import asyncio
+
+from bayeosgatewayclient import BayEOSFrame
+from bayeosgatewayclient.asyncclient import AsyncBayEOSWriter, AsyncBayEOSSender, StreamTransport
+
+OK = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'
+CHUNKED = b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n2\r\nok\r\n3;x=y\r\nabc\r\n0\r\n\r\n'
+UNTIL_CLOSE = b'HTTP/1.1 201 Created\r\n\r\nbody without length'
+
+
+async def serve(responses, connections):
+    """Starts a raw HTTP server answering requests with the given responses in order.
+    None closes the connection without an answer. Every new connection is appended to connections.
+    """
+    async def handle(reader, writer):
+        connections.append(writer)
+        while responses:
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = [line for line in head.split(b'\r\n') if line.lower().startswith(b'content-length:')]
+            await reader.readexactly(int(length[0].split(b':')[1]))
+            response = responses.pop(0)
+            if response is None:
+                break
+            writer.write(response)
+            await writer.drain()
+            if response == UNTIL_CLOSE:
+                break
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, 'http://127.0.0.1:%d/gateway' % server.sockets[0].getsockname()[1]
+
+
+def test_round_trip(queue_path, gateway):
+    async def main():
+        writer = AsyncBayEOSWriter(queue_path, rotate_timer=False)
+        for i in range(10):
+            await writer.save([i, i * 2], value_type=0x41)
+        await writer.save_msg('done')
+        await writer.close()
+        sender = AsyncBayEOSSender(queue_path, 'test', gateway.url)
+        try:
+            return await sender.send(), await sender.send()
+        finally:
+            await sender.transport.close()
+
+    assert asyncio.run(main()) == (11, 0)
+    frames = [BayEOSFrame.parse_frame(frame) for frame in gateway.frames()]
+    assert [list(frame['values'].values()) for frame in frames[:10]] == [[i, i * 2] for i in range(10)]
+    assert frames[10]['message'] == b'done'
+
+
+def test_connection_is_reused(queue_path, gateway):
+    async def main():
+        writer = AsyncBayEOSWriter(queue_path, rotate_timer=False)
+        sender = AsyncBayEOSSender(queue_path, 'test', gateway.url)
+        for i in range(3):
+            await writer.save([i])
+            await writer.flush()
+            assert await sender.send() == 1
+        await writer.close()
+        await sender.transport.close()
+
+    asyncio.run(main())
+    assert gateway.connections == 1
+    assert len(gateway.frames()) == 3
+
+
+def test_retries_stale_idle_connection():
+    connections = []
+
+    async def main():
+        # the first connection answers once and is closed on the next request
+        server, url = await serve([OK, None, OK], connections)
+        transport = StreamTransport()
+        try:
+            return [await transport.post(url, b'x=1', {}, 5) for i in range(2)]
+        finally:
+            await transport.close()
+            server.close()
+
+    assert asyncio.run(main()) == [200, 200]
+    assert len(connections) == 2
+
+
+def test_fresh_connection_is_not_retried():
+    connections = []
+
+    async def main():
+        server, url = await serve([None], connections)
+        transport = StreamTransport()
+        try:
+            await transport.post(url, b'x=1', {}, 5)
+        except EOFError:
+            return True
+        finally:
+            await transport.close()
+            server.close()
+
+    assert asyncio.run(main())
+    assert len(connections) == 1
+
+
+def test_chunked_and_content_length_responses():
+    connections = []
+
+    async def main():
+        server, url = await serve([CHUNKED, OK, CHUNKED, UNTIL_CLOSE, OK], connections)
+        transport = StreamTransport()
+        try:
+            return [await transport.post(url, b'x=1', {}, 5) for i in range(5)]
+        finally:
+            await transport.close()
+            server.close()
+
+    assert asyncio.run(main()) == [200, 200, 200, 201, 200]
+    # the body is read completely, so the connection is kept until a response without length
+    assert len(connections) == 2
@@ -0,0 +1,110 @@
+"""Circuit breaker states and backoff with a fake clock."""
+
+import os
+
+from bayeosgatewayclient import BayEOSSender, CircuitBreaker
+
+
+def test_opens_after_failure_threshold(clock, no_jitter):
+    breaker = CircuitBreaker(failure_threshold=3, backoff_base=10, backoff_max=100, clock=clock)
+    breaker.failure()
+    breaker.failure()
+    assert breaker.allow() == CircuitBreaker.CLOSED
+    breaker.success()  # resets the consecutive failures
+    breaker.failure()
+    breaker.failure()
+    assert breaker.allow() == CircuitBreaker.CLOSED
+    breaker.failure()
+    assert breaker.allow() == CircuitBreaker.OPEN
+    assert breaker.wait() == 10
+    clock.now += 9.5
+    assert breaker.allow() == CircuitBreaker.OPEN
+    assert breaker.wait() == 0.5
+    clock.now += 0.5
+    assert breaker.allow() == CircuitBreaker.HALF_OPEN
+    assert breaker.wait() == 0
+
+
+def test_backoff_doubles_up_to_backoff_max(clock, no_jitter):
+    breaker = CircuitBreaker(failure_threshold=1, backoff_base=10, backoff_max=100, clock=clock)
+    delays = []
+    breaker.failure()
+    for i in range(6):
+        delays.append(breaker.wait())
+        clock.now += breaker.wait()
+        assert breaker.allow() == CircuitBreaker.HALF_OPEN
+        breaker.failure()  # failed probe
+    assert delays == [10, 20, 40, 80, 100, 100]
+
+
+def test_jitter_stays_within_the_upper_half(clock):
+    breaker = CircuitBreaker(failure_threshold=1, backoff_base=10, backoff_max=100, clock=clock)
+    for i in range(20):
+        breaker.failure()
+        assert 5 <= breaker.wait() <= 10
+        breaker.success()
+
+
+def test_half_open_probe_success(clock, no_jitter):
+    breaker = CircuitBreaker(failure_threshold=3, backoff_base=10, backoff_max=100, clock=clock)
+    for i in range(3):
+        breaker.failure()
+    clock.now += 10
+    assert breaker.allow() == CircuitBreaker.HALF_OPEN
+    breaker.probe_success()
+    assert breaker.allow() == CircuitBreaker.CLOSED
+    # the backoff is kept until a post succeeds: the next failed post opens the circuit again
+    breaker.failure()
+    assert breaker.allow() == CircuitBreaker.OPEN
+    assert breaker.wait() == 20
+    clock.now += 20
+    breaker.allow()
+    breaker.probe_success()
+    breaker.success()
+    for i in range(3):
+        breaker.failure()
+    assert breaker.wait() == 10
+
+
+def test_half_open_probe_failure(clock, no_jitter):
+    breaker = CircuitBreaker(failure_threshold=3, backoff_base=10, backoff_max=100, clock=clock)
+    for i in range(3):
+        breaker.failure()
+    clock.now += 10
+    assert breaker.allow() == CircuitBreaker.HALF_OPEN
+    breaker.failure()
+    assert breaker.allow() == CircuitBreaker.OPEN
+    assert breaker.wait() == 20
+
+
+def test_transitions_and_listeners(clock, no_jitter):
+    breaker = CircuitBreaker(failure_threshold=1, backoff_base=10, backoff_max=100, clock=clock, history=3)
+    changes = []
+    breaker.listeners.append(lambda old, new: changes.append((old, new)))
+    breaker.listeners.append(lambda old, new: 1 / 0)  # errors of listeners are only logged
+    breaker.failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.probe_success()
+    breaker.failure()
+    assert changes == [('closed', 'open'), ('open', 'half-open'), ('half-open', 'closed'), ('closed', 'open')]
+    assert list(breaker.transitions) == [(1e9 + 10, old, new) for old, new in changes[1:]]
+
+
+def test_open_circuit_suspends_send(queue_path, gateway, write_queue, clock, no_jitter, monkeypatch):
+    write_queue(queue_path, 2, 10)
+    sender = BayEOSSender(queue_path, 'test', gateway.url, failure_threshold=1, backoff_base=10, log_level=30)
+    sender.breaker.clock = clock
+    sender.breaker.failure()
+    reads = []
+    probes = []
+    ready_files = sender._ready_files
+    monkeypatch.setattr(sender, '_ready_files', lambda path: reads.append(path) or ready_files(path))
+    monkeypatch.setattr(sender, '_probe', lambda url=None: probes.append(url) or 200)
+    assert sender.send() == 0
+    assert reads == probes == [] and gateway.posts == []
+    assert len(os.listdir(queue_path)) == 2
+    clock.now += 10
+    assert sender.send() == 20
+    assert probes == [gateway.url] and reads
+    assert sender.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,115 @@
+"""Compaction of small backup files into segments and its crash recovery."""
+
+import os
+
+import pytest
+
+from bayeosgatewayclient import BayEOSSender, BayEOSFrame
+from bayeosgatewayclient.queuefile import QueueFile, COMPACT_JOURNAL, compact_files, recover_compaction, \
+    write_checkpoint
+
+FILES = 5
+RECORDS = 10
+EXPECTED = [[i, j] for i in range(FILES) for j in range(RECORDS)]
+
+
+@pytest.fixture
+def backup_path(tmp_path, write_queue):
+    backup_path = str(tmp_path / 'backup')
+    write_queue(backup_path, FILES, RECORDS)
+    return backup_path
+
+
+def ready_files(path):
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.rd'))
+
+
+def sent_values(gateway):
+    return [list(BayEOSFrame.parse_frame(frame)['values'].values()) for frame in gateway.frames()]
+
+
+def sender_for(queue_path, backup_path, gateway, compact_size):
+    os.makedirs(queue_path)
+    return BayEOSSender(queue_path, 'test', gateway.url, backup_path=backup_path, compact_size=compact_size,
+                        log_level=30)
+
+
+def test_merged_segment_sends_every_frame_once_in_order(queue_path, backup_path, gateway):
+    files = ready_files(backup_path)
+    size = os.path.getsize(files[0])
+    sender = sender_for(queue_path, backup_path, gateway, 3 * size)
+    assert sender.compact_backup() == 3  # the last two files are smaller than compact_size
+    remaining = ready_files(backup_path)
+    assert len(remaining) == 3 and remaining[1:] == files[3:]
+    with QueueFile(remaining[0]) as segment:
+        assert segment.version == 2 and segment.footer()['frames'] == 3 * RECORDS
+    assert sender.send() == FILES * RECORDS
+    assert sent_values(gateway) == EXPECTED
+    assert os.listdir(backup_path) == []
+
+
+def test_files_with_checkpoint_are_not_merged(queue_path, backup_path, gateway):
+    files = ready_files(backup_path)
+    write_checkpoint(files[1], 0)
+    sender = sender_for(queue_path, backup_path, gateway, 3 * os.path.getsize(files[0]))
+    assert sender.compact_backup() == 3  # the checkpoint ends the run of file 0, files 2 to 4 are merged
+    remaining = ready_files(backup_path)
+    assert len(remaining) == 3 and remaining[:2] == files[:2]
+    assert sender.send() == FILES * RECORDS
+    assert sent_values(gateway) == EXPECTED
+
+
+def crash_on(monkeypatch, name, call):
+    """Makes the call-th call of os.<name> fail like a crash at that point."""
+    original = getattr(os, name)
+    calls = []
+
+    def crash(*args):
+        calls.append(args)
+        if len(calls) == call:
+            raise KeyboardInterrupt('crash')
+        return original(*args)
+
+    monkeypatch.setattr(os, name, crash)
+
+
+def test_crash_before_segment_rename_rolls_back(queue_path, backup_path, gateway, monkeypatch):
+    files = ready_files(backup_path)
+    crash_on(monkeypatch, 'rename', 2)  # the journal is renamed, the segment is not
+    with pytest.raises(KeyboardInterrupt):
+        compact_files(files)
+    monkeypatch.undo()
+    assert os.path.exists(os.path.join(backup_path, COMPACT_JOURNAL))
+    assert recover_compaction(backup_path)
+    assert ready_files(backup_path) == files
+    assert sorted(os.listdir(backup_path)) == sorted(os.path.basename(name) for name in files)
+    sender = sender_for(queue_path, backup_path, gateway, 0)
+    assert sender.send() == FILES * RECORDS
+    assert sent_values(gateway) == EXPECTED
+
+
+def test_crash_after_segment_rename_completes_the_merge(queue_path, backup_path, gateway, monkeypatch):
+    files = ready_files(backup_path)
+    crash_on(monkeypatch, 'remove', 3)  # the segment is renamed, two merged files are removed
+    with pytest.raises(KeyboardInterrupt):
+        compact_files(files)
+    monkeypatch.undo()
+    assert len(ready_files(backup_path)) == FILES - 2 + 1
+    assert recover_compaction(backup_path)
+    segment_name, = ready_files(backup_path)
+    assert os.listdir(backup_path) == [os.path.basename(segment_name)]
+    sender = sender_for(queue_path, backup_path, gateway, 0)
+    assert sender.send() == FILES * RECORDS
+    assert sent_values(gateway) == EXPECTED
+
+
+def test_startup_recovers_interrupted_compaction(queue_path, backup_path, gateway, monkeypatch):
+    files = ready_files(backup_path)
+    crash_on(monkeypatch, 'rename', 2)
+    with pytest.raises(KeyboardInterrupt):
+        compact_files(files)
+    monkeypatch.undo()
+    sender = sender_for(queue_path, backup_path, gateway, 1024)
+    assert not os.path.exists(os.path.join(backup_path, COMPACT_JOURNAL))
+    assert sender.send() == FILES * RECORDS
+    assert sent_values(gateway) == EXPECTED
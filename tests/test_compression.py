@@ -0,0 +1,28 @@
+"""Compressed request bodies, decompressed by the stand-in gateway."""
+
+import pytest
+
+from bayeosgatewayclient import BayEOSSender
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'deflate'])
+@pytest.mark.parametrize('checkpoints', [True, False])  # posted in parts or streamed
+def test_compressed_posts(queue_path, gateway, write_queue, compression, checkpoints):
+    write_queue(queue_path, 1, 20000)
+    sender = BayEOSSender(queue_path, 'test', gateway.url, compression=compression, checkpoints=checkpoints,
+                          max_post_bytes=64 * 1024, log_level=30)
+    assert sender.send() == 20000
+    assert len(gateway.frames()) == 20000
+    assert all(post['headers']['Content-Encoding'] == compression for post in gateway.posts)
+    if not checkpoints:
+        assert gateway.posts[0]['headers']['Transfer-Encoding'] == 'chunked'
+    stats = sender.counters
+    assert stats['bytes_sent'] < stats['bytes'] / 2
+
+
+def test_small_posts_are_not_compressed(queue_path, gateway, write_queue):
+    write_queue(queue_path, 1, 10)
+    sender = BayEOSSender(queue_path, 'test', gateway.url, compression='gzip', compression_threshold=10 ** 6,
+                          log_level=30)
+    assert sender.send() == 10
+    assert 'Content-Encoding' not in gateway.posts[0]['headers']
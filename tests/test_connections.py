@@ -0,0 +1,43 @@
+"""Keep-alive connections to the gateway and their retries."""
+
+from time import sleep
+
+import urllib3
+
+from bayeosgatewayclient import BayEOSSender
+
+
+def test_connection_is_reused(queue_path, gateway, write_queue):
+    sender = BayEOSSender(queue_path, 'test', gateway.url, log_level=30)
+    for i in range(3):
+        write_queue(queue_path, 1, 1)
+        assert sender.send() == 1
+    assert gateway.connections == 1
+
+
+def test_recovers_from_connection_closed_by_gateway(queue_path, gateway, write_queue):
+    gateway.keep_alive = False
+    sender = BayEOSSender(queue_path, 'test', gateway.url, log_level=30)
+    for i in range(3):
+        write_queue(queue_path, 1, 1)
+        assert sender.send() == 1
+        sleep(0.1)
+    assert gateway.connections == 3
+    assert sender.counters['post_errors'] == 0
+
+
+def test_retries_connects_only_once_per_layer(queue_path, monkeypatch):
+    attempts = []
+
+    def refuse(*args, **kwargs):
+        attempts.append(args[0])
+        raise ConnectionRefusedError()
+
+    monkeypatch.setattr(urllib3.util.connection, 'create_connection', refuse)
+    sender = BayEOSSender(queue_path, 'test', 'http://127.0.0.1:9/gateway/frame/saveFlat', retries=2,
+                          log_level=30)
+    assert sender._post({'sender': 'test'}) == 0
+    assert len(attempts) == 3  # first connect and two retries
+    del attempts[:]
+    assert sender._probe() == 0
+    assert len(attempts) == 1
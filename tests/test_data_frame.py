@@ -0,0 +1,59 @@
+"""The bulk and template encoders produce the same bytes as DataFrame.create()."""
+
+import pytest
+
+from bayeosgatewayclient import BayEOSFrame, DataFrame, FrameTemplate, DATA_TYPES, numpy
+
+VALUES = [1, -2, 3, 100]
+LABELS = ['a', 'bc', 'channel', 'x']
+LAYOUTS = [(offset_type | data_type, offset) for data_type in sorted(DATA_TYPES)
+           for offset_type in (0x0, 0x20, 0x40) for offset in (0, 2)]
+requires_numpy = pytest.mark.skipif(numpy is None, reason='requires NumPy')
+
+
+def create(values, value_type, offset=0):
+    data_frame = BayEOSFrame.factory(0x1)
+    data_frame.create(values, value_type, offset)
+    return data_frame.frame
+
+
+@pytest.mark.parametrize('value_type, offset', LAYOUTS)
+def test_template(value_type, offset):
+    frame = create(VALUES, value_type, offset)
+    template = FrameTemplate.get(len(VALUES), value_type, offset)
+    assert template.pack(VALUES) == frame
+    assert template.unpack(frame) == VALUES
+
+
+@pytest.mark.parametrize('value_type, offset', LAYOUTS)
+def test_create_many(value_type, offset):
+    frame = create(VALUES, value_type, offset)
+    assert DataFrame.create_many([VALUES, VALUES], value_type, offset) == [frame, frame]
+
+
+@pytest.mark.parametrize('value_type, offset', LAYOUTS)
+def test_parse_many(value_type, offset):
+    frame = create(VALUES, value_type, offset)
+    parsed = [list(row) for row in DataFrame.parse_many([frame, frame])]
+    assert parsed == [list(BayEOSFrame.parse_frame(frame)['values'].values())] * 2 == [VALUES] * 2
+
+
+@requires_numpy
+@pytest.mark.parametrize('value_type, offset', LAYOUTS)
+def test_create_array(value_type, offset):
+    frame = create(VALUES, value_type, offset)
+    rows = numpy.array([VALUES, VALUES], dtype=DATA_TYPES[0x0f & value_type]['format'])
+    assert [row.tobytes() for row in DataFrame.create_array(rows, value_type, offset)] == [frame, frame]
+    assert DataFrame.create_many(rows, value_type, offset) == [frame, frame]
+    assert DataFrame.parse_many(frame + frame, len(frame)).tolist() == [VALUES, VALUES]
+
+
+@pytest.mark.parametrize('data_type', sorted(DATA_TYPES))
+def test_labels(data_type):
+    value_type = 0x60 | data_type
+    frame = create(dict(zip(LABELS, VALUES)), value_type)
+    template = FrameTemplate.get(LABELS, value_type)
+    assert template.pack(VALUES) == template.pack(dict(zip(LABELS, VALUES))) == frame
+    assert template.unpack(frame) == VALUES
+    assert DataFrame.create_many([dict(zip(LABELS, VALUES))], value_type) == [frame]
+    assert DataFrame.parse_many([frame, frame]) == [VALUES, VALUES]
@@ -0,0 +1,94 @@
+"""decode_frame() returns the same as the parse() methods of the frame classes."""
+
+import random
+import logging
+
+import pytest
+
+from bayeosgatewayclient import BayEOSFrame, decode_frame
+
+CORPUS_SIZE = 20000
+
+
+def data_frame(rnd):
+    value_type = rnd.choice([0x41, 0x42, 0x43, 0x44, 0x45, 0x01, 0x02, 0x21, 0x22, 0x61, 0x63, 0x11, 0x31])
+    count = rnd.randint(0, 8)
+    if value_type & 0xf0 == 0x60:
+        values = dict(('ch%d' % i, rnd.randint(-100, 100)) for i in range(count))
+    else:
+        values = [rnd.randint(-100, 100) for i in range(count)]
+    frame = BayEOSFrame.factory(0x1)
+    frame.create(values, value_type, rnd.randint(0, 5))
+    return frame.frame
+
+
+def leaf_frame(rnd):
+    r = rnd.random()
+    if r < 0.6:
+        return data_frame(rnd)
+    if r < 0.7:
+        frame = BayEOSFrame.factory(rnd.choice([0x4, 0x5]))
+        frame.create(rnd.choice(['hi', 'Grüße', '']))
+        return frame.frame
+    if r < 0.8:  # command and command response
+        return bytes([rnd.choice([0x2, 0x3, 0xe]), rnd.randint(0, 255)]) + bytes(rnd.randint(0, 5))
+    if r < 0.9:
+        frame = BayEOSFrame.factory(0xa)
+        frame.create(b'abc')
+        return frame.frame
+    return bytes([rnd.choice([0x11, 0x0, 0x20, 0xff])]) + bytes(3)  # unknown Frame Types
+
+
+def wrap(rnd, nested):
+    frame_type = rnd.choice([0x6, 0x7, 0x8, 0x9, 0xb, 0xc, 0xd, 0xf, 0x10])
+    frame = BayEOSFrame.factory(frame_type)
+    if frame_type == 0x6:
+        frame.create(rnd.randint(-999, 999), rnd.randint(-999, 999), nested)
+    elif frame_type == 0x8:
+        frame.create(rnd.randint(-999, 999), rnd.randint(-999, 999), rnd.randint(0, 255), nested)
+    elif frame_type in (0x7, 0x10):
+        frame.create(nested, rnd.randint(0, 10 ** 6))
+    elif frame_type in (0x9, 0xc):
+        frame.create(nested, 1.7e9 + rnd.random() * 1e6)
+    elif frame_type in (0xb, 0xd):
+        frame.create(rnd.choice(['a', 'Gerät', 'x' * 300, '']), nested)
+    else:
+        frame.create(nested)
+    return frame.frame
+
+
+def corpus():
+    """Nested frames of all types, some truncated or with a flipped byte."""
+    rnd = random.Random(3)
+    for i in range(CORPUS_SIZE):
+        frame = leaf_frame(rnd)
+        for depth in range(rnd.randint(0, 3)):
+            frame = wrap(rnd, frame)
+        if rnd.random() < 0.1:
+            frame = frame[:rnd.randint(0, len(frame))]
+        if rnd.random() < 0.03 and frame:
+            corrupt = bytearray(frame)
+            corrupt[rnd.randrange(len(corrupt))] ^= 0xff
+            frame = bytes(corrupt)
+        yield frame
+
+
+def outcome(parse, frame):
+    try:
+        return repr(parse(frame))
+    except Exception as err:
+        return type(err)
+
+
+@pytest.fixture
+def quiet():
+    logging.disable(logging.ERROR)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+def test_corpus(quiet):
+    mismatches = [frame.hex() for frame in corpus()
+                  if outcome(lambda frame: BayEOSFrame.parse_frame(frame, {'origin': '', 'timestamp': 123.0}, False),
+                             frame) != outcome(lambda frame: decode_frame(frame, timestamp=123.0), frame)]
+    assert mismatches == []
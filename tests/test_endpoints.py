@@ -0,0 +1,85 @@
+"""Several gateway urls: failover, failback and fanout with a quorum."""
+
+import os
+
+import pytest
+
+from bayeosgatewayclient import BayEOSSender, CircuitBreaker
+from conftest import Gateway
+
+
+@pytest.fixture
+def gateways():
+    gateways = [Gateway(), Gateway()]
+    yield gateways
+    for gateway in gateways:
+        gateway.close()
+
+
+def sender_for(queue_path, gateways, clock, **options):
+    sender = BayEOSSender(queue_path, 'test', [gateway.url for gateway in gateways], failure_threshold=1,
+                          backoff_base=10, retries=0, log_level=30, **options)
+    for endpoint in sender.endpoints:
+        endpoint.breaker.clock = clock
+    return sender
+
+
+def test_failover_and_failback(queue_path, gateways, write_queue, clock, no_jitter):
+    primary, secondary = gateways
+    sender = sender_for(queue_path, gateways, clock)
+    primary.status = 500
+    write_queue(queue_path, 1, 10)
+    assert sender.send() == 0  # the failed post opens the circuit of the primary url
+    assert sender.endpoints[0].breaker.state == CircuitBreaker.OPEN
+    assert sender.send() == 10
+    assert len(secondary.frames()) == 10 and primary.frames() == []
+    clock.now += 10
+    write_queue(queue_path, 1, 5)
+    assert sender.send() == 5  # the probe fails, the secondary url is kept
+    assert len(secondary.frames()) == 15
+    primary.status = 200
+    clock.now += 20
+    write_queue(queue_path, 1, 3)
+    assert sender.send() == 3  # the probe succeeds, back to the primary url
+    assert len(primary.frames()) == 3 and len(secondary.frames()) == 15
+    assert sender.breaker is sender.endpoints[0].breaker
+
+
+def test_fanout_posts_to_all_urls(queue_path, gateways, write_queue, clock):
+    sender = sender_for(queue_path, gateways, clock, mode='fanout', quorum=2)
+    write_queue(queue_path, 2, 10)
+    assert sender.send() == 20
+    assert gateways[0].frames() == gateways[1].frames() and len(gateways[0].frames()) == 20
+    assert os.listdir(queue_path) == []
+
+
+def test_fanout_below_quorum_commits_nothing(queue_path, gateways, write_queue, clock):
+    sender = sender_for(queue_path, gateways, clock, mode='fanout', quorum=2)
+    gateways[1].status = 500
+    write_queue(queue_path, 1, 10)
+    files = os.listdir(queue_path)
+    assert sender.send() == 0
+    assert len(gateways[0].frames()) == 10  # accepted by one gateway only
+    assert os.listdir(queue_path) == files
+    assert sender.send() == 0  # the circuit of the second url is open, below the quorum nothing is posted
+    assert len(gateways[0].posts) == 1
+    assert os.listdir(queue_path) == files
+
+
+def test_quorum_exceeding_the_urls_is_rejected(queue_path, gateways):
+    with pytest.raises(ValueError):
+        BayEOSSender(queue_path, 'test', [gateway.url for gateway in gateways], mode='fanout', quorum=3)
+
+
+def test_endpoint_stats(queue_path, gateways, write_queue, clock):
+    sender = sender_for(queue_path, gateways, clock)
+    gateways[0].status = 500
+    write_queue(queue_path, 1, 10)
+    sender.send()
+    sender.send()
+    primary, secondary = sender.endpoint_stats()
+    assert (primary['url'], primary['state'], primary['posts'], primary['errors'], primary['frames']) == \
+        (gateways[0].url, CircuitBreaker.OPEN, 1, 1, 0)
+    assert (secondary['url'], secondary['state'], secondary['posts'], secondary['errors'], secondary['frames']) == \
+        (gateways[1].url, CircuitBreaker.CLOSED, 1, 0, 10)
+    assert set(secondary['latency']) and all(value >= 0 for value in secondary['latency'].values())
@@ -0,0 +1,35 @@
+"""BayEOSGatewayClient running a writer and a sender per device."""
+
+import pytest
+
+import bayeosgatewayclient.bayeosgatewayclient as client
+from bayeosgatewayclient import BayEOSGatewayClient
+
+
+class Stop(Exception):
+    pass
+
+
+class Device(BayEOSGatewayClient):
+    def read_data(self):
+        raise Stop()
+
+
+def test_sender_thread_shares_queue_index_of_writer(queue_path, monkeypatch):
+    threads = []
+
+    class Thread(object):  # records the sender thread instead of starting it
+        def __init__(self, target, args):
+            threads.append(args)
+
+        def start(self):
+            return
+
+    monkeypatch.setattr(client, 'Thread', Thread)
+    device = Device(['Device'], {'sender': 'test', 'path': queue_path, 'rotate_timer': False})
+    device.name = 'Device'
+    with pytest.raises(Stop):
+        device._BayEOSGatewayClient__start_sender_writer_pair(queue_path, True)
+    path, queue_index = threads[0]
+    assert queue_index is device.writer.queue_index
+    device.writer.close()
@@ -0,0 +1,112 @@
+"""Metrics registry, Prometheus text format and textfile export."""
+
+import os
+
+import pytest
+
+from bayeosgatewayclient import BayEOSWriter, BayEOSSender, MetricsRegistry, Metric, Histogram
+
+
+class Source(object):
+    def __init__(self, metrics):
+        self.list = metrics
+
+    def metrics(self):
+        return self.list
+
+
+def histogram(*values):
+    res = Histogram(buckets=(0.1, 1.0))
+    for value in values:
+        res.observe(value)
+    return res.snapshot()
+
+
+def test_get_sums_matching_series():
+    registry = MetricsRegistry()
+    registry.register(Source([Metric('frames_total', 'counter', 'Frames.', {'url': 'a'}, 3),
+                              Metric('frames_total', 'counter', 'Frames.', {'url': 'b'}, 4),
+                              Metric('latency', 'histogram', 'Latency.', {'url': 'a'}, histogram(0.05, 2.0)),
+                              Metric('latency', 'histogram', 'Latency.', {'url': 'b'}, histogram(0.5))]),
+                      device='d1')
+    registry.register(Source([Metric('frames_total', 'counter', 'Frames.', {'url': 'a'}, 10)]), device='d2')
+    assert registry.get('frames_total') == 17
+    assert registry.get('frames_total', url='a') == 13
+    assert registry.get('frames_total', url='a', device='d2') == 10
+    assert registry.get('frames_total', url='c') is None
+    assert registry.get('unknown') is None
+    assert registry.get('latency') == {'sum': 2.55, 'count': 3,
+                                       'buckets': [(0.1, 1), (1.0, 2), (float('inf'), 3)]}
+
+
+def test_get_reads_writer_and_sender(queue_path, gateway, write_queue):
+    write_queue(queue_path, 2, 10)
+    registry = MetricsRegistry()
+    writer = BayEOSWriter(queue_path, rotate_timer=False)
+    sender = BayEOSSender(queue_path, 'test', gateway.url, log_level=30)
+    registry.register(writer)
+    registry.register(sender)
+    writer.save([1, 2])
+    writer.close()
+    assert sender.send() == 21
+    assert registry.get('writer_frames_total') == 1
+    assert registry.get('sender_frames_total') == 21
+    assert registry.get('sender_post_seconds')['count'] == 1
+    registry.unregister(sender)
+    assert registry.get('sender_frames_total') is None
+
+
+def test_exposition_format():
+    registry = MetricsRegistry(prefix='test_')
+    registry.register(Source([Metric('posts_total', 'counter', 'Posts\nwith \\ escapes.', {}, 5),
+                              Metric('up', 'gauge', 'Up.', {'url': 'http://a/"x"\\y\n'}, True),
+                              Metric('latency', 'histogram', 'Latency.', {'url': 'a'}, histogram(0.05, 0.5, 2.0))]),
+                      device='d1')
+    assert registry.exposition().splitlines() == [
+        '# HELP test_posts_total Posts\\nwith \\\\ escapes.',
+        '# TYPE test_posts_total counter',
+        'test_posts_total{device="d1"} 5',
+        '# HELP test_up Up.',
+        '# TYPE test_up gauge',
+        'test_up{device="d1",url="http://a/\\"x\\"\\\\y\\n"} 1',
+        '# HELP test_latency Latency.',
+        '# TYPE test_latency histogram',
+        'test_latency_bucket{device="d1",le="0.1",url="a"} 1',
+        'test_latency_bucket{device="d1",le="1.0",url="a"} 2',
+        'test_latency_bucket{device="d1",le="+Inf",url="a"} 3',
+        'test_latency_sum{device="d1",url="a"} 2.55',
+        'test_latency_count{device="d1",url="a"} 3']
+
+
+def test_failing_source_is_skipped():
+    registry = MetricsRegistry()
+
+    class Broken(object):
+        def metrics(self):
+            raise RuntimeError('broken')
+
+    registry.register(Broken())
+    registry.register(Source([Metric('up', 'gauge', 'Up.', {}, 1)]))
+    assert registry.exposition() == '# HELP bayeos_up Up.\n# TYPE bayeos_up gauge\nbayeos_up 1\n'
+
+
+def test_write_textfile_replaces_atomically(tmp_path, monkeypatch):
+    file_name = str(tmp_path / 'bayeos.prom')
+    registry = MetricsRegistry()
+    source = Source([Metric('up', 'gauge', 'Up.', {}, 1)])
+    registry.register(source)
+    registry.write_textfile(file_name)
+    assert open(file_name).read() == registry.exposition()
+    assert os.listdir(str(tmp_path)) == ['bayeos.prom']
+    assert oct(os.stat(file_name).st_mode & 0o777) == oct(0o644)
+
+    def interrupted(source, destination):
+        assert open(source).read() == registry.exposition()  # the complete file is in place before the rename
+        raise OSError('interrupted')
+
+    source.list = [Metric('up', 'gauge', 'Up.', {}, 0)]
+    monkeypatch.setattr(os, 'replace', interrupted)
+    with pytest.raises(OSError):
+        registry.write_textfile(file_name)
+    assert open(file_name).read().endswith('bayeos_up 1\n')  # the old file is kept
+    assert os.listdir(str(tmp_path)) == ['bayeos.prom']  # no temporary file is left
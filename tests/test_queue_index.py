@@ -0,0 +1,90 @@
+"""Ordered index of ready files, kept up to date by inotify or by polling."""
+
+import os
+
+import pytest
+
+from bayeosgatewayclient.queuefile import QueueIndex, InotifyWatcher, PollWatcher, file_key
+
+
+def touch(path, name):
+    file_name = os.path.join(path, name)
+    open(file_name, 'wb').close()
+    return file_name
+
+
+def test_file_key_orders_oldest_first():
+    names = ['1000-0500000-b.rd', '999-9999999-a.rd', '1000-0000001-c.rd', 'other.rd', '1000-0500000-a.rd']
+    assert sorted(names, key=file_key) == ['999-9999999-a.rd', '1000-0000001-c.rd', '1000-0500000-b.rd',
+                                           '1000-0500000-a.rd', 'other.rd']
+    assert file_key('/queue/dir-1/1000-0500000-x.rd') == 1000.05
+    assert file_key('other.rd') == float('inf')
+
+
+def test_scan_orders_oldest_first(tmp_path):
+    path = str(tmp_path)
+    for name in ['1002-0000000-a.rd', '1000-0000000-b.rd', '1001-0000000-c.act', '1001-0000000-d.rd', 'x.tmp']:
+        touch(path, name)
+    index = QueueIndex(path)
+    assert index.scan() == [os.path.join(path, '1001-0000000-c.act')]
+    assert index.files() == [os.path.join(path, name)
+                             for name in ['1000-0000000-b.rd', '1001-0000000-d.rd', '1002-0000000-a.rd']]
+
+
+@pytest.fixture
+def inotify(tmp_path):
+    try:
+        InotifyWatcher(str(tmp_path)).close()
+    except OSError as err:
+        pytest.skip(str(err))
+
+
+def test_inotify_updates_incrementally(tmp_path, inotify):
+    path = str(tmp_path)
+    touch(path, '1001-0000000-a.rd')
+    index = QueueIndex(path)
+    try:
+        assert index.refresh() == [os.path.join(path, '1001-0000000-a.rd')]
+        assert isinstance(index.watcher, InotifyWatcher)
+        # files renamed in and removed by another process
+        os.rename(touch(path, '1000-0000000-b.act'), os.path.join(path, '1000-0000000-b.rd'))
+        os.rename(touch(path, '1002-0000000-c.act'), os.path.join(path, '1002-0000000-c.rd'))
+        os.remove(os.path.join(path, '1001-0000000-a.rd'))
+        touch(path, '1003-0000000-d.act')  # created, not renamed: not ready
+        assert index.refresh() == [os.path.join(path, '1000-0000000-b.rd'), os.path.join(path, '1002-0000000-c.rd')]
+        assert index.scanned == 5  # the rename and delete events, the directory was not read
+        os.rename(os.path.join(path, '1000-0000000-b.rd'), os.path.join(str(tmp_path), '1000-0000000-b.bak'))
+        assert index.refresh() == [os.path.join(path, '1002-0000000-c.rd')]
+        assert index.refresh() == [os.path.join(path, '1002-0000000-c.rd')]
+        assert index.scanned == 0
+    finally:
+        index.close()
+
+
+def test_poll_watcher_fallback(tmp_path, monkeypatch):
+    path = str(tmp_path)
+
+    def no_inotify(path):
+        raise OSError('inotify is not available')
+
+    monkeypatch.setattr('bayeosgatewayclient.queuefile.InotifyWatcher', no_inotify)
+    touch(path, '1001-0000000-a.rd')
+    index = QueueIndex(path)
+    try:
+        assert index.refresh() == [os.path.join(path, '1001-0000000-a.rd')]
+        assert isinstance(index.watcher, PollWatcher)
+        touch(path, '1000-0000000-b.rd')
+        os.remove(os.path.join(path, '1001-0000000-a.rd'))
+        assert index.refresh() == [os.path.join(path, '1000-0000000-b.rd')]
+    finally:
+        index.close()
+
+
+def test_poll_watcher_skips_unchanged_directory(tmp_path, monkeypatch):
+    path = str(tmp_path)
+    os.utime(path, (1e9, 1e9))
+    watcher = PollWatcher(path)
+    assert watcher.changes() is None  # first call: read the directory
+    assert watcher.changes() == []
+    touch(path, 'x.rd')
+    assert watcher.changes() is None
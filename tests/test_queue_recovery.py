@@ -0,0 +1,79 @@
+"""Recovery of orphaned .act files at startup."""
+
+import os
+
+import pytest
+
+from bayeosgatewayclient.queuefile import QueueFile, encode_record, encode_record_v2, encode_header_v2, \
+    recover_file, recover_queue
+
+FRAMES = [b'\x01\x41' + bytes([i, 0, 0, 0]) for i in range(5)]
+
+
+def write_file(path, name, version, frames=FRAMES, tail=b''):
+    """Writes a queue file without index footer, as left by a writer that did not finish it."""
+    file_name = os.path.join(path, name)
+    with open(file_name, 'wb') as queue_file:
+        if version == 2:
+            queue_file.write(encode_header_v2(1000.0))
+        for i, frame in enumerate(frames):
+            queue_file.write((encode_record_v2 if version == 2 else encode_record)(1000.0 + i, frame))
+        queue_file.write(tail)
+    return file_name
+
+
+def read(file_name):
+    with QueueFile(file_name) as queue_file:
+        records = [(timestamp, bytes(frame)) for timestamp, frame in queue_file]
+        return records, queue_file.footer(), queue_file.truncated
+
+
+@pytest.mark.parametrize('version', [1, 2])
+def test_partial_record_is_cut_off(tmp_path, version):
+    complete = write_file(str(tmp_path), 'complete', version)
+    size = os.path.getsize(complete)
+    partial_record = (encode_record_v2 if version == 2 else encode_record)(2000.0, FRAMES[0])[:-3]
+    file_name = write_file(str(tmp_path), '1000-0000000-x.act', version, tail=partial_record)
+    ready_name = recover_file(file_name)
+    assert ready_name == str(tmp_path / '1000-0000000-x.rd')
+    assert not os.path.exists(file_name)
+    records, footer, truncated = read(ready_name)
+    assert records == [(1000.0 + i, frame) for i, frame in enumerate(FRAMES)]
+    assert not truncated
+    if version == 2:
+        assert footer['frames'] == len(FRAMES)
+        assert (footer['first'], footer['last'], footer['end']) == (1000.0, 1004.0, size)
+    else:
+        assert os.path.getsize(ready_name) == size
+
+
+def test_finished_v2_file_is_only_renamed(tmp_path):
+    file_name = write_file(str(tmp_path), '1000-0000000-x.act', 2)
+    recover_file(file_name)
+    size = os.path.getsize(str(tmp_path / '1000-0000000-x.rd'))
+    os.rename(str(tmp_path / '1000-0000000-x.rd'), file_name)
+    assert recover_file(file_name) == str(tmp_path / '1000-0000000-x.rd')
+    assert os.path.getsize(str(tmp_path / '1000-0000000-x.rd')) == size
+
+
+@pytest.mark.parametrize('version, tail', [(1, b''), (1, b'\x00' * 7), (2, b''), (2, b'\x00' * 11)])
+def test_file_without_valid_record_is_removed(tmp_path, version, tail):
+    file_name = write_file(str(tmp_path), '1000-0000000-x.act', version, frames=[], tail=tail)
+    assert recover_file(file_name) is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_recover_queue_indexes_oldest_first(tmp_path):
+    path = str(tmp_path)
+    write_file(path, '1003-0000000-c.rd', 1)
+    write_file(path, '1001-5000000-b.act', 2, tail=b'\x01\x02')
+    write_file(path, '1001-0000000-a.rd', 2)
+    write_file(path, '1002-0000000-e.act', 1, frames=[])
+    write_file(path, '1000-2500000-d.act', 1)
+    index = recover_queue(path)
+    try:
+        assert index.files() == [os.path.join(path, name) for name in
+                                 ('1000-2500000-d.rd', '1001-0000000-a.rd', '1001-5000000-b.rd', '1003-0000000-c.rd')]
+        assert sorted(os.listdir(path)) == sorted(os.path.basename(name) for name in index.files())
+    finally:
+        index.close()
@@ -0,0 +1,74 @@
+"""Token buckets and send windows for metered links, with a fake clock."""
+
+import os
+from time import mktime, localtime, strftime, time
+
+from bayeosgatewayclient import BayEOSSender, TokenBucket, SendWindows, SHAPE_CHUNK_SIZE
+
+
+def local(hour, minute=0):
+    """@return Unix time of a local time of day"""
+    return mktime((2024, 6, 1, hour, minute, 0, 0, 0, -1))
+
+
+def test_token_bucket_passes_a_burst_of_the_capacity(clock):
+    bucket = TokenBucket(100, clock=clock, sleep=clock.sleep)
+    assert bucket.consume(60) == 0
+    assert bucket.consume(40) == 0
+    assert clock.sleeps == []
+
+
+def test_token_bucket_waits_for_the_debt(clock):
+    bucket = TokenBucket(100, clock=clock, sleep=clock.sleep)
+    bucket.consume(100)
+    assert bucket.consume(50) == 0.5
+    assert bucket.consume(300) == 3.0  # larger than the capacity, passes after waiting
+    assert clock.sleeps == [0.5, 3.0]
+    assert bucket.waited == 3.5
+
+
+def test_token_bucket_refills_up_to_the_capacity(clock):
+    bucket = TokenBucket(100, capacity=200, clock=clock, sleep=clock.sleep)
+    bucket.consume(200)
+    clock.now += 10
+    assert bucket.consume(200) == 0
+    assert bucket.consume(100) == 1.0
+
+
+def test_send_windows():
+    night = SendWindows([('22:00', '06:00')], clock=lambda: now)
+    day = SendWindows([('08:00', '12:00'), ('13:00', '17:00')], clock=lambda: now)
+    for hour, minute, night_open, day_open in [(23, 0, True, False), (3, 0, True, False), (6, 0, False, False),
+                                               (10, 30, False, True), (12, 30, False, False),
+                                               (16, 59, False, True), (22, 0, True, False)]:
+        now = local(hour, minute)
+        assert (night.is_open(), day.is_open()) == (night_open, day_open), (hour, minute)
+
+
+def test_buffered_body_is_posted_at_the_rate(queue_path, gateway, write_queue, clock):
+    write_queue(queue_path, 1, 2000)
+    sender = BayEOSSender(queue_path, 'test', gateway.url, max_bytes_per_sec=10000, log_level=30)
+    clock.now = time()
+    sender.byte_bucket = TokenBucket(10000, clock=clock, sleep=clock.sleep)
+    assert sender.send() == 2000
+    post, = gateway.posts
+    assert 'Transfer-Encoding' not in post['headers']
+    size = int(post['headers']['Content-Length'])
+    assert max(clock.sleeps) < SHAPE_CHUNK_SIZE / 10000.0 + 1e-6
+    assert abs(sum(clock.sleeps) - (size - 10000) / 10000.0) < 1e-3
+
+
+def test_failed_post_outside_the_window_keeps_fresh_files(tmp_path, gateway, write_queue):
+    path = str(tmp_path / 'queue')
+    backup_path = str(tmp_path / 'backup')
+    os.makedirs(backup_path)
+    write_queue(path, 1, 10)
+    start = strftime('%H:%M', localtime(time() + 2 * 3600))
+    end = strftime('%H:%M', localtime(time() + 3 * 3600))
+    gateway.status = 503
+    sender = BayEOSSender(path, 'test', gateway.url, backup_path=backup_path, send_windows=[(start, end)],
+                          log_level=30)
+    assert sender.send() == 0
+    assert len(gateway.posts) == 1
+    assert os.listdir(backup_path) == []
+    assert [f for f in os.listdir(path) if f.endswith('.rd')]
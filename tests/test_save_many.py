@@ -0,0 +1,44 @@
+"""Bulk saving with save_many."""
+
+import pytest
+
+from bayeosgatewayclient import BayEOSWriter, BayEOSFrame, QueueFile, numpy
+
+
+def read_records(path):
+    from bayeosgatewayclient import QueueIndex
+    index = QueueIndex(path, False)
+    index.scan()
+    records = []
+    for file_name in index.files():
+        with QueueFile(file_name) as queue_file:
+            records += [(timestamp, bytes(frame)) for timestamp, frame in queue_file]
+    return records
+
+
+def test_rows_and_timestamps(queue_path):
+    writer = BayEOSWriter(queue_path, max_chunk=60)
+    writer.save_many([[1, 2], [3, 4], [5, 6]], timestamps=[1e9, 1e9 + 1, 1e9 + 2])
+    writer.close()
+    records = read_records(queue_path)
+    assert [timestamp for timestamp, frame in records] == [1e9, 1e9 + 1, 1e9 + 2]
+    assert [list(BayEOSFrame.parse_frame(frame)['values'].values()) for timestamp, frame in records] == \
+        [[1, 2], [3, 4], [5, 6]]
+
+
+def test_timestamps_must_match_rows(queue_path):
+    writer = BayEOSWriter(queue_path)
+    with pytest.raises(ValueError):
+        writer.save_many([[1, 2], [3, 4], [5, 6]], timestamps=[1e9])
+    writer.close()
+    assert read_records(queue_path) == []
+
+
+@pytest.mark.skipif(numpy is None, reason='requires NumPy')
+def test_timestamps_must_match_array_rows(queue_path):
+    writer = BayEOSWriter(queue_path)
+    with pytest.raises(ValueError):
+        writer.save_many(numpy.array([[1, 2], [3, 4], [5, 6]], dtype=float), timestamps=[1e9])
+    writer.save_many(numpy.array([[1, 2], [3, 4]], dtype=float), timestamps=[1e9, 1e9 + 1])
+    writer.close()
+    assert [timestamp for timestamp, frame in read_records(queue_path)] == [1e9, 1e9 + 1]
@@ -0,0 +1,48 @@
+"""Combining consecutive queue files into posts."""
+
+import os
+
+import pytest
+
+from bayeosgatewayclient import BayEOSWriter, BayEOSSender, QueueFile, SegmentIndex, encode_header_v2
+
+
+@pytest.mark.parametrize('file_format', [1, 2])
+def test_estimate_frames(queue_path, write_queue, file_format):
+    write_queue(queue_path, 1, 100, file_format)
+    sender = BayEOSSender(queue_path, 'test', 'http://localhost', log_level=30)
+    file_name, = sender._ready_files(queue_path)
+    with QueueFile(file_name) as queue_file:
+        assert queue_file.estimate_frames() == 100
+
+
+def test_batches_are_budgeted_without_reading_files(queue_path, gateway, write_queue, monkeypatch):
+    write_queue(queue_path, 10, 100)
+
+    def info(self):
+        raise AssertionError('file read to select a batch')
+
+    monkeypatch.setattr(QueueFile, 'info', info)
+    sender = BayEOSSender(queue_path, 'test', gateway.url, max_post_frames=250, log_level=30)
+    assert sender.send() == 1000
+    assert [len(post['frames']) for post in gateway.posts] == [200] * 5
+
+
+@pytest.mark.parametrize('file_format', [1, 2])
+def test_idle_writer_leaves_no_files(queue_path, file_format):
+    writer = BayEOSWriter(queue_path, file_format=file_format, rotate_timer=False)
+    writer.flush()
+    writer.flush()
+    writer.close()
+    assert os.listdir(queue_path) == []
+
+
+def test_empty_version_2_file_is_removed(queue_path, gateway):
+    os.makedirs(queue_path)
+    header = encode_header_v2(1e9)
+    with open(os.path.join(queue_path, '1000000000-0-empty.rd'), 'wb') as f:
+        f.write(header + SegmentIndex().footer(len(header)))
+    sender = BayEOSSender(queue_path, 'test', gateway.url, log_level=30)
+    assert sender.send() == 0
+    assert os.listdir(queue_path) == []
+    assert gateway.posts == []
@@ -0,0 +1,42 @@
+"""A sender killed in the middle of a large file resumes at its checkpoint."""
+
+import os
+import sys
+import signal
+import subprocess
+from time import sleep, time
+
+import pytest
+
+from bayeosgatewayclient import BayEOSWriter, BayEOSSender
+
+RECORDS = 20000
+MAX_POST_FRAMES = 1000
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason='requires SIGKILL')
+@pytest.mark.parametrize('file_format', [1, 2])
+def test_kill_sender_mid_file(queue_path, gateway, file_format):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 9, file_format=file_format, rotate_timer=False)
+    writer.save_many([[i % 100, 0.5] for i in range(RECORDS)], timestamps=[1e9 + i for i in range(RECORDS)])
+    writer.close()
+    gateway.delay = 0.05
+    code = ('import logging; logging.disable(logging.WARNING); from bayeosgatewayclient import BayEOSSender; '
+            'BayEOSSender(%r, "test", %r, max_post_frames=%d).run(1)' % (queue_path, gateway.url, MAX_POST_FRAMES))
+    kills = 0
+    for posts in (3, 8):
+        sender = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT)
+        deadline = time() + 30
+        while len(gateway.posts) < posts and time() < deadline:
+            sleep(0.01)
+        sender.send_signal(signal.SIGKILL)
+        sender.wait()
+        kills += 1
+    assert len(gateway.posts) < RECORDS // MAX_POST_FRAMES  # killed before the file was sent
+    sender = BayEOSSender(queue_path, 'test', gateway.url, max_post_frames=MAX_POST_FRAMES, log_level=30)
+    sender.send()
+    assert os.listdir(queue_path) == []
+    frames = gateway.frames()
+    assert len(set(frames)) == RECORDS  # every frame arrived
+    assert len(frames) - RECORDS <= kills * MAX_POST_FRAMES  # at most one part per kill was sent twice
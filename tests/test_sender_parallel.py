@@ -0,0 +1,23 @@
+"""Several posts in flight with workers > 1."""
+
+import os
+
+from bayeosgatewayclient import BayEOSSender
+
+
+def test_failed_post_sends_no_frame_twice(tmp_path, gateway, write_queue):
+    path = str(tmp_path / 'queue')
+    backup_path = str(tmp_path / 'backup')
+    os.makedirs(backup_path)
+    write_queue(path, 20, 50)
+    gateway.delay = 0.05
+    gateway.statuses = [200, 200, 503]
+    sender = BayEOSSender(path, 'test', gateway.url, backup_path=backup_path, workers=4,
+                          max_post_frames=50, compact_size=0, log_level=30)
+    sender.send()
+    sender.send()
+    frames = gateway.frames()
+    assert len(frames) == 20 * 50
+    assert len(set(frames)) == len(frames)
+    assert os.listdir(backup_path) == []
+    assert [f for f in os.listdir(path) if f.endswith('.rd') or f.endswith('.ckpt')] == []
@@ -0,0 +1,117 @@
+"""What a crash of the writer process loses under each write policy.
+
+Records are safe from a crash of the process once the file buffer was handed
+over to the operating system, i.e. once they are visible in the file size.
+"""
+
+import os
+import threading
+from time import sleep, time
+
+import bayeosgatewayclient.bayeosgatewayclient as client
+from bayeosgatewayclient import BayEOSWriter, BayEOSGatewayClient, WRITER_OPTIONS, SENDER_OPTIONS
+
+RECORD_SIZE = 10 + 4  # version 1 record header, Data Frame with one int8 channel
+
+
+def visible(writer):
+    """@return number of records of the current file the operating system has"""
+    return os.path.getsize(writer.current_name) // RECORD_SIZE
+
+
+def save(writer, count):
+    for i in range(count):
+        writer.save([i], value_type=0x44)
+
+
+def test_flush_every_record(queue_path):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, rotate_timer=False)
+    save(writer, 5)
+    assert visible(writer) == 5
+    writer.close()
+
+
+def test_flush_records_loses_at_most_n_minus_1(queue_path):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, flush_records=4, rotate_timer=False)
+    save(writer, 3)
+    assert visible(writer) == 0
+    save(writer, 1)
+    assert visible(writer) == 4
+    save(writer, 3)
+    assert visible(writer) == 4
+    writer.close()
+
+
+def test_flush_bytes(queue_path):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, flush_records=0, flush_bytes=5 * RECORD_SIZE,
+                          rotate_timer=False)
+    save(writer, 4)
+    assert visible(writer) == 0
+    save(writer, 1)
+    assert visible(writer) == 5
+    writer.close()
+
+
+def test_flush_time_bounds_the_loss_without_further_saves(queue_path):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, flush_records=0, flush_time=0.2, rotate_timer=False)
+    save(writer, 3)
+    assert visible(writer) == 0
+    deadline = time() + 2
+    while not visible(writer) and time() < deadline:
+        sleep(0.02)
+    assert visible(writer) == 3
+    writer.close()
+
+
+def test_rotation_only_keeps_the_whole_file_in_memory(queue_path):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, flush_records=0, rotate_timer=False)
+    save(writer, 100)
+    assert visible(writer) == 0
+    name = writer.current_name
+    writer.flush()
+    assert os.path.getsize(name[:-len('.act')] + '.rd') == 100 * RECORD_SIZE
+    writer.close()
+
+
+def test_fsync_after_every_flush(queue_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(client.os, 'fsync', lambda fd: synced.append(fd))
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, flush_records=2, fsync=True, rotate_timer=False)
+    save(writer, 4)
+    assert len(synced) == 2
+    writer.close()
+    assert len(synced) == 3  # file is synced before it is renamed to .rd
+
+
+def test_rotate_timer_closes_idle_file(queue_path):
+    writer = BayEOSWriter(queue_path, max_time=0.2)
+    save(writer, 1)
+    deadline = time() + 2
+    while not [f for f in os.listdir(queue_path) if f.endswith('.rd')] and time() < deadline:
+        sleep(0.02)
+    assert [f for f in os.listdir(queue_path) if f.endswith('.rd')]
+    writer.close()
+
+
+def test_writers_share_one_timer_thread(tmp_path):
+    threads = threading.active_count()
+    writers = [BayEOSWriter(str(tmp_path / str(i)), max_time=0.2, flush_records=0, flush_time=0.1)
+               for i in range(20)]
+    for writer in writers:
+        save(writer, 1)
+    assert threading.active_count() <= threads + 1
+    deadline = time() + 2
+    while not all(writer.current_records == 0 for writer in writers) and time() < deadline:
+        sleep(0.02)
+    assert [len(os.listdir(str(tmp_path / str(i)))) for i in range(20)] == [2] * 20  # .rd and new .act
+    for writer in writers:
+        writer.close()
+
+
+def test_client_passes_options_on():
+    gateway_client = BayEOSGatewayClient(['Device'], {'sender': 'test', 'flush_records': 10, 'workers': 4})
+    gateway_client.name = 'Device'
+    get_options = gateway_client._BayEOSGatewayClient__get_options
+    assert get_options(WRITER_OPTIONS)['flush_records'] == 10
+    assert get_options(SENDER_OPTIONS)['workers'] == 4
+    assert get_options(SENDER_OPTIONS)['max_post_frames'] == client.DEFAULTS['max_post_frames']
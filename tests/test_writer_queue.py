@@ -0,0 +1,65 @@
+"""Background writer thread and its overflow policies."""
+
+import glob
+import os
+from threading import Thread
+
+from bayeosgatewayclient import BayEOSWriter, QueueFile
+
+
+def read_files(path):
+    """@return list of (timestamps, footer) per queue file in the order of the file names"""
+    res = []
+    for file_name in sorted(glob.glob(os.path.join(path, '*.rd'))):
+        with QueueFile(file_name) as queue_file:
+            res.append(([timestamp for timestamp, frame in queue_file], queue_file.footer()))
+    return res
+
+
+def test_spill_keeps_time_order(queue_path):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, file_format=2, queue_size=4, overflow='spill',
+                          rotate_timer=False)
+    with writer.lock:  # the writer thread cannot write, the queue fills up and the saving thread spills
+        for i in range(10):
+            writer.save([i], value_type=0x44, timestamp=1e9 + i)
+        assert writer.stats()['spilled'] > 0
+    writer.close()
+    (timestamps, footer), = read_files(queue_path)
+    assert timestamps == [1e9 + i for i in range(10)]
+    assert (footer['frames'], footer['first'], footer['last']) == (10, 1e9, 1e9 + 9)
+
+
+def test_flush_survives_write_error(queue_path, monkeypatch):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, queue_size=4, rotate_timer=False)
+    write_records = writer._BayEOSWriter__write_records
+    calls = []
+
+    def fail_once(records):
+        calls.append(len(records))
+        if len(calls) == 1:
+            raise RuntimeError('disk on fire')
+        write_records(records)
+
+    monkeypatch.setattr(writer, '_BayEOSWriter__write_records', fail_once)
+    writer.save([1], value_type=0x44, timestamp=1e9)
+    flush = Thread(target=writer.flush)
+    flush.start()
+    flush.join(5)
+    assert not flush.is_alive()
+    writer.save([2], value_type=0x44, timestamp=1e9 + 1)
+    writer.close()
+    assert [timestamps for timestamps, footer in read_files(queue_path) if timestamps] == [[1e9 + 1]]
+
+
+def test_flush_writes_queue_of_dead_writer_thread(queue_path):
+    writer = BayEOSWriter(queue_path, max_chunk=10 ** 6, queue_size=4, rotate_timer=False)
+    writer.close()  # stops the writer thread, records are still accepted into the queue
+    writer._BayEOSWriter__closed = False
+    writer._BayEOSWriter__start_new_file()
+    writer.save([1], value_type=0x44, timestamp=1e9)
+    flush = Thread(target=writer.flush)
+    flush.start()
+    flush.join(5)
+    assert not flush.is_alive()
+    writer.close()
+    assert [timestamps for timestamps, footer in read_files(queue_path) if timestamps] == [[1e9]]